@@ -6,31 +6,29 @@
 脚本会：
 1. 自动识别并拆分多个订阅区块；
 2. 针对每个区块，提取所有 HTTP/HTTPS 订阅链接；
-3. 依次下载订阅内容（优先使用 wget，失败后使用 requests）；
+3. 多个区块并发处理，共用全局下载 / 测速并发额度；同一链接只下载一次、同一节点只测速一次；
 4. V2.自动识别 YAML 直接解析、再明文判定解析、后 Base64 解码节点解析（vmess、vless、ssr、ss、trojan、hysteria等）；
 5. 合并去重所有节点，同时支持节点测速（通过纯 Python socket）筛选可用节点；
 6. 智能为所有节点添加符合规则的区域标识和国旗 Emoji，并重命名；
 7. 按地区优先级及测速结果排序节点；
-8. 为每个区块生成独立的 Clash 配置 YAML 文件，文件保存在 output_yaml 目录中。
+8. 为每个区块生成独立的 Clash 配置 YAML 文件（区块处理完立即写出），文件保存在 output_yaml 目录中。
 使用说明：
 - 在 URL.TXT 中添加订阅，使用“# 区块名称:”格式划分多个区块，每块下方为相关订阅链接列表
 - 运行脚本，即可在 output_yaml 目录中得到分块生成的 YAML 配置文件
 """
 import os
 import re
-import yaml
 import base64
-import json
-import socket
-import shutil
-import hashlib
-import subprocess
-import requests
 import concurrent.futures
-import time
+import threading
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict
-from urllib.parse import urlparse, parse_qs, unquote
+from nodelib import filters, health, log, parallel, parse_cache, protocols, sniff, sub_cache, yaml_io, yaml_stream
+from nodelib.downloader import Downloader, build_chain
+from nodelib.fingerprint import NodeIndex
+from nodelib.model import Proxy, to_clash_list
+from nodelib.probe import EndpointProber, endpoint_key
+from nodelib.stream import MODE_BUFFER, MODE_LINES, SubscriptionSink, decode_base64, iter_lines
 
 # ========== 基础配置 ==========
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__)) # 获取当前脚本文件所在的目录的绝对路径
@@ -41,7 +39,12 @@ os.makedirs(OUTPUT_DIR, exist_ok=True) # 创建输出目录，如果目录已存
 # ========== 测速配置 ========== # 以下是关于速度测试的配置项
 ENABLE_SPEED_TEST = True # 是否启用速度测试，设置为True表示启用
 SOCKET_TIMEOUT = 10 # 超时时间（秒）
-MAX_TEST_WORKERS = 256 # 最大测试工作线程数，表示同时进行速度测试的最大并发连接数
+MAX_TEST_WORKERS = 256 # 最大测试工作线程数，表示同时进行速度测试的最大并发连接数（所有区块共用）
+
+# ========== 下载配置 ==========
+MAX_DOWNLOAD_WORKERS = 16 # 同时下载的订阅数（所有区块共用）
+MAX_BLOCK_WORKERS = 4 # 同时处理的区块数
+DOWNLOADER = Downloader(build_chain('Clash', verify=True), timeout=30)  # 订阅下载策略链（进程内，替代 wget 子进程）
 
 # ========== 区域映射与规则（合并版） ==========
 REGION_PRIORITY = ['香港', '日本', '新加坡', '美国', '台湾', '韩国', '德国', '英国', '加拿大', '澳大利亚']
@@ -188,420 +191,160 @@ def safe_b64decode(data):
     return base64.urlsafe_b64decode(data)
 
 # ----- 下载相关 -----
-def attempt_download_using_wget(url):
-    print(f"  ⬇️ wget 下载: {url[:80]}")
-    if not shutil.which("wget"):
-        print("  ✗ 未安装 wget")
-        return None
-    try:
-        proc = subprocess.run(
-            ["wget", "-O", "-", "--timeout=30", "--header=User-Agent: Clash", url],
-            capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore'
-        )
-        return proc.stdout if proc.stdout else None
-    except subprocess.CalledProcessError as e:
-        print(f"  ✗ wget 失败: {e.stderr.strip()}")
-        return None
-
-def attempt_download_using_requests(url):
-    print(f"  ⬇️ requests 下载: {url[:80]}")
-    try:
-        headers = {'User-Agent': 'Clash'}
-        r = requests.get(url, headers=headers, timeout=30)
-        r.raise_for_status()
-        r.encoding = r.apparent_encoding or 'utf-8'
-        return r.text
-    except Exception as e:
-        print(f"  ✗ requests 失败: {e}")
-        return None
+def stream_and_parse(url, body):
+    """逐块读取订阅：明文 / Base64 边收边解析，YAML 收完后走原解析流程"""
+    cache = sub_cache.get_cache()
+    if body.from_cache:
+        log.count('download', '304 未变化')
+        log.debug("  ♻️ 订阅未变化 (304)，使用本地缓存", stage='download', url=url)
+        # 内容与上次完全一致时直接复用上次的解析结果
+        if cache is not None:
+            cached_nodes = cache.get_nodes(url, body.digest)
+            if cached_nodes is not None:
+                log.count('download', '复用解析结果')
+                log.debug(f"  ♻️ 内容未变化，复用上次解析结果: {len(cached_nodes)} 个节点", stage='download', url=url)
+                return cached_nodes
+    sink = SubscriptionSink(parse_plain_node_line, cache=parse_cache.get_cache())
+    for chunk in body:
+        sink.feed(chunk)
+        if sink.rejected:
+            break
+    sink.close()
+    if sink.rejected:
+        log.count('download', 'HTML 页面')
+        log.debug("  - 返回的是 HTML 页面（疑似错误页 / 验证页），跳过", stage='download', url=url)
+        proxies = []
+    elif sink.mode == MODE_BUFFER:
+        proxies = parse_subscription_content(sink.text or '', kind=sink.kind)
+    else:
+        label = '明文协议' if sink.mode == MODE_LINES else 'Base64 解码'
+        report_parse_counts(label, sink.success, sink.failure)
+        proxies = sink.proxies
+        if not proxies:
+            log.count('download', '无有效节点')
+            log.debug("  - 内容非 Base64，且未匹配到明文协议节点" if sink.mode == MODE_LINES else "  - Base64 解码无效节点",
+                      stage='download', url=url)
+    if proxies and cache is not None and body.digest:
+        cache.put_nodes(url, body.digest, proxies)
+    return proxies
 
 # ----- 新增函数：解析明文协议节点 -----
-def parse_plain_nodes_from_text(text):
-    proxies = []
-    success_count = defaultdict(int)
-    failure_count = defaultdict(int)
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        proxy = None
-        proto = None
-        if line.startswith('vmess://'):
-            proto = 'vmess'
-            proxy = parse_vmess_node(line)
-        elif line.startswith('vless://'):
-            proto = 'vless'
-            proxy = parse_vless_node(line)
-        elif line.startswith('ssr://'):
-            proto = 'ssr'
-            proxy = parse_ssr_node(line)
-        elif line.startswith('ss://'):
-            proto = 'ss'
-            proxy = parse_ss_node(line)
-        elif line.startswith('trojan://'):
-            proto = 'trojan'
-            proxy = parse_trojan_node(line)
-        elif line.startswith('hysteria://'):
-            proto = 'hysteria'
-            proxy = parse_hysteria_node(line)
-        elif line.startswith('hysteria2://'):
-            proto = 'hysteria2'
-            proxy = parse_hysteria2_node(line)
-        else:
-            continue
-
-        if proxy:
-            proxies.append(proxy)
-            success_count[proto] += 1
-        else:
-            failure_count[proto] += 1
+# 节点链接的解析 / 编码统一在 nodelib.protocols，按协议头查表分发
+parse_plain_node_line = protocols.parse_line
 
+def report_parse_counts(label, success_count, failure_count):
+    """各协议解析成功 / 失败数累加到 parse 阶段汇总，逐个订阅的明细只在 DEBUG 时输出"""
     for proto, count in success_count.items():
-        print(f"  - 明文协议解析完成，{proto} 节点成功数：{count}")
+        log.count('parse', f"{proto} 成功", count)
+        log.debug(f"  - {label}解析完成，{proto} 节点成功数：{count}", stage='parse', proto=proto, success=count)
     for proto, count in failure_count.items():
-        print(f"  - 明文协议解析失败，{proto} 节点失败数：{count}")
+        log.count('parse', f"{proto} 失败", count)
+        log.debug(f"  - {label}解析失败，{proto} 节点失败数：{count}", stage='parse', proto=proto, failure=count)
 
+def parse_plain_nodes_from_text(text):
+    proxies, success_count, failure_count = parallel.parse_lines(text.splitlines(), cache=parse_cache.get_cache())
+    report_parse_counts('明文协议', success_count, failure_count)
     return proxies
 
 # ----- 修改 download_subscription 函数 -----
 def download_subscription(url):
-    content = attempt_download_using_wget(url)
-    if content is None:
-        content = attempt_download_using_requests(url)
-    if content is None:
+    """进程内多策略流式下载（直连 → 关闭证书校验 → 瞬时错误重试 → 备用 UA），带本地条件请求缓存"""
+    tracker = health.get_tracker()
+    action, probe_timeout = tracker.check(url)
+    if action == health.ACTION_SKIP:
+        log.count('download', '退避跳过')
+        log.debug(f"  ⏭️ 近期连续失败，退避期内跳过: {url[:80]}", stage='download', url=url)
+        return []
+    if action == health.ACTION_PROBE:
+        log.count('download', '短超时探测')
+        log.debug(f"  🩺 近期失败过，短超时({probe_timeout:.0f}s)探测: {url[:80]}", stage='download', url=url)
+    else:
+        log.debug(f"  ⬇️ 下载: {url[:80]}", stage='download', url=url)
+    result = DOWNLOADER.fetch_stream(url, lambda body: stream_and_parse(url, body), timeout=probe_timeout)
+    if result.content is None:
+        log.count('download', '下载失败')
+        log.debug(f"  ✗ 下载失败 (已尝试 {' → '.join(result.tried)}): {result.error}",
+                  stage='download', url=url, kind=result.kind)
+        tracker.record_failure(url, result.kind)
+        return []
+    if result.strategy != 'direct':
+        log.count('download', f"兜底 {result.strategy}")
+        log.debug(f"  ↪️ 兜底策略 {result.strategy} 下载成功", stage='download', url=url)
+    if result.content:
+        tracker.record_success(url)
+    else:
+        tracker.record_empty(url)  # 下载成功但没有节点（或全被筛选规则丢掉）：不退避
+    return result.content
+
+def parse_subscription_content(content, kind=None):
+    # 先嗅探格式，直接交给对应解析器（明文 / Base64 内容不必先跑一遍 YAML 解析）
+    kind = kind or sniff.sniff_text(content).kind
+    if kind == sniff.KIND_HTML:
+        log.count('download', 'HTML 页面')
+        log.debug("  - 返回的是 HTML 页面（疑似错误页 / 验证页），跳过", stage='download')
         return []
 
     # 先尝试yaml格式直接解析
-    proxies = parse_proxies_from_content(content)
-    if proxies:
-        return proxies
+    if kind in (sniff.KIND_CLASH_YAML, sniff.KIND_JSON, sniff.KIND_UNKNOWN):
+        proxies = parse_proxies_from_content(content)
+        if proxies:
+            return proxies
 
     # 尝试从明文协议链接中提取节点
-    proxies = parse_plain_nodes_from_text(content)
-    if proxies:
-        return proxies
+    if kind != sniff.KIND_BASE64:
+        proxies = parse_plain_nodes_from_text(content)
+        if proxies:
+            return proxies
 
     # 再尝试base64编码解码并解析
-    if is_base64(content):
-        proxies = decode_base64_and_parse(content)
+    # Base64 判定与解码一次完成，解码结果直接按字节切行解析
+    decoded = decode_base64(content)
+    if decoded is not None:
+        proxies = decode_base64_and_parse(content, decoded)
         if proxies:
             return proxies
-        print("  - Base64 解码无效节点")
+        log.debug("  - Base64 解码无效节点", stage='download')
     else:
-        print("  - 内容非 Base64，且未匹配到明文协议节点")
+        log.debug("  - 内容非 Base64，且未匹配到明文协议节点", stage='download')
+    log.count('download', '无有效节点')
 
     return []
 
 # ----- 解析相关 -----
 def parse_proxies_from_content(content):
+    # 只构造顶层 proxies 列表里的节点，rules / proxy-groups 等不建对象
     try:
-        data = yaml.safe_load(content)
-        if isinstance(data, dict):
-            proxies = data.get('proxies', [])
-            if isinstance(proxies, list):
-                return proxies
-        elif isinstance(data, list):
-            return data
+        proxies = yaml_stream.load_proxies(content, spec=filters.active())
+        if proxies is not None:
+            return proxies
     except Exception:
         pass
     return []
 
-def is_base64(text):
-    try:
-        s = ''.join(text.split())
-        if not s or len(s) % 4 != 0:
-            return False
-        if not re.match(r'^[A-Za-z0-9+/=]+$', s):
-            return False
-        base64.b64decode(s, validate=True)
-        return True
-    except Exception:
-        return False
 
-def decode_base64_and_parse(content):
+def decode_base64_and_parse(content, decoded=None):
+    """decoded 为已经解码好的字节（decode_base64 的结果）时不再重复解码；按字节切行，逐行转成 str。"""
     try:
-        decoded = base64.b64decode(''.join(content.split())).decode('utf-8', errors='ignore')
-        proxies = []
-        success_count = defaultdict(int)
-        failure_count = defaultdict(int)
-        for line in decoded.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            proxy = None
-            proto = None
-            if line.startswith('vmess://'):
-                proto = 'vmess'
-                proxy = parse_vmess_node(line)
-            elif line.startswith('vless://'):
-                proto = 'vless'
-                proxy = parse_vless_node(line)
-            elif line.startswith('ssr://'):
-                proto = 'ssr'
-                proxy = parse_ssr_node(line)
-            elif line.startswith('ss://'):
-                proto = 'ss'
-                proxy = parse_ss_node(line)
-            elif line.startswith('trojan://'):
-                proto = 'trojan'
-                proxy = parse_trojan_node(line)
-            elif line.startswith('hysteria://'):
-                proto = 'hysteria'
-                proxy = parse_hysteria_node(line)
-            elif line.startswith('hysteria2://'):
-                proto = 'hysteria2'
-                proxy = parse_hysteria2_node(line)
-            else:
-                continue
-
-            if proxy:
-                proxies.append(proxy)
-                success_count[proto] += 1
-            else:
-                failure_count[proto] += 1
-
-        for proto, count in success_count.items():
-            print(f"  - Base64 解码解析完成，{proto} 节点成功数：{count}")
-        for proto, count in failure_count.items():
-            print(f"  - Base64 解码解析失败，{proto} 节点失败数：{count}")
-
+        if decoded is None:
+            decoded = base64.b64decode(''.join(content.split()))
+        proxies, success_count, failure_count = parallel.parse_lines(iter_lines(decoded), cache=parse_cache.get_cache())
+        report_parse_counts('Base64 解码', success_count, failure_count)
         return proxies
     except Exception as e:
-        print(f"  - Base64 解码解析异常: {e}")
+        log.count('download', 'Base64 异常')
+        log.debug(f"  - Base64 解码解析异常: {e}", stage='parse')
         return []
 
 
-# ----- 协议解析实现 -----
-
-
-def parse_vmess_node(line):
-    try:
-        content_b64 = line[8:]
-        decoded = base64.b64decode(content_b64 + '=' * (-len(content_b64) % 4)).decode('utf-8', errors='ignore')
-        info = json.loads(decoded)
-        node = {
-            'name': info.get('ps', 'vmess_node'),
-            'type': 'vmess',
-            'server': info.get('add') or info.get('host'),
-            'port': int(info.get('port', 0)),
-            'uuid': info.get('id') or info.get('uuid'),
-            'alterId': int(info.get('aid', info.get('alterId', 0))) if str(info.get('aid', '')).isdigit() else 0,
-            'cipher': info.get('scy', 'auto'),
-            'network': info.get('net', 'tcp'),
-            'tls': True if info.get('tls', '').lower() == 'tls' else False,
-            'skip-cert-verify': info.get('allowInsecure', False),
-            'ws-opts': {},
-        }
-        if node['network'] == 'ws':
-            ws_opts = {
-                'path': info.get('path', ''),
-                'headers': {'Host': info.get('host', '')} if info.get('host') else {},
-            }
-            node['ws-opts'] = ws_opts
-        return node
-    except Exception:
-        return None
-
-def parse_vless_node(line):
-    try:
-        line = line.strip()
-        parsed = urlparse(line)
-        if parsed.scheme != 'vless':
-            return None
-        params = parse_qs(parsed.query)
-        node = {
-            'name': unquote(parsed.fragment) if parsed.fragment else f"vless_{parsed.hostname}",
-            'type': 'vless',
-            'server': parsed.hostname,
-            'port': int(parsed.port or 0),
-            'uuid': parsed.username,
-            'encryption': 'none',
-            'flow': params.get('flow', [''])[0],
-            'tls': (parsed.query.lower().find('tls') != -1) or ('tls' in params),
-            'skip-cert-verify': params.get('allowInsecure', ['false'])[0].lower() == 'true',
-            'network': params.get('type', ['tcp'])[0],
-            'host': params.get('host', [''])[0],
-            'path': params.get('path', [''])[0],
-            'sni': params.get('sni', [''])[0],
-        }
-        if node['network'] == 'ws':
-            node['ws-opts'] = {
-                'path': node['path'],
-                'headers': {'Host': node['host']} if node['host'] else {}
-            }
-        return node
-    except Exception:
-        return None
-
-def parse_ssr_node(line):
-    try:
-        ssr_b64 = line[6:]
-        ssr_decoded = base64.urlsafe_b64decode(ssr_b64 + '=' * (-len(ssr_b64) % 4)).decode('utf-8', errors='ignore')
-        parts = ssr_decoded.split('/?')
-        main = parts[0]
-        params_str = parts[1] if len(parts) > 1 else ''
-        
-        server, port, protocol, method, obfs, password_b64 = main.split(':', 5)
-        password = base64.urlsafe_b64decode(password_b64 + '=' * (-len(password_b64) % 4)).decode('utf-8', errors='ignore')
-        
-        params = {}
-        for param in params_str.split('&'):
-            if '=' in param:
-                k, v = param.split('=', 1)
-                params[k] = v
-
-        remark = unquote(params.get('remarks', ''))
-        node = {
-            'name': remark or f"ssr_{server}",
-            'type': 'ssr',
-            'server': server,
-            'port': int(port),
-            'cipher': method,
-            'protocol': protocol,
-            'obfs': obfs,
-            'password': password,
-            'udp': params.get('udp', 'false').lower() == 'true'
-        }
-        return node
-    except Exception:
-        return None
-
-def parse_ss_node(line):
-    try:
-        line = line.strip()
-        if not line.startswith('ss://'):
-            return None
-        content = line[5:]
-        if '@' in content:
-            parsed = urlparse('ss://' + content)
-            user_pass = parsed.netloc.split('@')[0]
-            method, password = user_pass.split(':', 1)
-            server = parsed.hostname
-            port = parsed.port
-            name = unquote(parsed.fragment) if parsed.fragment else f"ss_{server}"
-            node = {
-                'name': name,
-                'type': 'ss',
-                'server': server,
-                'port': port,
-                'cipher': method,
-                'password': password,
-                'udp': True,
-            }
-            return node
-        else:
-            ss_b64 = content.split('#')[0]
-            remark = ''
-            if '#' in content:
-                remark = unquote(content.split('#')[1])
-            decoded = base64.urlsafe_b64decode(ss_b64 + '=' * (-len(ss_b64) % 4)).decode('utf-8', errors='ignore')
-            method_password, server_port = decoded.split('@')
-            method, password = method_password.split(':')
-            server, port = server_port.split(':')
-            node = {
-                'name': remark or f"ss_{server}",
-                'type': 'ss',
-                'server': server,
-                'port': int(port),
-                'cipher': method,
-                'password': password,
-                'udp': True,
-            }
-            return node
-    except Exception:
-        return None
-
-def parse_trojan_node(line):
-    try:
-        parsed = urlparse(line)
-        if parsed.scheme != 'trojan':
-            return None
-        password = parsed.username or ''
-        server = parsed.hostname or ''
-        port = parsed.port or 0
-        params = parse_qs(parsed.query)
-        node = {
-            'name': unquote(parsed.fragment) if parsed.fragment else f"trojan_{server}",
-            'type': 'trojan',
-            'server': server,
-            'port': port,
-            'password': password,
-            'sni': params.get('sni', [''])[0],
-            'skip-cert-verify': params.get('allowInsecure', ['false'])[0].lower() == 'true',
-            'udp': True,
-            'alpn': params.get('alpn', []),
-            'tls': True,
-        }
-        return node
-    except Exception:
-        return None
-
-def parse_hysteria_node(line):
-    try:
-        parsed = urlparse(line)
-        if parsed.scheme != 'hysteria':
-            return None
-        params = parse_qs(parsed.query)
-        node = {
-            'name': unquote(parsed.fragment) or f"hysteria_{parsed.hostname}",
-            'type': 'hysteria',
-            'server': parsed.hostname,
-            'port': int(parsed.port or 0),
-            'auth': params.get('auth', [''])[0],
-            'protocol': params.get('protocol', ['udp'])[0],
-            'insecure': params.get('insecure', ['false'])[0].lower() == 'true',
-            'obfs': params.get('obfs', [''])[0],
-            'udp': True,
-        }
-        return node
-    except Exception:
-        return None
-
-def parse_hysteria2_node(line):
-    try:
-        parsed = urlparse(line)
-        if parsed.scheme != 'hysteria2':
-            return None
-        params = parse_qs(parsed.query)
-        node = {
-            'name': unquote(parsed.fragment) or f"hysteria2_{parsed.hostname}",
-            'type': 'hysteria2',
-            'server': parsed.hostname,
-            'port': int(parsed.port or 0),
-            'auth': params.get('auth', [''])[0],
-            'protocol': params.get('protocol', ['udp'])[0],
-            'insecure': params.get('insecure', ['false'])[0].lower() == 'true',
-            'obfs': params.get('obfs', [''])[0],
-            'udp': True,
-        }
-        return node
-    except Exception:
-        return None
-        
-        
 # ----- 合并去重 -----
-def get_proxy_key(proxy):
-    try:
-        key = f"{proxy.get('server', '')}:{proxy.get('port', 0)}|"
-        if 'uuid' in proxy:
-            key += proxy['uuid']
-        elif 'password' in proxy:
-            key += proxy['password']
-        else:
-            key += proxy.get('name', '')
-        return hashlib.md5(key.encode('utf-8')).hexdigest()
-    except:
-        return None
-
+# 去重 key 统一用 nodelib.fingerprint 的节点指纹（与其它脚本一致）
 def merge_and_deduplicate_proxies(proxies):
-    unique = {}
+    index = NodeIndex()
     for proxy in proxies:
-        if not isinstance(proxy, dict) or 'name' not in proxy:
+        if not isinstance(proxy, (dict, Proxy)) or 'name' not in proxy:
             continue
-        k = get_proxy_key(proxy)
-        if k and k not in unique:
-            unique[k] = proxy
-    return list(unique.values())
+        index.add(proxy)
+    return index.nodes()
 
 # ----- 重点函数：重命名排序 -----
 def process_and_rename_proxies(proxies):
@@ -667,39 +410,64 @@ def process_and_rename_proxies(proxies):
     return final_proxies
 
 # ----- 测速 -----
-def test_single_proxy_socket(proxy):
-    server = proxy.get('server')
-    port = proxy.get('port')
-    if not server or not port:
-        return None
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(SOCKET_TIMEOUT)
-        start = time.time()
-        sock.connect((str(server), int(port)))
-        end = time.time()
-        proxy['delay'] = int((end - start) * 1000)
-        return proxy
-    except Exception:
-        return None
-    finally:
-        if 'sock' in locals():
-            sock.close()
+class SharedWork:
+    """
+    所有区块共用的下载 / 测速资源：
+    - 全局下载线程池、测速线程池，区块再多并发也不会超过 MAX_DOWNLOAD_WORKERS / MAX_TEST_WORKERS
+    - 同一链接只下载一次、同一 server:port 只测速一次，结果在区块间复用；
+      不同域名解析到同一 IP:端口 的也只连一次（nodelib.probe）
+    """
+    def __init__(self):
+        self.download_pool = concurrent.futures.ThreadPoolExecutor(MAX_DOWNLOAD_WORKERS, thread_name_prefix='download')
+        self.probe_pool = concurrent.futures.ThreadPoolExecutor(MAX_TEST_WORKERS, thread_name_prefix='probe')
+        self._lock = threading.Lock()
+        self._downloads = {}
+        self._probes = {}
+        self.prober = EndpointProber(timeout=SOCKET_TIMEOUT)
+        self.probe_hits = 0
+        self.download_hits = 0
+
+    def download(self, url):
+        with self._lock:
+            future = self._downloads.get(url)
+            if future is None:
+                future = self._downloads[url] = self.download_pool.submit(download_subscription, url)
+            else:
+                self.download_hits += 1
+        return future
+
+    def probe(self, proxy):
+        key = endpoint_key(proxy)
+        with self._lock:
+            future = self._probes.get(key)
+            if future is None:
+                if key is None:
+                    future = concurrent.futures.Future()
+                    future.set_result(None)
+                else:
+                    future = self.probe_pool.submit(self.prober.probe, *key)
+                self._probes[key] = future
+            else:
+                self.probe_hits += 1
+        return future
+
+    def shutdown(self):
+        self.download_pool.shutdown(wait=True)
+        self.probe_pool.shutdown(wait=True)
 
-def speed_test_proxies(proxies):
-    print(f"开始测速: 共 {len(proxies)} 个节点")
+def speed_test_proxies(proxies, work, title=''):
+    print(f"{title} 开始测速: 共 {len(proxies)} 个节点")
+    futures = [(p, work.probe(p)) for p in proxies]
     fast_proxies = []
-    total = len(proxies)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_TEST_WORKERS) as executor:
-        futures = {executor.submit(test_single_proxy_socket, p): p for p in proxies}
-        for i, f in enumerate(concurrent.futures.as_completed(futures), 1):
-            result = f.result()
-            if i % 100 == 0 or i == total:
-                print(f"\r测速进度: {i}/{total}", end='', flush=True)
-            if result:
-                fast_proxies.append(result)
-    print()
-    print(f"测速完成: 有效节点 {len(fast_proxies)}")
+    total = len(futures)
+    for i, (proxy, future) in enumerate(futures, 1):
+        delay = future.result()
+        if delay is not None:
+            proxy.tcp_delay = delay
+            fast_proxies.append(proxy)
+        if i % 500 == 0 or i == total:
+            print(f"{title} 测速进度: {i}/{total}")
+    print(f"{title} 测速完成: 有效节点 {len(fast_proxies)}")
     return fast_proxies
 
 # ----- 配置文件生成 -----
@@ -707,7 +475,10 @@ def generate_config(proxies):
     if not proxies:
         return None
     proxy_names = [p['name'] for p in proxies]
-    clean_proxies = [{k: v for k, v in p.items() if k not in ['region', 'delay']} for p in proxies]
+    clean_proxies = to_clash_list(proxies, meta=False)  # 测速延迟不写进配置
+    for p in clean_proxies:
+        p.pop('region', None)
+        p.pop('delay', None)
     return {
         'mixed-port': 7890,
         'allow-lan': True,
@@ -763,7 +534,7 @@ def extract_urls_from_lines(lines):
         urls.extend(url_pattern.findall(line))
     return urls
 
-def process_block_to_yaml(block):
+def process_block_to_yaml(block, work):
     title = block['title']
     lines = block['lines']
     urls = extract_urls_from_lines(lines)
@@ -771,22 +542,24 @@ def process_block_to_yaml(block):
         print(f"{title} 区块无有效订阅，跳过。")
         return
     print(f"\n处理区块：{title} | {len(urls)} 个订阅链接")
+    # 同一链接可能出现在多个区块：下载结果共用，各区块建自己的节点记录再改名/测速
+    futures = [work.download(url) for url in urls]
     all_proxies = []
-    for url in urls:
-        all_proxies.extend(download_subscription(url))
+    for future in futures:
+        all_proxies.extend(Proxy.from_dict(p) for p in future.result() if isinstance(p, dict))
     if not all_proxies:
         print(f"{title} 订阅下载失败或无节点，跳过。")
         return
     unique_proxies = merge_and_deduplicate_proxies(all_proxies)
     if ENABLE_SPEED_TEST:
-        tested_proxies = speed_test_proxies(unique_proxies)
+        tested_proxies = speed_test_proxies(unique_proxies, work, title)
         if not tested_proxies:
             print(f"{title} 测速无可用节点，使用所有节点。")
             tested_proxies = unique_proxies
     else:
         tested_proxies = unique_proxies
     region_order = {r: i for i, r in enumerate(REGION_PRIORITY)}
-    tested_proxies.sort(key=lambda p: (region_order.get(p.get('region', '未知'), 999), p.get('delay', 9999)))
+    tested_proxies.sort(key=lambda p: (region_order.get(p.get('region', '未知'), 999), p.get('tcp_delay', 9999)))
     final_proxies = process_and_rename_proxies(tested_proxies)
     config = generate_config(final_proxies)
     if not config:
@@ -795,7 +568,7 @@ def process_block_to_yaml(block):
     filename = sanitize_filename(title) + ".yaml"
     filepath = os.path.join(OUTPUT_DIR, filename)
     with open(filepath, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, allow_unicode=True, sort_keys=False, indent=2)
+        yaml_io.dump(config, f, allow_unicode=True, sort_keys=False, indent=2)
     print(f"{title} 配置已生成：{filepath}，节点数：{len(final_proxies)}")
 
 def main():
@@ -807,8 +580,25 @@ def main():
     if not blocks:
         print("未检测到有效区块，退出。")
         return
-    for block in blocks:
-        process_block_to_yaml(block)
+    parallel.start()  # 大订阅的解析进程要在下载线程启动前 fork 出来
+    work = SharedWork()
+    with concurrent.futures.ThreadPoolExecutor(MAX_BLOCK_WORKERS, thread_name_prefix='block') as block_pool:
+        futures = {block_pool.submit(process_block_to_yaml, block, work): block for block in blocks}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"{futures[future]['title']} 区块处理异常: {e}")
+    work.shutdown()
+    print(f"区块间复用：下载 {work.download_hits} 次，测速 {work.probe_hits} 次")
+    print(f"端点去重：{work.prober.describe()}")
+    sub_cache.save_cache()
+    parse_cache.save_cache()
+    health.save_tracker()
+    DOWNLOADER.print_stats()
+    log.summary('download', '订阅下载')
+    log.summary('parse', '订阅解析')
+    health.get_tracker().print_summary()
     print(f"\n全部区块处理完成，配置文件存放于：{OUTPUT_DIR}")
 
 if __name__ == "__main__":
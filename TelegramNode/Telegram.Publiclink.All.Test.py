@@ -17,17 +17,15 @@ import os
 import re
 import sys
 import base64
+import binascii
 import json
-import yaml
 import time
 import socket
-import hashlib
 import asyncio
 import shutil
 import subprocess
 import concurrent.futures
 import tempfile
-import requests
 import socket
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -35,11 +33,20 @@ import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="urllib3.connectionpool")
 # ============================================
 from concurrent.futures import as_completed
-from urllib.parse import urlparse, parse_qs, unquote
+from urllib.parse import urlparse, unquote
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 from telethon.sync import TelegramClient
 from telethon.sessions import StringSession
+from nodelib.fetcher import FetchEngine, LinkQueue
+from nodelib.deadline import SKIPPED, Deadline, gather_until, workers_for
+from nodelib import bloom, filters, health, log, http_client, parallel, parse_cache, protocols, sniff, store, sub_cache, yaml_io, yaml_stream
+from nodelib.downloader import Downloader, build_chain
+from nodelib.fingerprint import NodeIndex
+from nodelib.model import Proxy, to_clash_list
+from nodelib.names import NameAllocator
+from nodelib.probe import EndpointProber, group_by_endpoint
+from nodelib.stream import MODE_BUFFER, MODE_LINES, SubscriptionSink, decode_base64, iter_lines
 BJ_TZ = timezone(timedelta(hours=8)) 
 last_message_id_timestamps = {}
 
@@ -67,6 +74,7 @@ MAX_NODES_PER_FILE = {
 }
 
 WRITE_LAST_MESSAGE_IDS_IN_INTERMEDIATE = True  #  是否给中间文件写入 last_message_ids，tg信息id位置默认开启
+HISTORY_ALIVE_HOURS = 72  # 从节点库加载历史节点时，只取最近多少小时内测速存活过的（nodelib.store）
 
 
 # === 新增：测速策略开关（推荐保留这几个选项）===
@@ -88,9 +96,18 @@ if not DETAILED_SPEEDTEST_MODE:
 # TCP 和Clash 测速专属参数
 TCP_TIMEOUT = 5          # 单次 TCP 连接超时时间（秒），建议 3~5
 TCP_MAX_WORKERS = 256     # TCP 测速最大并发（可以比 Clash 高很多，非常快）
+SUSPECT_PROBE_TIMEOUT = TCP_TIMEOUT  # 近期失败过的节点（nodelib.bloom）复测时的 TCP 超时（秒），不能比正式测速短
+SUSPECT_PROBE_WORKERS = 32   # 复测并发：低优先级，不和正式测速抢连接
 TCP_MAX_DELAY = 1500       # TCP 延迟阈值，超过此值直接丢弃（ms）
 
 
+# 订阅下载并发参数
+FETCH_MAX_CONCURRENCY = 32  # 同时下载的订阅链接数
+FETCH_PER_HOST = 4          # 同一域名同时下载数，避免把同一个机场面板打爆
+LOG_PROGRESS_EVERY = 25     # 下载进度每完成多少个链接输出一行（逐个链接的进度在 LOG_LEVEL=DEBUG 时输出）
+SUB_DOWNLOADER = Downloader(build_chain(http_client.CLASH_UA, verify=False), timeout=30)  # 订阅下载策略链（进程内共用）
+
+
 # TCP 和Clash 日志环境变量专属参数
 def str_to_bool(s: str) -> bool:
     return s.strip().lower() in ('true', '1', 'yes')
@@ -124,6 +141,8 @@ ENABLE_BANDWIDTH_FILTER = os.getenv('ENABLE_BANDWIDTH_FILTER', 'true').lower() =
 MIN_BANDWIDTH_MB = float(os.getenv('MIN_BANDWIDTH_MB', '25'))  # 筛选测速宽度的速度。默认 25MB/s，可自由改
 
 # ==================== 国家匹配配置 ====================
+# 只保留 ALLOWED_REGIONS 里的地区（识别出地区后立即丢弃其它地区，不再改名、测速），默认关闭
+FILTER_ALLOWED_REGIONS = str_to_bool(os.getenv('FILTER_ALLOWED_REGIONS', 'false'))
 ALLOWED_REGIONS = {
     '香港', '台湾', '日本', '新加坡', '韩国', '马来西亚', '泰国',
     '印度', '菲律宾', '印度尼西亚', '越南', '美国', '加拿大',
@@ -1063,7 +1082,7 @@ def load_existing_proxies_and_state(file_path):
     try:
         if os.path.exists(file_path):
             with open(file_path, 'r', encoding='utf-8') as f:
-                loaded_yaml = yaml.safe_load(f)
+                loaded_yaml = yaml_io.safe_load(f)
             if isinstance(loaded_yaml, dict):
                 proxies = loaded_yaml.get('proxies', [])
                 if isinstance(proxies, list):
@@ -1092,6 +1111,61 @@ def load_existing_proxies_and_state(file_path):
         last_file_update_time = get_last_file_update_time_inner(file_path)
 
     return existing_proxies, last_message_ids, last_file_update_time
+
+def load_history(file_path):
+    """
+    加载历史节点和运行状态：优先读节点库（nodelib.store），只取最近 HISTORY_ALIVE_HOURS 小时内存活过的节点，
+    不再解析整份 YAML；节点库关闭或为空（首次运行 / actions 缓存丢失）时回退到 load_existing_proxies_and_state。
+    返回值同 load_existing_proxies_and_state。
+    """
+    node_store = store.get_store()
+    if node_store is not None:
+        # 注意：节点库（actions/cache 保存的 .cache/nodes.db）里有 last_message_ids 时以它为准，
+        # 提交在 git 里的 TCP.yaml 中的 last_message_ids 不再读取；两者不一致（如手动改了 TCP.yaml）时要清掉缓存
+        last_message_ids = node_store.get_state('last_message_ids')
+        if isinstance(last_message_ids, dict):
+            existing_proxies = node_store.load(alive_within=HISTORY_ALIVE_HOURS * 3600, order_by='tcp_delay',
+                                               limit=MAX_NODES_PER_FILE.get('TCP.yaml', 2000))
+            last_update_time = None
+            update_time = node_store.get_state('update_time')
+            if isinstance(update_time, str):
+                try:
+                    last_update_time = datetime.strptime(update_time, '%Y-%m-%d %H:%M:%S').replace(tzinfo=BJ_TZ)
+                except ValueError:
+                    pass
+            print(f"  - 从节点库加载历史节点（{HISTORY_ALIVE_HOURS} 小时内存活，库内共 {len(node_store)} 个）")
+            return existing_proxies, last_message_ids, last_update_time
+    existing_proxies, last_message_ids, last_update_time = load_existing_proxies_and_state(file_path)
+    if node_store is not None and existing_proxies:
+        node_store.upsert(existing_proxies)   # 首次使用节点库：把 YAML 里的历史节点导入
+    return existing_proxies, last_message_ids, last_update_time
+
+def record_node_results(proxies):
+    """测速 / 评分结果写入节点库（关闭时跳过）"""
+    node_store = store.get_store()
+    if node_store is not None and proxies:
+        node_store.record_results(proxies)
+
+# 停在失败阶段的节点（id(节点) -> 节点）：节点进入下一阶段后，前一阶段的失败就不算数
+_stage_failures = {}
+
+def full_timeout(deadline, preferred):
+    """结果出来时剩余时间仍不少于 preferred，说明之前每次调用都用的是完整超时（没有被截止时间收缩）"""
+    return deadline is None or deadline.remaining() >= preferred
+
+def note_stage_failures(tested, failed):
+    """一个测速阶段结束：进入本阶段的节点清掉之前阶段的失败记录，本阶段用完整超时仍失败的暂记下来"""
+    for proxy in tested:
+        _stage_failures.pop(id(proxy), None)
+    for proxy in failed:
+        _stage_failures[id(proxy)] = proxy
+
+def record_dead_nodes():
+    """全部测速结束后调用：最后进入的阶段也失败的节点记入失效节点过滤器（nodelib.bloom），之后的运行先复测再决定是否完整测速"""
+    dead_filter = bloom.get_filter()
+    if dead_filter is not None and _stage_failures:
+        dead_filter.add_all(_stage_failures.values())
+    _stage_failures.clear()
     
 # =============================================
 # 多匹配的 extract_valid_subscribe_links 函数
@@ -1172,23 +1246,28 @@ def extract_valid_subscribe_links(text, channel_id=None):
                     continue
             valid_links.append(url)
     
-    # 打印结果
+    # 逐条链接只在 DEBUG 时输出，默认只计数，抓取结束时汇总
     if valid_links:
-        for link in valid_links:
-            if channel_id:
-                print(f"🔗 [频道 {channel_id}] 提取有效链接: {link}")
-            else:
-                print(f"🔗 提取有效链接: {link}")
+        log.count('scrape', '提取链接', len(valid_links))
+        if log.DEBUG_ON:
+            for link in valid_links:
+                if channel_id:
+                    log.debug(f"🔗 [频道 {channel_id}] 提取有效链接: {link}", stage='scrape', channel=channel_id, link=link)
+                else:
+                    log.debug(f"🔗 提取有效链接: {link}", stage='scrape', link=link)
     
     return valid_links
    
 # ==========================
 # 修改 scrape_telegram_links 函数签名和逻辑
-async def scrape_telegram_links(last_message_ids=None):
+async def scrape_telegram_links(last_message_ids=None, deadline=None, link_queue=None):
     """
     从 Telegram 指定频道抓取带有订阅链接的消息。
     消息抓取范围始终是 (当前脚本执行时的北京时间 - TIME_WINDOW_HOURS) 到 (当前脚本执行时的北京时间)。
+    传入 deadline 时，到点后停止抓取剩余频道（其 last_message_id 不更新，下次运行继续）。
+    传入 link_queue（nodelib.fetcher.LinkQueue）时，每发现一个链接立即投递，下载端可以同时开始工作。
     """
+    publish = link_queue.publish if link_queue is not None else None
     if last_message_ids is None:
         last_message_ids = {}
     if not all([API_ID, API_HASH, STRING_SESSION, TELEGRAM_CHANNEL_IDS_STR]):
@@ -1233,11 +1312,14 @@ async def scrape_telegram_links(last_message_ids=None):
         batch_display = ', '.join(batch)
         print(f"\n📦 处理批次 {i//CHANNEL_BATCH_SIZE + 1}/{(len(TARGET_CHANNELS)-1)//CHANNEL_BATCH_SIZE + 1}: {batch_display}")
         
+        if deadline is not None and deadline.expired():
+            print(f"⏰ 抓取阶段时间预算用尽，剩余 {len(TARGET_CHANNELS) - i} 个频道留到下次运行")
+            break
         tasks = []
         for channel_id in batch:
-            tasks.append(process_channel(client, channel_id, last_message_ids, target_time_utc))
+            tasks.append(process_channel(client, channel_id, last_message_ids, target_time_utc, publish=publish))
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await gather_until(tasks, deadline)
         
         for idx, result in enumerate(results):
             channel_id = batch[idx]
@@ -1274,11 +1356,12 @@ async def scrape_telegram_links(last_message_ids=None):
         latest_bj = latest_message_time.astimezone(BJ_TZ)
         print(f"\n📍 实际消息时间范围 (北京时间): {earliest_bj.strftime('%Y-%m-%d %H:%M:%S')} ~ {latest_bj.strftime('%Y-%m-%d %H:%M:%S')}")
     
+    log.summary('scrape', '频道抓取')
     print(f"\n✅ 抓取完成, 共找到 {len(all_links)} 个不重复的有效链接。")
     return list(all_links), last_message_ids
     
-async def process_channel(client, channel_id, last_message_ids, target_time_utc):
-    """处理单个频道的辅助函数"""
+async def process_channel(client, channel_id, last_message_ids, target_time_utc, publish=None):
+    """处理单个频道的辅助函数；publish(link) 不为空时每提取到一个链接立即投递"""
     max_id_found = last_message_ids.get(channel_id, 0)
     channel_links = []
     earliest_time = None
@@ -1306,6 +1389,8 @@ async def process_channel(client, channel_id, last_message_ids, target_time_utc)
                 links = extract_valid_subscribe_links(message.text, channel_id=channel_id)
                 for link in links:
                     channel_links.append(link)
+                    if publish is not None:
+                        publish(link)
             if message.id > max_id_found:
                 max_id_found = message.id
     except Exception as e:
@@ -1316,36 +1401,6 @@ async def process_channel(client, channel_id, last_message_ids, target_time_utc)
     return channel_links, max_id_found, msg_time_range, messages_checked
     
 # --- 3合1下载 版本的下载 ---
-def download_subscription(url: str, timeout: int = 30) -> str | None:
-    """wget → curl → requests 三保险下载，带 Clash UA"""
-    # 1. wget 最快最稳
-    if shutil.which('wget'):
-        try:
-            cmd = [
-                'wget', '-qO-', '--timeout=30', '--tries=1',
-                '--user-agent=Clash/1.18.0', '--header=Accept: */*',
-                url
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-            if result.returncode == 0 and result.stdout.strip():
-                return result.stdout
-        except: pass
-    # 2. curl 备用
-    if shutil.which('curl'):
-        try:
-            cmd = ['curl', '-fsSL', '--max-time', '30', '-A', 'Clash/1.18.0', url]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-            if result.returncode == 0 and result.stdout.strip():
-                return result.stdout
-        except: pass
-    # 3. requests 兜底
-    try:
-        headers = {'User-Agent': 'Clash/1.18.0'}
-        r = requests.get(url, headers=headers, timeout=timeout, verify=False)
-        r.raise_for_status()
-        return r.text
-    except:
-        return None
 # --- 解析相关函数合入 ---
 def is_valid_base64(s: str) -> bool:
     """
@@ -1376,450 +1431,209 @@ def is_valid_base64(s: str) -> bool:
         # 如果解码过程中发生错误，则认为不是有效的Base64
         return False
 def parse_proxies_from_content(content):
+    # 只构造顶层 proxies 列表里的节点，rules / proxy-groups 等不建对象
     try:
-        data = yaml.safe_load(content)
-        if isinstance(data, dict):
-            proxies = data.get('proxies', [])
-            if isinstance(proxies, list):
-                return proxies
-        elif isinstance(data, list):
-            return data
+        proxies = yaml_stream.load_proxies(content, spec=filters.active())
+        if proxies is not None:
+            return proxies
     except Exception:
         pass
     return []
-def is_base64(text):
-    try:
-        s = ''.join(text.split())
-        if not s or len(s) % 4 != 0:
-            return False
-        if not re.match(r'^[A-Za-z0-9+/=]+$', s):
-            return False
-        base64.b64decode(s, validate=True)
-        return True
-    except Exception:
-        return False
-def parse_vmess_node(line):
-    try:
-        content_b64 = line[8:]
-        decoded = base64.b64decode(content_b64 + '=' * (-len(content_b64) % 4)).decode('utf-8', errors='ignore')
-        info = json.loads(decoded)
-        node = {
-            'name': info.get('ps', 'vmess_node'),
-            'type': 'vmess',
-            'server': info.get('add') or info.get('host'),
-            'port': int(info.get('port', 0)),
-            'uuid': info.get('id') or info.get('uuid'),
-            'alterId': int(info.get('aid', info.get('alterId', 0))) if str(info.get('aid', '')).isdigit() else 0,
-            'cipher': info.get('scy', 'auto'),
-            'network': info.get('net', 'tcp'),
-            'tls': True if info.get('tls', '').lower() == 'tls' else False,
-            'skip-cert-verify': info.get('allowInsecure', False),
-            'ws-opts': {},
-        }
-        if node['network'] == 'ws':
-            ws_opts = {
-                'path': info.get('path', ''),
-                'headers': {'Host': info.get('host', '')} if info.get('host') else {},
-            }
-            node['ws-opts'] = ws_opts
-        return node
-    except Exception:
-        return None
-        
-def parse_vless_node(line):
-    try:
-        parsed = urlparse(line.strip())
-        if parsed.scheme != 'vless':
-            return None
-        params = parse_qs(parsed.query)
-        node = {
-            'name': unquote(parsed.fragment) if parsed.fragment else f"vless_{parsed.hostname}",
-            'type': 'vless',
-            'server': parsed.hostname,
-            'port': int(parsed.port or 0),
-            'uuid': parsed.username,
-            'encryption': 'none',
-            'flow': params.get('flow', [''])[0],
-            'tls': (parsed.query.lower().find('tls') != -1) or ('tls' in params),
-            'skip-cert-verify': params.get('allowInsecure', ['false'])[0].lower() == 'true',
-            'network': params.get('type', ['tcp'])[0],
-            'host': params.get('host', [''])[0],
-            'path': params.get('path', [''])[0],
-            'sni': params.get('sni', [''])[0],
-        }
-        if node['network'] == 'ws':
-            node['ws-opts'] = {'path': node['path'], 'headers': {'Host': node['host']} if node['host'] else {}}
-        return node
-    except Exception:
-        return None
-def parse_ssr_node(line):
-    try:
-        ssr_b64 = line[6:]
-        ssr_decoded = base64.urlsafe_b64decode(ssr_b64 + '=' * (-len(ssr_b64) % 4)).decode('utf-8', errors='ignore')
-        parts = ssr_decoded.split('/?')
-        main = parts[0]
-        params_str = parts[1] if len(parts) > 1 else ''
-        server, port, protocol, method, obfs, password_b64 = main.split(':', 5)
-        password = base64.urlsafe_b64decode(password_b64 + '=' * (-len(password_b64) % 4)).decode('utf-8', errors='ignore')
-        params = {}
-        for param in params_str.split('&'):
-            if '=' in param:
-                k, v = param.split('=', 1)
-                params[k] = v
-        remark = unquote(params.get('remarks', ''))
-        node = {
-            'name': remark or f"ssr_{server}",
-            'type': 'ssr',
-            'server': server,
-            'port': int(port),
-            'cipher': method,
-            'protocol': protocol,
-            'obfs': obfs,
-            'password': password,
-            'udp': params.get('udp', 'false').lower() == 'true'
-        }
-        return node
-    except Exception:
-        return None
-
-
-
-#  SS 协议格式
-def parse_ss_node(line: str) -> dict | None:
-    try:
-        line = line.strip()
-        if not line.startswith('ss://'): return None
-        
-        remark = ""
-        if '#' in line:
-            line, remark = line.split('#', 1)
-            remark = unquote(remark)
-            
-        content = line[5:]
-        method, password, server, port = "", "", "", 0
+# 节点链接的解析 / 编码统一在 nodelib.protocols，按协议头查表分发
+parse_plain_node_line = protocols.parse_line
 
-        # 处理带 @ 的格式
-        if '@' in content:
-            prefix, addr = content.rsplit('@', 1)
-            if ':' not in prefix:
-                try:
-                    # 尝试补齐 Base64 填充
-                    padding = len(prefix) % 4
-                    if padding: prefix += '=' * (4 - padding)
-                    prefix = base64.b64decode(prefix.replace('-', '+').replace('_', '/')).decode('utf-8', 'ignore')
-                except: return None
-            
-            if ':' in prefix:
-                method, password = prefix.split(':', 1)
-            
-            if ':' in addr:
-                server, port_part = addr.rsplit(':', 1)
-                port = port_part.split('?')[0].replace(',', '.') # 预处理端口脏数据
-            else: return None
-        else:
-            # 全 Base64 格式略... (保持之前的逻辑)
-            pass
-
-        return {
-            'name': remark or f"ss_{server}",
-            'type': 'ss',
-            'server': server.replace(',', '.'), # 再次确保 IP 干净
-            'port': int(re.sub(r'\D', '', str(port))), # 强制只留数字
-            'cipher': method.strip(),
-            'password': password.strip(),
-            'udp': True
-        }
-    except: return None
-
-#  trojan 协议格式
-def parse_trojan_node(line):
-    try:
-        parsed = urlparse(line)
-        if parsed.scheme != 'trojan':
-            return None
-        password = parsed.username or ''
-        server = parsed.hostname or ''
-        port = parsed.port or 0
-        params = parse_qs(parsed.query)
-        node = {
-            'name': unquote(parsed.fragment) if parsed.fragment else f"trojan_{server}",
-            'type': 'trojan',
-            'server': server,
-            'port': port,
-            'password': password,
-            'sni': params.get('sni', [''])[0],
-            'skip-cert-verify': params.get('allowInsecure', ['false'])[0].lower() == 'true',
-            'udp': True,
-            'alpn': params.get('alpn', []),
-            'tls': True,
-        }
-        return node
-    except Exception:
-        return None
-        
-def parse_hysteria_node(line):
-    """
-    修正后的 Hysteria (v1) 解析函数。
-    - 强制添加 up/down 字段，并提供默认值。
-    - 修正了布尔值解析。
-    - 使用更符合 Clash 规范的字段名。
-    """
-    try:
-        parsed = urlparse(line)
-        if parsed.scheme != 'hysteria':
-            return None
-        params = parse_qs(parsed.query)
-        # --- 核心修改：为 Hysteria (v1) 添加必需的 up/down 字段 ---
-        # 尝试从 URL 参数中获取 up/down 速度，如果不存在，则提供一个合理的默认值。
-        # Clash 核心要求 up/down 字段必须存在。
-        up_speed_str = params.get('up', ['10'])[0]
-        down_speed_str = params.get('down', ['50'])[0]
-        
-        up_speed = int(''.join(filter(str.isdigit, up_speed_str)) or 10)
-        down_speed = int(''.join(filter(str.isdigit, down_speed_str)) or 50)
-        node = {
-            'name': unquote(parsed.fragment) or f"hysteria_{parsed.hostname}",
-            'type': 'hysteria',
-            'server': parsed.hostname,
-            'port': int(parsed.port or 0),
-            'auth_str': params.get('auth', [''])[0],
-            'up': up_speed,                          # 添加 up 字段
-            'down': down_speed,                      # 添加 down 字段
-            'protocol': params.get('protocol', ['udp'])[0],
-            'skip-cert-verify': params.get('insecure', ['0'])[0] in ('1', 'true'), # 更稳妥的布尔值转换
-            'sni': params.get('sni', [''])[0],
-            'obfs': params.get('obfs', [''])[0],
-            'fast-open': True, # 推荐开启
-        }
-        # 为了兼容 Clash，将 'auth_str' 字段重命名为 'auth'
-        node['auth'] = node.pop('auth_str')
-        
-        return node
-    except Exception as e:
-        print(f"【错误】解析 Hysteria 节点时失败: {e} -> {line[:80]}...")
-        return None
-        
-def parse_hysteria2_node(line):
-    """
-    修正后的 Hysteria2 解析函数
-    彻底解决 'missing obfs password' 报错
-    """
-    try:
-        parsed = urlparse(line)
-        if parsed.scheme != 'hysteria2':
-            return None
-        params = parse_qs(parsed.query)
-        insecure_val = params.get('insecure', ['0'])[0].lower()
-        
-        # 1. 提取混淆参数并去除空格
-        obfs = params.get('obfs', [''])[0].strip()
-        obfs_pw = params.get('obfs-password', [''])[0].strip()
-        
-        # 2. 基础配置
-        node = {
-            'name': unquote(parsed.fragment) if parsed.fragment else f"hysteria2_{parsed.hostname}",
-            'type': 'hysteria2',
-            'server': parsed.hostname,
-            'port': int(parsed.port or 0),
-            'auth': parsed.username or '',
-            'sni': params.get('sni', [''])[0],
-            'skip-cert-verify': insecure_val in ('1', 'true', 'yes'),
-            'fast-open': True,
-        }
-        
-        # 3. 【核心修复逻辑】
-        # 只有当 obfs 和 obfs-password 都不为空时，才添加这两个字段
-        if obfs and obfs_pw:
-            node['obfs'] = obfs
-            node['obfs-password'] = obfs_pw
-        else:
-            # 如果其中一个为空，则两个字段都不加。
-            # 这样节点会尝试以“无混淆”模式连接，而不会导致整个 Clash 报错无法启动。
-            if obfs:
-                print(f"⚠️ 节点 {node['name']} 混淆参数不完整 (只有obfs无密码)，已自动移除混淆配置以兼容测试。")
-        
-        return node
-    except Exception as e:
-        # print(f"【错误】解析 Hysteria2 节点失败: {e}")
-        return None
-        
-def parse_plain_nodes_from_text(text):
-    proxies = []
-    success_count = defaultdict(int)
-    failure_count = defaultdict(int)
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        proxy = None
-        proto = None
-        if line.startswith('vmess://'):
-            proto = 'vmess'
-            proxy = parse_vmess_node(line)
-        elif line.startswith('vless://'):
-            proto = 'vless'
-            proxy = parse_vless_node(line)
-        elif line.startswith('ssr://'):
-            proto = 'ssr'
-            proxy = parse_ssr_node(line)
-        elif line.startswith('ss://'):
-            proto = 'ss'
-            proxy = parse_ss_node(line)
-        elif line.startswith('trojan://'):
-            proto = 'trojan'
-            proxy = parse_trojan_node(line)
-        elif line.startswith('hysteria://'):
-            proto = 'hysteria'
-            proxy = parse_hysteria_node(line)
-        elif line.startswith('hysteria2://'):
-            proto = 'hysteria2'
-            proxy = parse_hysteria2_node(line)
-        if proxy:
-            proxies.append(proxy)
-            success_count[proto] += 1
-        else:
-            failure_count[proto] += 1
+def report_parse_counts(label, success_count, failure_count):
+    """各协议解析成功 / 失败数累加到 parse 阶段汇总，逐个订阅的明细只在 DEBUG 时输出"""
     for proto, count in success_count.items():
-        print(f"  - 明文协议解析完成，{proto} 节点成功数：{count}")
+        log.count('parse', f"{proto} 成功", count)
+        log.debug(f"  - {label}解析完成，{proto} 节点成功数：{count}", stage='parse', proto=proto, success=count)
     for proto, count in failure_count.items():
-        print(f"  - 明文协议解析失败，{proto} 节点失败数：{count}")
+        log.count('parse', f"{proto} 失败", count)
+        log.debug(f"  - {label}解析失败，{proto} 节点失败数：{count}", stage='parse', proto=proto, failure=count)
+
+def parse_plain_nodes_from_text(text):
+    proxies, success_count, failure_count = parallel.parse_lines(text.splitlines(), cache=parse_cache.get_cache())
+    report_parse_counts('明文协议', success_count, failure_count)
     return proxies
     
-def decode_base64_and_parse(content):
+def decode_base64_and_parse(content, decoded=None):
+    """decoded 为已经解码好的字节（decode_base64 的结果）时不再重复解码；按字节切行，逐行转成 str。"""
     try:
-        decoded = base64.b64decode(''.join(content.split())).decode('utf-8', errors='ignore')
-        proxies = []
-        success_count = defaultdict(int)
-        failure_count = defaultdict(int)
-        for line in decoded.splitlines():
-            line = line.strip()
-            if not line:
-                continue
-            proxy = None
-            proto = None
-            if line.startswith('vmess://'):
-                proto = 'vmess'
-                proxy = parse_vmess_node(line)
-            elif line.startswith('vless://'):
-                proto = 'vless'
-                proxy = parse_vless_node(line)
-            elif line.startswith('ssr://'):
-                proto = 'ssr'
-                proxy = parse_ssr_node(line)
-            elif line.startswith('ss://'):
-                proto = 'ss'
-                proxy = parse_ss_node(line)
-            elif line.startswith('trojan://'):
-                proto = 'trojan'
-                proxy = parse_trojan_node(line)
-            elif line.startswith('hysteria://'):
-                proto = 'hysteria'
-                proxy = parse_hysteria_node(line)
-            elif line.startswith('hysteria2://'):
-                proto = 'hysteria2'
-                proxy = parse_hysteria2_node(line)
-            if proxy:
-                proxies.append(proxy)
-                success_count[proto] += 1
-            else:
-                failure_count[proto] += 1
-        for proto, count in success_count.items():
-            print(f"  - Base64 解码解析完成，{proto} 节点成功数：{count}")
-        for proto, count in failure_count.items():
-            print(f"  - Base64 解码解析失败，{proto} 节点失败数：{count}")
+        if decoded is None:
+            decoded = base64.b64decode(''.join(content.split()))
+        proxies, success_count, failure_count = parallel.parse_lines(iter_lines(decoded), cache=parse_cache.get_cache())
+        report_parse_counts('Base64 解码', success_count, failure_count)
         return proxies
     except Exception as e:
-        print(f"  - Base64 解码解析异常: {e}")
+        log.count('download', 'Base64 异常')
+        log.debug(f"  - Base64 解码解析异常: {e}", stage='parse')
         return []
         
 # ==================== 下载链接 download_and_parse 函数 ====================
-def download_anti_crawl_subscription(url: str) -> str | None:
+def download_anti_crawl_subscription(url: str, timeout: float = 40) -> str | None:
     """
     专杀 ooo.oooooooo... / de5.net / feiniu 等超级反爬机场
     实测 2025 年 12 月 100% 通过
     """
     if 'de5.net' not in url and 'feiniu' not in url and 'oooooooo' not in url:
         return None  # 不是这种机场，直接走普通流程
-    print(f"  检测到超级反爬机场，启用浏览器级绕过: {url[:70]}...")
+    log.debug(f"  检测到超级反爬机场，启用浏览器级绕过: {url[:70]}...", stage='download', url=url)
     try:
-        import ssl
-        import urllib.request
-        # 构造最像浏览器的请求头
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0',
-        }
-        req = urllib.request.Request(url, headers=headers)
-        
-        # 完全禁用 SSL 验证 + 伪装 TLS
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        with urllib.request.urlopen(req, context=ctx, timeout=40) as response:
-            content = response.read().decode('utf-8', errors='ignore')
+        # 最像浏览器的请求头 + 完全禁用 SSL 验证，走共享连接池
+        r = http_client.get(url, user_agent=None, headers=http_client.BROWSER_HEADERS, timeout=timeout, verify=False)
+        with r:
+            r.raise_for_status()
+            encoding, _ = sniff.detect_encoding(r.content[:sniff.SNIFF_BYTES])
+            content = r.content.decode(encoding, errors='ignore')
             if 'vmess://' in content or 'ss://' in content or 'trojan://' in content or len(content) > 1000:
-                print(f"  反爬绕过成功！获取到 {len(content)} 字节内容")
+                log.debug(f"  反爬绕过成功！获取到 {len(content)} 字节内容", stage='download', url=url)
                 return content
             else:
-                print(f"  返回内容太短或无节点，疑似仍被识别")
+                log.debug(f"  返回内容太短或无节点，疑似仍被识别", stage='download', url=url)
                 return None
     except Exception as e:
-        print(f"  即使终极绕过也失败了: {e}")
+        log.debug(f"  即使终极绕过也失败了: {e}", stage='download', url=url)
         return None
 #==========
-def download_and_parse(url):
+def download_and_parse(url, deadline=None):
     """
     终极版下载+解析函数（2025年12月版）
     完美兼容：
-    - 普通机场（wget/curl/requests 三保险）
+    - 普通机场（进程内多策略流式下载 + 条件请求缓存，明文/Base64 订阅边收边解析）
     - 超级反爬机场（ooo.oooooooo.../de5.net/feiniu 等）
+    - 近期连续失败的链接：退避期内直接跳过，退避期满后用短超时探测（多次探测失败后改回正常超时）
+    - 传入 deadline 时按剩余时间收缩超时，到点后直接放弃
     """
-    content = None
+    if deadline is not None and deadline.expired():
+        return []
+    tracker = health.get_tracker()
+    action, probe_timeout = tracker.check(url)
+    if action == health.ACTION_SKIP:
+        log.count('download', '退避跳过')
+        log.debug(f"  ⏭️ 近期连续失败，退避期内跳过: {url[:70]}", stage='download', url=url)
+        return []
+    if action == health.ACTION_PROBE:
+        log.count('download', '短超时探测')
+        log.debug(f"  🩺 近期失败过，短超时({probe_timeout:.0f}s)探测: {url[:70]}", stage='download', url=url)
+    timeout = probe_timeout
+    if deadline is not None and not deadline.unlimited:
+        timeout = deadline.timeout(probe_timeout or 30)
+    proxies, failure = fetch_and_parse(url, timeout=timeout)
+    if proxies:
+        tracker.record_success(url)
+    elif failure == 'timeout' and timeout is not None and timeout < (probe_timeout or 30):
+        pass  # 超时是被时间预算压缩出来的，不算链接本身的问题
+    elif failure is None:
+        tracker.record_empty(url)  # 下载成功但没有节点（或全被筛选规则丢掉）：不退避
+    else:
+        tracker.record_failure(url, failure)
+    return proxies
+
+def fetch_and_parse(url, timeout=None):
+    """下载并解析单个订阅，返回 (节点列表, 失败类型)"""
+    cache = sub_cache.get_cache()
     # === 第一优先级：专杀超级反爬机场 ===
     if any(domain in url.lower() for domain in ['de5.net', 'feiniu', 'oooooooo', 'ooo.ooo', 'ooo.o', 'feiniu', 'sub.free']):
-        print(f"  检测到超级反爬机场，启用浏览器级绕过: {url[:70]}...")
-        content = download_anti_crawl_subscription(url)
+        log.debug(f"  检测到超级反爬机场，启用浏览器级绕过: {url[:70]}...", stage='download', url=url)
+        content = download_anti_crawl_subscription(url, timeout=timeout or 40)
         if content:
-            print(f"  反爬绕过成功，获取内容 {len(content)} 字节")
-    # === 第二优先级：普通机场三保险下载 ===
-    if not content:
-        content = download_subscription(url)  # 你之前我给的三保险函数（wget→curl→requests）
-    # === 如果全部失败，直接返回空 ===
-    if not content:
-        print(f"  所有下载方式均失败，跳过: {url}")
-        return []
+            log.count('download', '反爬绕过')
+            log.debug(f"  反爬绕过成功，获取内容 {len(content)} 字节", stage='download', url=url, size=len(content))
+            digest = sub_cache.body_digest(content)
+            if cache is not None:
+                cached_nodes = cache.get_nodes(url, digest)
+                if cached_nodes is not None:
+                    log.count('download', '复用解析结果')
+                    log.debug(f"  ♻️ 内容未变化，复用上次解析结果: {len(cached_nodes)} 个节点", stage='download', url=url)
+                    return cached_nodes, None
+            proxies = parse_subscription_content(content, url)
+            if proxies and cache is not None:
+                cache.put_nodes(url, digest, proxies)
+            return proxies, None
+    # === 第二优先级：普通机场多策略流式下载（直连→重试→备用 UA）===
+    result = SUB_DOWNLOADER.fetch_stream(url, lambda body: stream_and_parse(url, body), timeout=timeout)
+    if result.content is None:
+        log.count('download', '下载失败')
+        log.debug(f"  所有下载方式均失败，跳过: {url} ({result.error})", stage='download', url=url, kind=result.kind)
+        return [], result.kind
+    if result.strategy != 'direct':
+        log.count('download', f"兜底 {result.strategy}")
+        log.debug(f"  ↪️ 兜底策略 {result.strategy} 下载成功: {url[:70]}", stage='download', url=url)
+    return result.content, None
+
+def stream_and_parse(url, body):
+    """逐块读取订阅：明文 / Base64 边收边解析，YAML 收完后走统一解析逻辑"""
+    cache = sub_cache.get_cache()
+    # === 304 且内容与上次完全一致：直接复用上次的解析结果 ===
+    if body.from_cache:
+        log.count('download', '304 未变化')
+        log.debug(f"  ♻️ 订阅未变化 (304)，使用本地缓存: {url[:70]}", stage='download', url=url)
+        if cache is not None:
+            cached_nodes = cache.get_nodes(url, body.digest)
+            if cached_nodes is not None:
+                log.count('download', '复用解析结果')
+                log.debug(f"  ♻️ 内容未变化，复用上次解析结果: {len(cached_nodes)} 个节点", stage='download', url=url)
+                return cached_nodes
+    sink = SubscriptionSink(parse_plain_node_line, cache=parse_cache.get_cache())
+    for chunk in body:
+        sink.feed(chunk)
+        if sink.rejected:
+            break
+    sink.close()
+    if sink.rejected:
+        log.count('download', 'HTML 页面')
+        log.debug(f"  返回的是 HTML 页面（疑似错误页 / 验证页），跳过: {url[:80]}", stage='download', url=url)
+        proxies = []
+    elif sink.mode == MODE_BUFFER:
+        proxies = parse_subscription_content(sink.text or '', url, kind=sink.kind)
+    else:
+        label = '明文协议' if sink.mode == MODE_LINES else 'Base64 解码'
+        report_parse_counts(label, sink.success, sink.failure)
+        proxies = sink.proxies
+        if proxies:
+            log.count('download', '明文链接' if sink.mode == MODE_LINES else 'Base64')
+            log.debug(f"  {'明文链接' if sink.mode == MODE_LINES else 'Base64 解码'}解析成功: {len(proxies)} 个节点",
+                      stage='download', url=url, nodes=len(proxies))
+        else:
+            log.count('download', '未知格式')
+            log.debug(f"  未知格式，解析失败: {url[:80]}", stage='download', url=url)
+    if proxies and cache is not None and body.digest:
+        cache.put_nodes(url, body.digest, proxies)
+    return proxies
+
+def parse_subscription_content(content, url='', kind=None):
     # ====================== 统一解析逻辑（只走一次！）======================
-    proxies = parse_proxies_from_content(content)
-    if proxies:
-        print(f"  直接 YAML 解析成功: {len(proxies)} 个节点")
-        return proxies
-    proxies = parse_plain_nodes_from_text(content)
-    if proxies:
-        print(f"  明文链接解析成功: {len(proxies)} 个节点")
-        return proxies
-    if is_base64(content):
-        print(f"  检测到 Base64 编码，正在解码...")
-        proxies = decode_base64_and_parse(content)
+    # 先嗅探格式，直接交给对应解析器；明文 / Base64 内容不再先跑一遍完整的 YAML 解析
+    kind = kind or sniff.sniff_text(content).kind
+    if kind == sniff.KIND_HTML:
+        log.count('download', 'HTML 页面')
+        log.debug(f"  返回的是 HTML 页面（疑似错误页 / 验证页），跳过: {url[:80]}", stage='download', url=url)
+        return []
+    if kind in (sniff.KIND_CLASH_YAML, sniff.KIND_JSON, sniff.KIND_UNKNOWN):
+        proxies = parse_proxies_from_content(content)
+        if proxies:
+            log.count('download', 'YAML')
+            log.debug(f"  直接 YAML 解析成功: {len(proxies)} 个节点", stage='download', url=url, nodes=len(proxies))
+            return proxies
+    if kind != sniff.KIND_BASE64:
+        proxies = parse_plain_nodes_from_text(content)
+        if proxies:
+            log.count('download', '明文链接')
+            log.debug(f"  明文链接解析成功: {len(proxies)} 个节点", stage='download', url=url, nodes=len(proxies))
+            return proxies
+    # Base64 判定与解码一次完成，解码结果直接按字节切行解析
+    decoded = decode_base64(content)
+    if decoded is not None:
+        log.debug(f"  检测到 Base64 编码，正在解码...", stage='download', url=url)
+        proxies = decode_base64_and_parse(content, decoded)
         if proxies:
-            print(f"  Base64 解码解析成功: {len(proxies)} 个节点")
+            log.count('download', 'Base64')
+            log.debug(f"  Base64 解码解析成功: {len(proxies)} 个节点", stage='download', url=url, nodes=len(proxies))
             return proxies
-    print(f"  未知格式，解析失败: {url[:80]}")
+    log.count('download', '未知格式')
+    log.debug(f"  未知格式，解析失败: {url[:80]}", stage='download', url=url)
     return []
 # --- 下面保持原A版测速、去重、排序等逻辑 ---
-def get_proxy_key(proxy):
-    unique_part = proxy.get('uuid') or proxy.get('password') or ''
-    return hashlib.md5(
-        f"{proxy.get('server','')}:{proxy.get('port',0)}|{unique_part}".encode()
-    ).hexdigest()
-
 
 def is_valid_ss_cipher(cipher):
     """
@@ -1839,12 +1653,21 @@ def is_valid_ss_cipher(cipher):
     }
     return cipher.lower() in valid_ciphers
     
+# Clash 核心能加载的协议 / SS 加密方式（is_valid_proxy 的白名单，也下推给解析阶段，见 NODE_FILTER）
+CLASH_PROXY_TYPES = {'vmess', 'vless', 'ss', 'ssr', 'trojan', 'hysteria', 'hysteria2', 'socks5', 'http'}
+CLASH_SS_CIPHERS = {
+    'aes-128-gcm', 'aes-192-gcm', 'aes-256-gcm',
+    'chacha20-ietf-poly1305', 'xchacha20-ietf-poly1305',
+    '2022-blake3-aes-128-gcm', '2022-blake3-aes-256-gcm',
+    '2022-blake3-chacha20-poly1305'
+}
+
 def is_valid_proxy(proxy):
     """
     顶级严格校验：模拟 Clash 核心加载逻辑。
     对 SS 2022 进行字节级长度匹配，并修复 IP 脏数据。
     """
-    if not isinstance(proxy, dict):
+    if not isinstance(proxy, (dict, Proxy)):
         return False
 
     required_keys = ['name', 'type', 'server', 'port']
@@ -1865,23 +1688,15 @@ def is_valid_proxy(proxy):
 
     # 3. 协议白名单
     p_type = proxy['type'].lower()
-    allowed_types = {'vmess', 'vless', 'ss', 'ssr', 'trojan', 'hysteria', 'hysteria2', 'socks5', 'http'}
-    if p_type not in allowed_types: return False
+    if p_type not in CLASH_PROXY_TYPES: return False
 
     # 4. Shadowsocks (SS) 专项“断头台”校验
     if p_type == 'ss':
         cipher = proxy.get('cipher', '').strip().lower()
         password = proxy.get('password', '').strip()
         
-        # 定义 Clash 2025 官方支持的 Cipher 列表
-        valid_ss_ciphers = {
-            'aes-128-gcm', 'aes-192-gcm', 'aes-256-gcm',
-            'chacha20-ietf-poly1305', 'xchacha20-ietf-poly1305',
-            '2022-blake3-aes-128-gcm', '2022-blake3-aes-256-gcm', 
-            '2022-blake3-chacha20-poly1305'
-        }
-
-        if cipher not in valid_ss_ciphers:
+        # Clash 2025 官方支持的 Cipher 列表
+        if cipher not in CLASH_SS_CIPHERS:
             return False
 
         # --- 核心：针对 SS 2022 (Blake3) 的字节级校验 ---
@@ -1896,7 +1711,7 @@ def is_valid_proxy(proxy):
                     clean_pw += '=' * (4 - missing_padding)
                 
                 # C. 尝试解码为原始二进制字节
-                decoded_key = base64.b64decode(clean_pw)
+                decoded_key = binascii.a2b_base64(clean_pw)
                 key_len = len(decoded_key)
                 
                 # D. 严格长度匹配（这是 Clash 报错的根源）
@@ -1909,7 +1724,7 @@ def is_valid_proxy(proxy):
                 
                 # E. 重新编码（将 URL-safe 的 -_ 转回标准 +/）
                 # 这一步能保证输出给 YAML 的字符串绝对符合标准 Base64
-                proxy['password'] = base64.b64encode(decoded_key).decode('utf-8')
+                proxy['password'] = binascii.b2a_base64(decoded_key, newline=False).decode('ascii')
                 
             except Exception:
                 # 只要有一步出错（如非法字符、长度不对），说明节点已损坏，直接筛除
@@ -1996,6 +1811,16 @@ VALID_SS_CIPHERS_2024 = {
     '2022-blake3-chacha20-poly1305'
 }
 
+# 筛选规则下推：解析链接 / YAML 时就丢弃白名单之外的协议和 SS 加密方式，识别地区时丢弃不保留的地区。
+# SS 节点要同时通过 is_valid_proxy 和 fix_and_filter_ss_nodes，所以取两份加密方式白名单的交集。
+# 必须在 main() 里 parallel.start() fork 解析进程之前安装
+NODE_FILTER = filters.FilterSpec(
+    types=CLASH_PROXY_TYPES,
+    ss_ciphers=CLASH_SS_CIPHERS & VALID_SS_CIPHERS_2024,
+    regions=ALLOWED_REGIONS if FILTER_ALLOWED_REGIONS else None,
+)
+filters.install(NODE_FILTER)
+
 def is_password_valid(password: str) -> bool:
     """密码合法性检查，长度和ASCII打印字符+简单黑名单"""
     if not password:
@@ -2105,6 +1930,7 @@ def process_proxies_with_fallback(proxies):
     识别后将结果存入 region_info，但不在这里改名。
     """
     processed = []
+    dropped = 0
     for p in proxies:
         orig_name = p.get('name', '').strip()
         # 预处理：去掉开头已有国旗方便匹配
@@ -2127,9 +1953,16 @@ def process_proxies_with_fallback(proxies):
         # 第三步：实在没匹配到，标记未知
         if matched_region is None:
             matched_region = {'name': '未知', 'code': 'UN'}
+
+        # 不保留的地区在这里就丢弃，不再改名、测速
+        if not NODE_FILTER.keeps_region(matched_region['name']):
+            dropped += 1
+            continue
             
         p['region_info'] = matched_region
         processed.append(p)
+    if dropped:
+        print(f"  - 地区筛选：丢弃 ALLOWED_REGIONS 之外的节点 {dropped} 个")
     return processed
 
 # --- 统一去尾缀 + 唯一命名 ---
@@ -2141,7 +1974,7 @@ def normalize_proxy_names(proxies):
     """
     if not proxies: return []
     
-    country_counters = defaultdict(int)
+    names = NameAllocator()  # 每个 "国旗 国家名" 各自从 1 开始编号
     final_list = []
     
     for p in proxies:
@@ -2150,16 +1983,12 @@ def normalize_proxy_names(proxies):
         region_name = region_info['name']
         code = region_info['code']
         
-        # 累加该国家的计数器
-        country_counters[region_name] += 1
-        num = country_counters[region_name]
-        
         # 生成国旗
         flag = get_country_flag_emoji(code)
         
         # 【关键改动】：强制重写 p['name']，不引用原名的任何字符
         # 结果：🇰🇷 韩国-1, 🇯🇵 日本-5
-        p['name'] = f"{flag} {region_name}-{num}"
+        p['name'] = names.number(f"{flag} {region_name}")
         
         final_list.append(p)
         
@@ -2381,7 +2210,7 @@ def add_quality_to_name(proxies):
 # ===
 def generate_config(proxies, last_message_ids):
     return {
-        'proxies': proxies,
+        'proxies': to_clash_list(proxies),
         'last_message_ids': last_message_ids,
     }
 #TCP 测速,测速默认关闭
@@ -2411,27 +2240,17 @@ def run_speedtest(enable_tcp_log=False):
             print(line.strip())
     
     return process.poll()
-def tcp_ping(proxy, timeout=TCP_TIMEOUT):
+def tcp_ping(prober, endpoint, timeout=TCP_TIMEOUT):
     """
     纯 TCP 连接测延迟，返回延迟（单位ms），失败返回 None。
+    endpoint 为 nodelib.probe.endpoint_key 的 (主机名, 端口)；同一解析后的 IP:端口 由 prober 只连一次。
     """
-    server = proxy.get('server')
-    port = proxy.get('port')
-    if not server or not port:
-        return None
-    import socket
-    try:
-        start = time.time()
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(timeout)
-            s.connect((server, int(port)))
-        delay_ms = int((time.time() - start) * 1000)
-        if 1 < delay_ms <= 5000:
-            return delay_ms
-        else:
-            return None
-    except:
+    if endpoint is None:
         return None
+    delay_ms = prober.probe(*endpoint, timeout=timeout)
+    if delay_ms is not None and 1 < delay_ms <= 5000:
+        return delay_ms
+    return None
         
 # 锚点
 def test_proxy_with_clash(clash_path, proxy):
@@ -2440,32 +2259,106 @@ def test_proxy_with_clash(clash_path, proxy):
         proxy['clash_delay'] = delay
         return proxy
     return None
-def batch_tcp_test(proxies, max_workers=TCP_MAX_WORKERS):
+def batch_tcp_test(proxies, max_workers=TCP_MAX_WORKERS, deadline=None):
     """
     使用线程池批量进行 TCP 测速。
     只保留延迟合理的节点，支持 TCP 日志打印。
+    按端点测速：同一 server:port（以及解析到同一 IP 的不同域名）只连一次，结果分发给该端点上的所有节点。
+    传入 deadline 时按剩余时间收缩超时，到点后未测的节点直接跳过（保留已测结果）。
     """
+    prober = EndpointProber(timeout=TCP_TIMEOUT)
+    groups = group_by_endpoint(proxies)
+
+    def run_one(endpoint):
+        if deadline is None:
+            return tcp_ping(prober, endpoint)
+        if deadline.expired():
+            return SKIPPED
+        return tcp_ping(prober, endpoint, timeout=deadline.timeout(TCP_TIMEOUT))
+
     results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_proxy = {executor.submit(tcp_ping, p): p for p in proxies}
-        for future in as_completed(future_to_proxy):
-            proxy = future_to_proxy[future]
+    failed = []
+    skipped = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers_for(len(groups), max_workers)) as executor:
+        future_to_group = {executor.submit(run_one, endpoint): members for endpoint, members in groups.items()}
+        for future in as_completed(future_to_group):
             delay = future.result()
-            if delay is not None:
-                pcopy = proxy.copy()
-                pcopy['tcp_delay'] = delay
-                results.append(pcopy)
-                if ENABLE_TCP_LOG:
-                    print(f"TCP PASS: {delay:4d}ms | {pcopy.get('name', '')[:40]}")
-            else:
-                if ENABLE_TCP_LOG:
-                    print(f"TCP FAIL → {proxy.get('name', '')[:40]}")
-    
+            if delay is SKIPPED:
+                skipped += len(future_to_group[future])
+                continue
+            if delay is None and full_timeout(deadline, TCP_TIMEOUT):
+                failed.extend(future_to_group[future])
+            for proxy in future_to_group[future]:
+                record_tcp_result(proxy, delay, results)
+    
+    if skipped:
+        log.count('tcp', '跳过', skipped)
+    log.summary('tcp', 'TCP 测速')
+    record_node_results(results)
+    note_stage_failures(proxies, failed)
+    print(f"  🎯 端点去重: {prober.describe(len(proxies))}")
     # 【新增打印】
+    if skipped:
+        print(f"⏰ TCP 测速时间预算用尽，{skipped} 个节点未测")
     print(f"TCP测速完成，成功节点：🛩️{len(results)}个")
     return results
+
+def record_tcp_result(proxy, delay, results):
+    """单个节点的 TCP 结果：通过的写入 tcp_delay 并加入 results，计数 / 日志"""
+    if delay is not None:
+        proxy.tcp_delay = delay
+        results.append(proxy)
+        log.count('tcp', '通过')
+        if ENABLE_TCP_LOG or log.DEBUG_ON:
+            log.debug(f"TCP PASS: {delay:4d}ms | {proxy.get('name', '')[:40]}", echo=ENABLE_TCP_LOG,
+                      stage='tcp', delay=delay, server=proxy.get('server'), port=proxy.get('port'))
+    else:
+        log.count('tcp', '失败')
+        if ENABLE_TCP_LOG or log.DEBUG_ON:
+            log.debug(f"TCP FAIL → {proxy.get('name', '')[:40]}", echo=ENABLE_TCP_LOG,
+                      stage='tcp', server=proxy.get('server'), port=proxy.get('port'))
     
-def batch_test_proxies_speedtest(speedtest_path, proxies, max_workers=48, debug=False, test_urls=None): # test_urls now required
+def reprobe_suspects(proxies, deadline=None):
+    """
+    测速前预筛：近期测速失败过的节点（失效节点过滤器命中）不直接进入完整测速链，
+    先用低并发做一次 TCP 复测（超时与正式测速相同），通过的放回，仍不通的（以及时间预算内没测到的）本次跳过；
+    只有用完整超时仍连不上的才刷新失效记录。
+    """
+    dead_filter = bloom.get_filter()
+    if dead_filter is None or not proxies:
+        return proxies
+    suspects = [p for p in proxies if p in dead_filter]
+    if not suspects:
+        return proxies
+    print(f"  - 近期测速失败过的节点 {len(suspects)} 个，复测（超时 {SUSPECT_PROBE_TIMEOUT}s，并发 {SUSPECT_PROBE_WORKERS}）...")
+    prober = EndpointProber(timeout=SUSPECT_PROBE_TIMEOUT)
+    groups = group_by_endpoint(suspects)
+
+    def run_one(endpoint):
+        if deadline is None:
+            return tcp_ping(prober, endpoint, timeout=SUSPECT_PROBE_TIMEOUT)
+        if deadline.expired():
+            return SKIPPED
+        return tcp_ping(prober, endpoint, timeout=deadline.timeout(SUSPECT_PROBE_TIMEOUT))
+
+    still_dead = []
+    untested = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers_for(len(groups), SUSPECT_PROBE_WORKERS)) as executor:
+        future_to_group = {executor.submit(run_one, endpoint): members for endpoint, members in groups.items()}
+        for future in as_completed(future_to_group):
+            delay = future.result()
+            if delay is SKIPPED:
+                untested.extend(future_to_group[future])
+            elif delay is None:
+                still_dead.extend(future_to_group[future])
+    note_stage_failures(suspects, still_dead if full_timeout(deadline, SUSPECT_PROBE_TIMEOUT) else [])
+    dropped = {id(p) for p in still_dead}
+    dropped.update(id(p) for p in untested)
+    print(f"  - 复测恢复 {len(suspects) - len(dropped)} 个，仍不可用 {len(still_dead)} 个"
+          + (f"，未测 {len(untested)} 个" if untested else "") + "（跳过完整测速）")
+    return [p for p in proxies if id(p) not in dropped]
+
+def batch_test_proxies_speedtest(speedtest_path, proxies, max_workers=48, debug=False, test_urls=None, deadline=None): # test_urls now required
     """
     使用 xcspeedtest 批量测试代理延迟 + 带宽
     已加入：
@@ -2473,6 +2366,7 @@ def batch_test_proxies_speedtest(speedtest_path, proxies, max_workers=48, debug=
         • 自动重试 2 次
         • 更合理的超时与并发
         • 根据网络状态动态选择测速地址
+        • 传入 deadline 时按剩余时间收缩超时，到点后未测的节点直接跳过
     """
     # 动态获取测速地址 - 此处不再调用get_test_urls，而是直接使用传入的test_urls
     if test_urls is None: # 防御性检查，理论上main函数会传入
@@ -2485,6 +2379,8 @@ def batch_test_proxies_speedtest(speedtest_path, proxies, max_workers=48, debug=
     # ============ 关键优化1：测速前预热所有测速地址 ============
     print("预热测速线路（避免首次请求超时）...")
     for url in test_urls:
+        if deadline is not None and deadline.expired():
+            break
         try:
             subprocess.run(
                 ["curl", "-s", "--max-time", "3", "--connect-timeout", "3", url],
@@ -2497,35 +2393,51 @@ def batch_test_proxies_speedtest(speedtest_path, proxies, max_workers=48, debug=
     
     # ============ 并发测速（无重试，因为 retries=0） ============
     results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    failed = []
+    skipped = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers_for(len(proxies), max_workers)) as executor:
         # 先提交所有任务（带测速地址参数）
         future_to_proxy = {
-            executor.submit(xcspeedtest_test_proxy_with_retry, speedtest_path, proxy, debug, test_urls, retries=0): proxy # test_urls passed
+            executor.submit(xcspeedtest_test_proxy_with_retry, speedtest_path, proxy, debug, test_urls, retries=0, deadline=deadline): proxy # test_urls passed
             for proxy in proxies
         }
         for future in concurrent.futures.as_completed(future_to_proxy):
             proxy = future_to_proxy[future]
             try:
                 result = future.result()  # (delay, bandwidth) or None
-                if result is not None:
+                if result is SKIPPED:
+                    skipped += 1
+                elif result is not None:
                     delay, bandwidth = result
-                    pcopy = proxy.copy()
-                    pcopy['clash_delay'] = delay
+                    proxy.clash_delay = delay
                     if bandwidth:
-                        pcopy['bandwidth'] = bandwidth
-                    results.append(pcopy)
-                    if debug:
-                        print(f"成功: {delay:4d}ms | {bandwidth or 'N/A':>10} → {proxy.get('name')}")
+                        proxy.bandwidth = bandwidth
+                    results.append(proxy)
+                    log.count('speedtest', '通过')
+                    if debug or log.DEBUG_ON:
+                        log.debug(f"成功: {delay:4d}ms | {bandwidth or 'N/A':>10} → {proxy.get('name')}", echo=debug,
+                                  stage='speedtest', delay=delay, bandwidth=bandwidth)
                 else:
-                    if debug:
-                        print(f"失败 → {proxy.get('name')}") # Debug output for failed attempts
+                    log.count('speedtest', '失败')
+                    if full_timeout(deadline, 40):
+                        failed.append(proxy)
+                    if debug or log.DEBUG_ON:
+                        log.debug(f"失败 → {proxy.get('name')}", echo=debug, stage='speedtest') # Debug output for failed attempts
             except Exception as e:
-                if debug:
-                    print(f"异常: {proxy.get('name')} → {e}")
+                log.count('speedtest', '异常')
+                if debug or log.DEBUG_ON:
+                    log.debug(f"异常: {proxy.get('name')} → {e}", echo=debug, stage='speedtest')
+    if skipped:
+        log.count('speedtest', '跳过', skipped)
+    log.summary('speedtest', 'speedtest-clash 精测')
+    record_node_results(results)
+    note_stage_failures(proxies, failed)
+    if skipped:
+        print(f"⏰ speedtest-clash 时间预算用尽，{skipped} 个节点未测")
     print(f"speedtest-clash 精测完成，成功节点：🛩️{len(results)} 个")
     return results
 # ============ 辅助函数：带重试的单节点测速（务必一起加上） ============
-def xcspeedtest_test_proxy_with_retry(speedtest_path, proxy, debug=False, test_urls=None, retries=0): # test_urls now required
+def xcspeedtest_test_proxy_with_retry(speedtest_path, proxy, debug=False, test_urls=None, retries=0, deadline=None): # test_urls now required
     """
     对单个节点进行测速，最多重试 retries 次
     支持传入自定义测速地址列表
@@ -2535,8 +2447,11 @@ def xcspeedtest_test_proxy_with_retry(speedtest_path, proxy, debug=False, test_u
         test_urls = get_test_urls()
         
     for attempt in range(retries + 1): # This loop will run only once for attempt=0
+        if deadline is not None and deadline.expired():
+            return SKIPPED
+        timeout = deadline.timeout(40) if deadline is not None else 40
         try:
-            result = xcspeedtest_test_proxy(speedtest_path, proxy, debug, test_urls) # test_urls passed
+            result = xcspeedtest_test_proxy(speedtest_path, proxy, debug, test_urls, timeout=timeout) # test_urls passed
             if result is not None:  # (delay, bandwidth)
                 return result
             else:
@@ -2551,7 +2466,7 @@ def xcspeedtest_test_proxy_with_retry(speedtest_path, proxy, debug=False, test_u
             return None
     return None # This line should logically not be reached with retries=0
 # clash 测速
-def xcspeedtest_test_proxy(speedtest_path, proxy, debug=False, test_urls=None): # test_urls now required
+def xcspeedtest_test_proxy(speedtest_path, proxy, debug=False, test_urls=None, timeout=40): # test_urls now required
     """
     2025-12-06 终极无敌版
     兼容所有版本 xcspeedtest（有/无 clash_delay、引号残缺、换行截断、带宽表格等）
@@ -2579,18 +2494,18 @@ def xcspeedtest_test_proxy(speedtest_path, proxy, debug=False, test_urls=None):
                 "allow-lan": False,
                 "mode": "Rule",
                 "log-level": "silent",
-                "proxies": [proxy],
+                "proxies": to_clash_list([proxy], meta=False),
                 "proxy-groups": [{"name": "TESTGROUP", "type": "select", "proxies": [proxy["name"]]}],
                 "rules": rules
             }
             
             with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(config, f, allow_unicode=True, sort_keys=False)
+                yaml_io.dump(config, f, allow_unicode=True, sort_keys=False)
             
             cmd = [speedtest_path, '-c', config_path]
             result = subprocess.run(
                 cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                timeout=40, text=True, encoding='utf-8', errors='ignore'
+                timeout=timeout, text=True, encoding='utf-8', errors='ignore'
             )
             output = result.stdout + result.stderr
             
@@ -2651,10 +2566,11 @@ def xcspeedtest_test_proxy(speedtest_path, proxy, debug=False, test_urls=None):
         if debug:
             print(f"测速异常: {e}")
         return None
-def clash_test_proxy(clash_path, proxy, test_urls=None, debug=False): # test_urls now required
+def clash_test_proxy(clash_path, proxy, test_urls=None, debug=False, deadline=None): # test_urls now required
     """
     使用 Clash 核心的 -fast 模式，对单个代理节点测速。
     支持传入自定义测速 URL 列表。
+    传入 deadline 时按剩余时间收缩超时，到点后不再尝试剩余的测速 URL。
     返回延迟(ms) 或 None。
     """
     if test_urls is None: # 防御性检查
@@ -2662,16 +2578,17 @@ def clash_test_proxy(clash_path, proxy, test_urls=None, debug=False): # test_url
         test_urls = get_test_urls()
     temp_dir = tempfile.mkdtemp()
     config_path = os.path.join(temp_dir, 'config.yaml')
-    import yaml
     try:
         for test_url in test_urls:
+            if deadline is not None and deadline.expired():
+                break
             config = {
                 "port": 7890,
                 "socks-port": 7891,
                 "allow-lan": False,
                 "mode": "Rule",
                 "log-level": "silent",
-                "proxies": [proxy],
+                "proxies": to_clash_list([proxy], meta=False),
                 "proxy-groups": [
                     {
                         "name": "TESTGROUP",
@@ -2685,7 +2602,7 @@ def clash_test_proxy(clash_path, proxy, test_urls=None, debug=False): # test_url
                 ]
             }
             with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(config, f, allow_unicode=True, sort_keys=False)
+                yaml_io.dump(config, f, allow_unicode=True, sort_keys=False)
             cmd = [clash_path, '-c', config_path, '-fast']
             if debug:
                 print(f"\n=== 使用测速 URL: {test_url}, 测试节点: {proxy['name']} ===")
@@ -2693,7 +2610,7 @@ def clash_test_proxy(clash_path, proxy, test_urls=None, debug=False): # test_url
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                timeout=30,
+                timeout=deadline.timeout(30) if deadline is not None else 30,
                 text=True
             )
             output = (result.stdout + result.stderr).replace('\x00', '')
@@ -2738,51 +2655,74 @@ def clash_test_proxy(clash_path, proxy, test_urls=None, debug=False): # test_url
             pass
     return None
     
-def batch_test_proxies_clash(clash_path, proxies, max_workers=MAX_TEST_WORKERS, debug=False, test_urls=None):
+def batch_test_proxies_clash(clash_path, proxies, max_workers=MAX_TEST_WORKERS, debug=False, test_urls=None, deadline=None):
     """
     使用 Clash 核心批量测速的辅助函数，并发执行。
     返回测速完成后带有 clash_delay 字段的列表。
+    传入 deadline 时到点后未测的节点直接跳过（保留已测结果）。
     """
     if test_urls is None:
         test_urls = get_test_urls()
+
+    def run_one(proxy):
+        if deadline is not None and deadline.expired():
+            return SKIPPED
+        return clash_test_proxy(clash_path, proxy, test_urls, debug, deadline=deadline)
+
     results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    failed = []
+    skipped = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers_for(len(proxies), max_workers)) as executor:
         future_to_proxy = {
-            executor.submit(clash_test_proxy, clash_path, proxy, test_urls, debug): proxy
+            executor.submit(run_one, proxy): proxy
             for proxy in proxies
         }
         for future in as_completed(future_to_proxy):
             proxy = future_to_proxy[future]
             try:
                 delay = future.result()
-                if delay is not None:
-                    pcopy = proxy.copy()
-                    pcopy['clash_delay'] = delay
-                    results.append(pcopy)
-                    if debug:
-                        print(f"CLASH PASS: {delay}ms → {pcopy.get('name', '')[:40]}")
+                if delay is SKIPPED:
+                    skipped += 1
+                elif delay is not None:
+                    proxy.clash_delay = delay
+                    results.append(proxy)
+                    log.count('clash', '通过')
+                    if debug or log.DEBUG_ON:
+                        log.debug(f"CLASH PASS: {delay}ms → {proxy.get('name', '')[:40]}", echo=debug, stage='clash', delay=delay)
                 else:
-                    if debug:
-                        print(f"CLASH FAIL → {proxy.get('name', '')[:40]}")
+                    log.count('clash', '失败')
+                    if full_timeout(deadline, 30):
+                        failed.append(proxy)
+                    if debug or log.DEBUG_ON:
+                        log.debug(f"CLASH FAIL → {proxy.get('name', '')[:40]}", echo=debug, stage='clash')
             except Exception as e:
-                if debug:
-                    print(f"CLASH EXCEPTION: {proxy.get('name', '')[:40]} → {e}")
-    
+                log.count('clash', '异常')
+                if debug or log.DEBUG_ON:
+                    log.debug(f"CLASH EXCEPTION: {proxy.get('name', '')[:40]} → {e}", echo=debug, stage='clash')
+    
+    if skipped:
+        log.count('clash', '跳过', skipped)
+    log.summary('clash', 'clash 测速')
+    record_node_results(results)
+    note_stage_failures(proxies, failed)
     # 【新增打印】
+    if skipped:
+        print(f"⏰ clash 测速时间预算用尽，{skipped} 个节点未测")
     print(f"clash 测速完成，成功节点：🛩️{len(results)}个")
     return results
     
 def save_intermediate_results(proxies: list, filename: str, last_message_ids: dict | None = None):
     if not proxies:
         print(f"⏩ 中间结果 {filename} 为空，跳过保存。")
-        return
+        return []
     max_nodes = MAX_NODES_PER_FILE.get(os.path.basename(filename), 500)
-    save_proxies = proxies[:max_nodes]
+    save_proxies = to_clash_list(proxies[:max_nodes])
     update_time = datetime.now(BJ_TZ).strftime("%Y-%m-%d %H:%M:%S")
     output_data = {'proxies': save_proxies}
     if WRITE_LAST_MESSAGE_IDS_IN_INTERMEDIATE and last_message_ids is not None:
         output_data['last_message_ids'] = last_message_ids
     write_yaml_with_header(filename, output_data, update_time, len(save_proxies), 0, "", DETAILED_SPEEDTEST_MODE, MIN_BANDWIDTH_MB)
+    return save_proxies
 
 
 
@@ -2807,26 +2747,28 @@ def write_yaml_with_header(filepath, data, update_time, total_count, avg_quality
         with open(filepath, 'w', encoding='utf-8') as f:
             for line in header_lines:
                 f.write(line + '\n')
-            yaml.dump(data, f, allow_unicode=True, sort_keys=False, indent=2, width=4096)
+            yaml_io.dump(data, f, allow_unicode=True, sort_keys=False, indent=2, width=4096)
         print(f"✅ 文件已保存: {os.path.basename(filepath)} | 节点数: {total_count}")
     except Exception as e:
         print(f"❌ 写入文件失败 {filepath}: {e}")
 
 def save_intermediate_results(proxies: list, filename: str, last_message_ids: dict | None = None):
+    """写出阶段结果，返回写出的节点字典（节点之后还会被后续阶段原地更新，需要原样重写时用这份快照）。"""
     if not proxies:
-        return
+        return []
     max_nodes = MAX_NODES_PER_FILE.get(os.path.basename(filename), 500)
-    save_proxies = proxies[:max_nodes]
+    save_proxies = to_clash_list(proxies[:max_nodes])
     update_time = datetime.now(BJ_TZ).strftime("%Y-%m-%d %H:%M:%S")
     output_data = {'proxies': save_proxies}
     if WRITE_LAST_MESSAGE_IDS_IN_INTERMEDIATE and last_message_ids is not None:
         output_data['last_message_ids'] = last_message_ids
     
     write_yaml_with_header(filename, output_data, update_time, len(save_proxies), 0, "", DETAILED_SPEEDTEST_MODE, MIN_BANDWIDTH_MB)
+    return save_proxies
 
 def save_final_config(final_proxies, last_message_ids, q_stats):
     max_nodes = MAX_NODES_PER_FILE.get(os.path.basename(OUTPUT_FILE), 500)
-    save_proxies = final_proxies[:max_nodes]
+    save_proxies = to_clash_list(final_proxies[:max_nodes])
     update_time = datetime.now(BJ_TZ).strftime("%Y-%m-%d %H:%M:%S")
     total_count = len(save_proxies)
     avg_quality = (sum(p.get('quality_score', 0) for p in save_proxies) / total_count) if total_count else 0
@@ -2858,9 +2800,12 @@ async def main():
     tcp_passed = []
     clash_passed = []
     speedtest_passed = []
+    tcp_saved = []      # TCP.yaml / clash.yaml 写出时的快照：节点按引用传到后面的阶段，改名、测速都会原地更新
+    clash_saved = []
     final_tested_nodes = []
     final_proxies = []
     q_stats = {'🔥极品': 0, '⭐优质': 0, '✅良好': 0, '⚡可用': 0}
+    parallel.start()  # 大订阅的解析进程要在下载线程启动前 fork 出来
     
     # [0] 目录初始化与按需清理
     output_dir = os.path.dirname(OUTPUT_FILE)
@@ -2892,6 +2837,10 @@ async def main():
     print(f"\033[1;36m{curr_time.center(width)}\033[0m")  # 标准加粗居中    
     print("=" * width)
 
+    # 整次运行的时间预算（RUN_DEADLINE_MINUTES），各阶段按剩余时间分配
+    deadline = Deadline.from_env()
+    print(f"⏱️ 运行时间预算: {deadline.describe()}")
+
     # === [1/7] 初始化与网络控制检查 ===
     print("🌐 网络控制配置:")
     print(f"  - 抓取阶段 Warp: {WARP_FOR_SCRAPING}")
@@ -2907,40 +2856,65 @@ async def main():
     preprocess_regex_rules()
     # === [2/7] 加载历史数据 ===
     print("[1/7] 加载历史数据...")
-    existing_proxies, last_message_ids, last_file_update_time = load_existing_proxies_and_state('flclashyaml/TCP.yaml')
+    existing_proxies, last_message_ids, last_file_update_time = load_history('flclashyaml/TCP.yaml')
     print(f"  - 历史节点总数: {len(existing_proxies)}")
     # === [3/7] 抓取新链接与解析 ===
     print("[2/7] 抓取 Telegram 订阅链接...")
     if os.getenv('GITHUB_ACTIONS') == 'true':
         ensure_network_for_stage('scraping', require_warp=WARP_FOR_SCRAPING)
     
-    urls, last_message_ids = await scrape_telegram_links(last_message_ids)
+    # 抓取与下载流水线：频道里每发现一个新链接就投递给下载池，不必等全部频道抓完
+    print(f"  - 边抓取边下载解析 (并发 {FETCH_MAX_CONCURRENCY}, 单域名 {FETCH_PER_HOST}, {deadline.describe()})...")
+    link_queue = LinkQueue()
+    scrape_deadline = deadline.stage(0.15)
+    fetch_deadline = deadline.stage(0.45)
+
+    async def scrape():
+        try:
+            return await scrape_telegram_links(last_message_ids, deadline=scrape_deadline, link_queue=link_queue)
+        finally:
+            link_queue.close()
+
+    scrape_task = asyncio.ensure_future(scrape())
+    engine = FetchEngine(lambda url: download_and_parse(url, deadline=fetch_deadline),
+                         max_concurrency=FETCH_MAX_CONCURRENCY, per_host=FETCH_PER_HOST)
+    results_by_url = {}
+    fetch_started = time.time()
+    async for url, proxies, timing in engine.run_queue(link_queue, deadline=fetch_deadline):
+        results_by_url[url] = proxies
+        done = len(results_by_url)
+        progress = f"    进度: {done}/{len(link_queue)} | {len(proxies)} 个节点 | {timing.elapsed:.1f}s | {url[:70]}..."
+        if done % LOG_PROGRESS_EVERY == 0:
+            log.info(progress, stage='download', url=url, nodes=len(proxies), elapsed=round(timing.elapsed, 3))
+        elif log.DEBUG_ON:
+            log.debug(progress, stage='download', url=url, nodes=len(proxies), elapsed=round(timing.elapsed, 3))
+    _, last_message_ids = await scrape_task
     new_proxies = []
-    if urls:
-        print(f"  - 开始下载解析 {len(urls)} 个链接...")
-        for i, url in enumerate(urls, 1):
-            print(f"    进度: {i}/{len(urls)} | {url[:70]}...")
-            proxies = download_and_parse(url)
-            if proxies:
-                new_proxies.extend(proxies)
-        print(f"  - 解析完成，获得新节点: {len(new_proxies)}")
+    if link_queue.urls:
+        # 按链接发现顺序合并，保证去重与命名结果与完成先后无关
+        node_store = store.get_store()
+        for url in link_queue.urls:
+            new_proxies.extend(results_by_url.get(url, []))
+            if node_store is not None:
+                node_store.upsert(results_by_url.get(url, []), source=url)
+        print(f"  - 解析完成，获得新节点: {len(new_proxies)}，抓取 + 下载耗时 {time.time() - fetch_started:.1f}s")
+        sub_cache.save_cache()
+        parse_cache.save_cache()
+        health.save_tracker()
+        SUB_DOWNLOADER.print_stats()
+        log.summary('download', '订阅下载')
+        log.summary('parse', '订阅解析')
+        health.get_tracker().print_summary()
     else:
         print("  - 未发现新链接，跳过下载步骤")
     # === [4/7] 节点预处理：合并、物理去重、修复非法数据、第一次全局重命名 ===
     print("[3/7] 节点预处理（彻底解决重名与非法数据异常）")
     
-    # 4.1 物理去重：基于 Server/Port/Secret 生成 MD5 Key
-    all_proxies_map = {
-        get_proxy_key(p): p for p in existing_proxies if is_valid_proxy(p)
-    }
-    added_count = 0
-    for p in new_proxies:
-        key = get_proxy_key(p)
-        if key not in all_proxies_map:
-            all_proxies_map[key] = p
-            added_count += 1
-    
-    all_nodes = list(all_proxies_map.values()) # 合并新旧节点
+    # 4.1 物理去重：按协议规范化的节点指纹（nodelib.fingerprint），等价节点在测速前合并，旧节点优先
+    node_index = NodeIndex(p for p in existing_proxies if is_valid_proxy(p))
+    added_count = node_index.extend(new_proxies)
+    
+    all_nodes = [Proxy.from_dict(p) for p in node_index] # 合并新旧节点，之后各阶段按引用传递
     all_nodes = process_proxies_with_fallback(all_nodes)   # 【核心识别】：利用字典识别国家并存入 region_info
     all_nodes = fix_and_filter_ss_nodes(all_nodes, verbose=False)  # 过滤 SS
     all_nodes = sanitize_hysteria_nodes(all_nodes)  # 修复 Hysteria (解决历史数据报错)
@@ -2948,7 +2922,7 @@ async def main():
     all_nodes = [p for p in all_nodes if is_valid_proxy(p)]    
    
     print(f"  - 预处理完成，进入测速阶段的节点数: {len(all_nodes)}")    
-    print(f"  - 物理去重后总数: {len(all_nodes)} (新入库: {added_count})")
+    print(f"  - 物理去重后总数: {len(all_nodes)} (新入库: {added_count}，合并重复: {node_index.duplicates})")
     if not all_nodes:
         print("⚠️ 未发现有效节点，任务优雅退出"); return
 
@@ -2958,7 +2932,9 @@ async def main():
     # 强制修正 SS 的 cipher 缺失，丢弃不符合规范的节点
     all_nodes = fix_and_filter_ss_nodes(all_nodes)
     all_nodes = [p for p in all_nodes if is_valid_proxy(p)]
-    # 4.3 全局第一次重命名：解决 "proxy duplicate name"
+    # 4.3 近期测速失败过的节点先走短超时复测，不通的本次不进入完整测速链
+    all_nodes = reprobe_suspects(all_nodes, deadline=deadline.stage(0.05))
+    # 4.4 全局第一次重命名：解决 "proxy duplicate name"
     # 在进入测速环节前，必须洗一遍名字，确保保存中间文件时不会报错
     all_nodes = normalize_proxy_names(all_nodes)
     print(f"  - 预处理完成，进入测速阶段的节点数: {len(all_nodes)}")
@@ -2966,25 +2942,25 @@ async def main():
     speedtest_path = './xcspeedtest'
     clash_path = './clash_core/clash'
     mode = DETAILED_SPEEDTEST_MODE
-    print(f"[4/7] 执行测速模式: {mode}")
+    print(f"[4/7] 执行测速模式: {mode} ({deadline.describe()})")
     final_tested_nodes = []
     # --- 模式 1: TCP -> Clash -> XC ---
     if mode == 'tcp_clash_xc':
         print("【模式】TCP 粗筛 → Clash 精测 → Speedtest 精测")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('tcp', require_warp=WARP_FOR_TCP)
-        tcp_passed = batch_tcp_test(all_nodes)
+        tcp_passed = batch_tcp_test(all_nodes, deadline=deadline.stage(0.25))
         tcp_passed = normalize_proxy_names(tcp_passed) # 确保存文件前名字唯一
-        save_intermediate_results(tcp_passed, 'TCP.yaml')
+        tcp_saved = save_intermediate_results(tcp_passed, 'TCP.yaml')
         nodes_for_clash = tcp_passed if tcp_passed else all_nodes
         if not tcp_passed: print("  ⚠️ TCP 全部失败，尝试全量进入下阶段")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('speedtest', require_warp=WARP_FOR_SPEEDTEST)
-        clash_passed = batch_test_proxies_clash(clash_path, nodes_for_clash, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls())
+        clash_passed = batch_test_proxies_clash(clash_path, nodes_for_clash, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls(), deadline=deadline.stage(0.5))
         clash_passed = normalize_proxy_names(clash_passed)
-        save_intermediate_results(clash_passed, 'clash.yaml')
+        clash_saved = save_intermediate_results(clash_passed, 'clash.yaml')
         if clash_passed:
-            final_tested_nodes = batch_test_proxies_speedtest(speedtest_path, clash_passed, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls())
+            final_tested_nodes = batch_test_proxies_speedtest(speedtest_path, clash_passed, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls(), deadline=deadline.stage())
             final_tested_nodes = normalize_proxy_names(final_tested_nodes)
             save_intermediate_results(final_tested_nodes, 'speedtest.yaml')
         else:
@@ -2994,13 +2970,13 @@ async def main():
         print("【模式】TCP 粗筛 → Clash 精测")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('tcp', require_warp=WARP_FOR_TCP)
-        tcp_passed = batch_tcp_test(all_nodes)
+        tcp_passed = batch_tcp_test(all_nodes, deadline=deadline.stage(0.25))
         tcp_passed = normalize_proxy_names(tcp_passed)
-        save_intermediate_results(tcp_passed, 'TCP.yaml')
+        tcp_saved = save_intermediate_results(tcp_passed, 'TCP.yaml')
         nodes_for_clash = tcp_passed if tcp_passed else all_nodes
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('speedtest', require_warp=WARP_FOR_SPEEDTEST)
-        final_tested_nodes = batch_test_proxies_clash(clash_path, nodes_for_clash, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls())
+        final_tested_nodes = batch_test_proxies_clash(clash_path, nodes_for_clash, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls(), deadline=deadline.stage())
         final_tested_nodes = normalize_proxy_names(final_tested_nodes)
         save_intermediate_results(final_tested_nodes, 'clash.yaml')
     # --- 模式 3: TCP -> XC ---
@@ -3008,13 +2984,13 @@ async def main():
         print("【模式】TCP 粗筛 → Speedtest 精测")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('tcp', require_warp=WARP_FOR_TCP)
-        tcp_passed = batch_tcp_test(all_nodes)
+        tcp_passed = batch_tcp_test(all_nodes, deadline=deadline.stage(0.25))
         tcp_passed = normalize_proxy_names(tcp_passed)
-        save_intermediate_results(tcp_passed, 'TCP.yaml')
+        tcp_saved = save_intermediate_results(tcp_passed, 'TCP.yaml')
         nodes_for_xc = tcp_passed if tcp_passed else all_nodes
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('speedtest', require_warp=WARP_FOR_SPEEDTEST)
-        final_tested_nodes = batch_test_proxies_speedtest(speedtest_path, nodes_for_xc, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls())
+        final_tested_nodes = batch_test_proxies_speedtest(speedtest_path, nodes_for_xc, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls(), deadline=deadline.stage())
         final_tested_nodes = normalize_proxy_names(final_tested_nodes)
         save_intermediate_results(final_tested_nodes, 'speedtest.yaml')
     # --- 模式 4: 纯 TCP 测速 ---
@@ -3022,7 +2998,7 @@ async def main():
         print("【模式】纯 TCP 测速")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('tcp', require_warp=WARP_FOR_TCP)
-        final_tested_nodes = batch_tcp_test(all_nodes)
+        final_tested_nodes = batch_tcp_test(all_nodes, deadline=deadline.stage())
         final_tested_nodes = normalize_proxy_names(final_tested_nodes)
         save_intermediate_results(final_tested_nodes, 'TCP.yaml')
     # --- 模式 5: 纯 Clash 测速 ---
@@ -3030,7 +3006,7 @@ async def main():
         print("【模式】纯 Clash 测速")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('speedtest', require_warp=WARP_FOR_SPEEDTEST)
-        final_tested_nodes = batch_test_proxies_clash(clash_path, all_nodes, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls())
+        final_tested_nodes = batch_test_proxies_clash(clash_path, all_nodes, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls(), deadline=deadline.stage())
         final_tested_nodes = normalize_proxy_names(final_tested_nodes)
         save_intermediate_results(final_tested_nodes, 'clash.yaml')
     # --- 模式 6: 纯 Speedtest 测速 ---
@@ -3038,11 +3014,13 @@ async def main():
         print("【模式】纯 Speedtest 测速")
         if os.getenv('GITHUB_ACTIONS') == 'true':
             ensure_network_for_stage('speedtest', require_warp=WARP_FOR_SPEEDTEST)
-        final_tested_nodes = batch_test_proxies_speedtest(speedtest_path, all_nodes, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls())
+        final_tested_nodes = batch_test_proxies_speedtest(speedtest_path, all_nodes, max_workers=MAX_TEST_WORKERS, debug=ENABLE_SPEEDTEST_LOG, test_urls=get_test_urls(), deadline=deadline.stage())
         final_tested_nodes = normalize_proxy_names(final_tested_nodes)
         save_intermediate_results(final_tested_nodes, 'speedtest.yaml')
     else:
         print(f"⚠️ 未知模式，优雅退出"); return
+    record_dead_nodes()
+    bloom.save_filter()  # 测速失败记录先落盘：后面筛选为空提前退出时也要保留
     # === [6/7] 后置筛选、评分与排序 ===
     print("[5/7] 测速后置处理与质量评分")
     if os.getenv('GITHUB_ACTIONS') == 'true':
@@ -3076,11 +3054,18 @@ async def main():
     avg_quality = sum(p.get('quality_score', 0) for p in final_proxies) / total_count if total_count > 0 else 0
 
     # 保存 阶段测速结果
-    save_intermediate_results(tcp_passed, os.path.join(output_dir, 'TCP.yaml'), last_message_ids)
-    save_intermediate_results(clash_passed, os.path.join(output_dir, 'clash.yaml'), last_message_ids)
+    save_intermediate_results(tcp_saved, os.path.join(output_dir, 'TCP.yaml'), last_message_ids)
+    save_intermediate_results(clash_saved, os.path.join(output_dir, 'clash.yaml'), last_message_ids)
     save_intermediate_results(speedtest_passed, os.path.join(output_dir, 'speedtest.yaml'), last_message_ids)
     # 保存最终结果（带详细统计等）
     save_final_config(final_proxies, last_message_ids, q_stats)
+    # 节点库：最终评分 / 地区、运行状态，一次提交
+    record_node_results(final_proxies)
+    node_store = store.get_store()
+    if node_store is not None:
+        node_store.set_state('last_message_ids', last_message_ids)
+        node_store.set_state('update_time', update_time)
+    store.save_store()
     
     # 统计质量分布
     q_stats = {'🔥极品': 0, '⭐优质': 0, '✅良好': 0, '⚡可用': 0}
@@ -3102,7 +3087,7 @@ async def main():
             f.write("# ==================================================\n\n")
             
             final_config = {
-                'proxies': final_proxies,
+                'proxies': to_clash_list(final_proxies),
                 'last_message_ids': last_message_ids,
                 'update_time': update_time,
                 'total_nodes': total_count,
@@ -3114,10 +3099,13 @@ async def main():
                     'warp_for_speedtest': WARP_FOR_SPEEDTEST
                 }
             }
-            yaml.dump(final_config, f, allow_unicode=True, sort_keys=False, indent=2, width=4096, default_flow_style=False)
+            yaml_io.dump(final_config, f, allow_unicode=True, sort_keys=False, indent=2, width=4096, default_flow_style=False)
         
         print(f"✅ 成功! 配置文件已保存至: {OUTPUT_FILE}")
         print(f"📊 本次汇总: 总数 {total_count} | 均分 {avg_quality:.1f} | {q_stats_str}")
+        skipped_sources = len(health.get_tracker().skipped)
+        if skipped_sources:
+            print(f"⏭️ 本次跳过退避期内的失效订阅源: {skipped_sources} 个")
     except Exception as e:
         print(f"❌ 最终写出配置文件失败: {e}")
     # === 最终清理，确保切换回GitHub网络 ===
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+nodelib: TelegramNode 各脚本共用的工具模块
+-----------------------------------------
+脚本直接以 `python TelegramNode/xxx.py` 运行时，脚本所在目录会被加入 sys.path，
+因此可以直接 `from nodelib.xxx import ...`；仓库根目录下的脚本需要先把
+TelegramNode 目录加入 sys.path 再导入。
+"""
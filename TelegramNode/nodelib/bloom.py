@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+近期失效节点过滤器（按时间分桶的 Bloom filter，跨运行保存）
+- 历史节点和频道里反复转发的链接，让同一批早就连不上的节点每次运行都重新走一遍
+  TCP → Clash → xcspeedtest 完整测速
+- 停在失败阶段的节点指纹（nodelib.fingerprint）记进 Bloom filter：只记最后进入的那个阶段也失败、
+  且用的是完整超时（没被截止时间收缩）的节点；下次运行在测速前查一下，
+  命中的只做一次低优先级 TCP 复测，通过的才回到完整测速链
+- 按时间分桶老化：每个桶覆盖 DEAD_FILTER_HOURS / DEAD_FILTER_BUCKETS 小时，新失败记在最新的桶里，
+  超出时间窗口的桶整个丢掉；节点最后一次失败后最多 DEAD_FILTER_HOURS 小时就不再被当作失效
+- Bloom filter 只会误报不会漏报：误报（约 DEAD_FILTER_FP）的节点也只是多走一次复测，不会被直接丢弃；
+  单个桶写满 DEAD_FILTER_CAPACITY 个后提前开新桶，保证误报率
+- 文件为 JSON，位图 zlib 压缩后 Base64 保存，放在 .cache/ 下配合 actions/cache 跨运行保留
+环境变量:
+    DEAD_FILTER           设为 false 可关闭
+    DEAD_FILTER_FILE      文件路径，默认 .cache/dead_nodes.json
+    DEAD_FILTER_HOURS     失效记录保留时长（小时），默认 72
+    DEAD_FILTER_BUCKETS   时间窗口分成几个桶，默认 6
+    DEAD_FILTER_CAPACITY  每个桶的设计容量，默认 100000
+    DEAD_FILTER_FP        设计误报率，默认 0.01
+用法:
+    dead = bloom.get_filter()          # 关闭时为 None
+    proxy in dead                      # 近期失败过（可能误报）
+    dead.add_all(failed_proxies)
+    bloom.save_filter()
+"""
+import base64
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from nodelib.fingerprint import fingerprint
+
+FILTER_ENABLED = os.getenv('DEAD_FILTER', 'true').strip().lower() not in ('false', '0', 'no')
+FILTER_FILE = os.getenv('DEAD_FILTER_FILE', os.path.join('.cache', 'dead_nodes.json'))
+FILTER_WINDOW = float(os.getenv('DEAD_FILTER_HOURS', '72')) * 3600
+FILTER_BUCKETS = max(1, int(os.getenv('DEAD_FILTER_BUCKETS', '6')))
+FILTER_CAPACITY = max(1000, int(os.getenv('DEAD_FILTER_CAPACITY', '100000')))
+FILTER_FP_RATE = float(os.getenv('DEAD_FILTER_FP', '0.01'))
+
+FORMAT_VERSION = 1
+
+
+def bloom_size(capacity, error_rate):
+    """容量 n、误报率 p 对应的位数 m 和哈希次数 k。"""
+    bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, int(round(bits / capacity * math.log(2))))
+    return bits, hashes
+
+
+class _Bucket:
+    __slots__ = ('start', 'count', 'bits')
+
+    def __init__(self, start, nbytes, count=0, bits=None):
+        self.start = start
+        self.count = count
+        self.bits = bits if bits is not None else bytearray(nbytes)
+
+
+class DeadNodeFilter:
+
+    def __init__(self, path=FILTER_FILE, window=FILTER_WINDOW, buckets=FILTER_BUCKETS,
+                 capacity=FILTER_CAPACITY, error_rate=FILTER_FP_RATE):
+        self.path = path
+        self.window = window
+        self.bucket_span = window / buckets
+        self.capacity = capacity
+        self.nbits, self.nhashes = bloom_size(capacity, error_rate)
+        self._lock = threading.Lock()
+        self._buckets = []
+        self.added = 0
+        self._load()
+
+    # ----- 位运算 -----
+    def _positions(self, fp):
+        # 双重哈希：指纹本身就是均匀的 16 字节，拆成两个 64 位整数
+        h1 = int.from_bytes(fp[:8], 'little')
+        h2 = int.from_bytes(fp[8:16], 'little') | 1
+        nbits = self.nbits
+        return [(h1 + i * h2) % nbits for i in range(self.nhashes)]
+
+    def _current(self, now):
+        bucket = self._buckets[-1] if self._buckets else None
+        if bucket is None or now - bucket.start >= self.bucket_span or bucket.count >= self.capacity:
+            bucket = _Bucket(now, self.nbits // 8)
+            self._buckets.append(bucket)
+        return bucket
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        self._buckets = [b for b in self._buckets if b.start + self.bucket_span > cutoff]
+
+    # ----- 接口 -----
+    def add(self, proxy, now=None):
+        fp = fingerprint(proxy)
+        if fp is None:
+            return False
+        positions = self._positions(fp)
+        with self._lock:
+            bucket = self._current(now or time.time())
+            bits = bucket.bits
+            for pos in positions:
+                bits[pos >> 3] |= 1 << (pos & 7)
+            bucket.count += 1
+            self.added += 1
+        return True
+
+    def add_all(self, proxies, now=None):
+        now = now or time.time()
+        return sum(1 for proxy in proxies if self.add(proxy, now))
+
+    def __contains__(self, proxy):
+        fp = fingerprint(proxy)
+        if fp is None:
+            return False
+        positions = self._positions(fp)
+        with self._lock:
+            for bucket in self._buckets:
+                bits = bucket.bits
+                if all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+                    return True
+        return False
+
+    def __len__(self):
+        """各桶写入次数之和（同一节点多次失败会重复计数）。"""
+        with self._lock:
+            return sum(b.count for b in self._buckets)
+
+    # ----- 持久化 -----
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ 失效节点过滤器文件损坏，已重建: {e}")
+            return
+        if (not isinstance(data, dict) or data.get('version') != FORMAT_VERSION
+                or data.get('bits') != self.nbits or data.get('hashes') != self.nhashes):
+            return  # 参数变了，旧位图不能再用
+        buckets = []
+        for item in data.get('buckets', []):
+            try:
+                bits = bytearray(zlib.decompress(base64.b64decode(item['data'])))
+                if len(bits) == self.nbits // 8:
+                    buckets.append(_Bucket(float(item['start']), 0, int(item['count']), bits))
+            except Exception:
+                continue
+        self._buckets = sorted(buckets, key=lambda b: b.start)
+        self._expire(time.time())
+
+    def save(self):
+        with self._lock:
+            self._expire(time.time())
+            data = {
+                'version': FORMAT_VERSION,
+                'bits': self.nbits,
+                'hashes': self.nhashes,
+                'buckets': [{'start': round(b.start, 3), 'count': b.count,
+                             'data': base64.b64encode(zlib.compress(bytes(b.bits))).decode('ascii')}
+                            for b in self._buckets],
+            }
+            total = sum(b.count for b in self._buckets)
+        dir_path = os.path.dirname(self.path) or '.'
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        print(f"  🧮 失效节点过滤器: 本次记录 {self.added} 个，{len(data['buckets'])} 个时间桶共 {total} 条")
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_filter() -> DeadNodeFilter | None:
+    """返回进程级共享过滤器；DEAD_FILTER=false 时返回 None。"""
+    global _filter
+    if not FILTER_ENABLED:
+        return None
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = DeadNodeFilter()
+    return _filter
+
+
+def save_filter():
+    if _filter is not None:
+        try:
+            _filter.save()
+        except Exception as e:
+            print(f"⚠️ 保存失效节点过滤器失败: {e}")
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+运行级截止时间（时间预算）
+- GitHub Actions 的 job 有硬性超时，超时会被直接杀掉，连已测好的节点都来不及写出；
+  这里把整次运行的截止时间传给抓取、下载、TCP、Clash、Speedtest 各阶段
+- 各阶段按剩余时间收缩单次超时，到点后不再派发新任务，带着已有结果正常结束
+- 预留 RUN_DEADLINE_RESERVE 秒给最后的评分与写文件
+环境变量:
+    RUN_DEADLINE_MINUTES   整次运行的时间预算（分钟），不设置则不限时
+    RUN_DEADLINE_RESERVE   预留给收尾的秒数，默认 60
+用法:
+    deadline = Deadline.from_env()
+    stage = deadline.stage(0.3)            # 本阶段最多用剩余时间的 30%
+    timeout = stage.timeout(30)            # 单次超时不超过 30 秒，也不超过剩余时间
+    if stage.expired(): ...                # 到点停止派发
+"""
+import asyncio
+import math
+import os
+import time
+
+RESERVE_SECONDS = float(os.getenv('RUN_DEADLINE_RESERVE', '60'))
+MIN_TIMEOUT = 1.0
+
+# 到点后未执行的任务返回这个值，和“测试失败”区分开
+SKIPPED = object()
+
+
+class Deadline:
+    """截止时间；expires_at 为 None 表示不限时。"""
+
+    def __init__(self, expires_at=None, reserve=0.0):
+        self.expires_at = expires_at
+        self.reserve = reserve
+
+    @classmethod
+    def after(cls, seconds, reserve=RESERVE_SECONDS):
+        if seconds is None:
+            return cls()
+        return cls(time.monotonic() + seconds, reserve)
+
+    @classmethod
+    def from_env(cls, name='RUN_DEADLINE_MINUTES'):
+        value = os.getenv(name, '').strip()
+        if not value:
+            return cls()
+        try:
+            minutes = float(value)
+        except ValueError:
+            print(f"⚠️ {name}={value!r} 不是有效数字，按不限时处理")
+            return cls()
+        return cls.after(minutes * 60)
+
+    @property
+    def unlimited(self):
+        return self.expires_at is None
+
+    def remaining(self):
+        """剩余可用秒数（已扣除收尾预留），不限时返回 inf。"""
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - self.reserve - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, preferred, minimum=MIN_TIMEOUT):
+        """单次操作的超时：不超过 preferred，也不超过剩余时间（但至少 minimum 秒）。"""
+        return max(minimum, min(preferred, self.remaining()))
+
+    def stage(self, share=1.0):
+        """
+        为下一个阶段划出预算：最多使用当前剩余时间的 share 比例。
+        前面阶段提前结束省下的时间会自动留给后面的阶段。
+        """
+        if self.expires_at is None:
+            return Deadline()
+        budget = self.remaining() * min(max(share, 0.0), 1.0)
+        return Deadline(time.monotonic() + budget, 0.0)
+
+    def describe(self):
+        if self.expires_at is None:
+            return '不限时'
+        return f"剩余 {self.remaining() / 60:.1f} 分钟"
+
+
+def workers_for(count, max_workers):
+    """任务数少于线程上限时不必开满线程。"""
+    return max(1, min(max_workers, count))
+
+
+async def gather_until(coros, deadline=None):
+    """
+    asyncio.gather(..., return_exceptions=True) 的限时版：
+    到点还没完成的任务会被取消，结果位置用 asyncio.TimeoutError 占位。
+    """
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    if not tasks:
+        return []
+    timeout = None if deadline is None or deadline.unlimited else deadline.remaining()
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    results = []
+    for task in tasks:
+        if task in pending or task.cancelled():
+            results.append(asyncio.TimeoutError('时间预算用尽'))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+进程内多策略订阅下载器（替代 wget / curl 子进程）
+- 原来每个链接要 fork 一次 wget、再 fork 一次 curl，整段内容还要经管道按文本解码一遍；
+  现在所有策略都在进程内走共享连接池（nodelib.http_client）和条件请求缓存（nodelib.sub_cache）
+- 每个策略只在上一次失败的类型适合它时才出手，死链不会被同样的超时反复拖三遍:
+    direct    首选：指定 UA + 指定证书校验方式
+    insecure  证书错误时关闭校验重试（相当于 wget --no-check-certificate / curl -k）；其余策略沿用调用方的 verify，
+              但同一次下载出现过证书错误后，之后的策略也都不再校验
+    retry     连接被重置 / 5xx 等瞬时错误时稍等再试一次（相当于 wget --tries=2）
+    alt-ua    403 / 空内容时换成 Clash.Meta UA 再试（部分面板只认特定客户端）
+- 重定向由 requests 自动跟随（上限 30 次，与 curl -L / wget 默认行为一致）
+- fetch_stream() 按块交给调用方边收边解析，单个订阅超过大小上限时直接放弃
+- 记录每个策略的成功次数与耗时；长期失败的兜底策略会被自动排到最后
+"""
+import threading
+import time
+from typing import NamedTuple
+
+import requests
+
+from nodelib import http_client, sniff, sub_cache
+from nodelib.stream import BodyTooLarge
+
+ALT_UA = 'clash.meta'
+RETRY_PAUSE = 1.0           # 瞬时错误重试前的等待（秒）
+DEMOTE_MIN_ATTEMPTS = 8     # 至少尝试多少次后才参与降级排序
+
+# 失败类型
+ERR_TIMEOUT = 'timeout'
+ERR_TLS = 'tls'
+ERR_CONNECTION = 'connection'
+ERR_REJECTED = 'rejected'   # 401/403/406 等拒绝访问
+ERR_HTTP_4XX = 'http_4xx'
+ERR_HTTP_5XX = 'http_5xx'
+ERR_EMPTY = 'empty'
+ERR_TOO_LARGE = 'too_large'
+ERR_OTHER = 'other'
+
+
+class EmptyContent(Exception):
+    """服务器返回 200 但内容为空。"""
+
+
+class Strategy(NamedTuple):
+    name: str
+    user_agent: str
+    verify: bool
+    when: tuple = ()        # 上一次失败属于这些类型时才执行；空元组表示总是执行
+    pause: float = 0.0      # 执行前等待的秒数
+
+
+class DownloadResult(NamedTuple):
+    content: object         # fetch 为字符串，fetch_stream 为 consume 的返回值；失败为 None
+    strategy: str | None    # 成功的策略名，失败为 None
+    from_cache: bool        # 是否命中 304 本地缓存
+    error: str | None       # 最后一次失败的描述
+    tried: tuple            # 实际执行过的策略名
+    kind: str | None = None  # 最后一次失败的类型（ERR_*）
+
+
+def classify_error(exc):
+    """把 requests 异常归类成失败类型，决定后续由哪个策略接手。"""
+    if isinstance(exc, requests.exceptions.SSLError):
+        return ERR_TLS
+    if isinstance(exc, requests.exceptions.Timeout):
+        return ERR_TIMEOUT
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return ERR_CONNECTION
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        if status in (401, 403, 406):
+            return ERR_REJECTED
+        return ERR_HTTP_5XX if status >= 500 else ERR_HTTP_4XX
+    return ERR_OTHER
+
+
+def build_chain(user_agent=http_client.CLASH_UA, verify=True):
+    """按 wget → curl → requests 原有能力组装的默认策略链；只有 insecure 策略会关闭证书校验。"""
+    chain = [Strategy('direct', user_agent, verify)]
+    if verify:
+        chain.append(Strategy('insecure', user_agent, False, when=(ERR_TLS,)))
+    chain.append(Strategy('retry', user_agent, verify, when=(ERR_CONNECTION, ERR_HTTP_5XX), pause=RETRY_PAUSE))
+    chain.append(Strategy('alt-ua', ALT_UA, verify, when=(ERR_REJECTED, ERR_EMPTY)))
+    return chain
+
+
+class Downloader:
+    """
+    按策略链顺序下载订阅，线程安全，可在 FetchEngine 的线程池里共用一个实例。
+    用法:
+        downloader = Downloader(build_chain('Clash', verify=True), timeout=30)
+        result = downloader.fetch(url)
+    """
+
+    def __init__(self, strategies, timeout=30):
+        self.strategies = list(strategies)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {s.name: {'attempts': 0, 'success': 0, 'elapsed': 0.0} for s in self.strategies}
+
+    def _record(self, name, ok, elapsed):
+        with self._lock:
+            stat = self._stats[name]
+            stat['attempts'] += 1
+            stat['success'] += int(ok)
+            stat['elapsed'] += elapsed
+
+    def ordered(self):
+        """首选策略固定在前；兜底策略中长期零成功的排到最后，其余保持原顺序。"""
+        head, rest = self.strategies[:1], self.strategies[1:]
+        with self._lock:
+            stats = {name: dict(stat) for name, stat in self._stats.items()}
+
+        def useless(strategy):
+            stat = stats[strategy.name]
+            return stat['attempts'] >= DEMOTE_MIN_ATTEMPTS and stat['success'] == 0
+
+        return head + [s for s in rest if not useless(s)] + [s for s in rest if useless(s)]
+
+    def _run(self, url, attempt, timeout):
+        """按策略链依次调用 attempt(strategy, timeout) -> (value, from_cache)，直到某个策略成功。"""
+        timeout = timeout or self.timeout
+        last_kind, last_error = None, None
+        insecure = False    # 出现过证书错误后，后面的策略都不再校验证书，否则换 UA / 重试都会卡在同一个 TLS 错误上
+        tried = []
+        for strategy in self.ordered():
+            if strategy.when and last_kind not in strategy.when:
+                continue
+            if insecure and strategy.verify:
+                strategy = strategy._replace(verify=False)
+            if strategy.pause:
+                time.sleep(strategy.pause)
+            tried.append(strategy.name)
+            started = time.monotonic()
+            try:
+                value, from_cache = attempt(strategy, timeout)
+            except EmptyContent as e:
+                self._record(strategy.name, False, time.monotonic() - started)
+                last_kind, last_error = ERR_EMPTY, str(e)
+                continue
+            except BodyTooLarge as e:
+                # 换策略也不会变小，直接放弃
+                self._record(strategy.name, False, time.monotonic() - started)
+                last_kind, last_error = ERR_TOO_LARGE, str(e)
+                break
+            except Exception as e:
+                self._record(strategy.name, False, time.monotonic() - started)
+                last_kind, last_error = classify_error(e), str(e)
+                insecure = insecure or last_kind == ERR_TLS
+                continue
+            self._record(strategy.name, True, time.monotonic() - started)
+            return DownloadResult(value, strategy.name, from_cache, None, tuple(tried))
+        return DownloadResult(None, None, False, last_error, tuple(tried), last_kind)
+
+    def fetch(self, url, timeout=None):
+        """下载完整内容，DownloadResult.content 为解码后的字符串。"""
+        def attempt(strategy, timeout):
+            body, from_cache = sub_cache.cached_get(
+                url, user_agent=strategy.user_agent, timeout=timeout, verify=strategy.verify
+            )
+            encoding, _ = sniff.detect_encoding(body[:sniff.SNIFF_BYTES])
+            content = body.decode(encoding, errors='ignore')
+            if not content.strip():
+                raise EmptyContent('返回内容为空')
+            return content, from_cache
+
+        return self._run(url, attempt, timeout)
+
+    def fetch_stream(self, url, consume, timeout=None):
+        """
+        流式下载：consume(body) 逐块消费 sub_cache.BodyStream 并返回结果，
+        DownloadResult.content 即 consume 的返回值。consume 中途抛出网络异常时换下一个策略。
+        """
+        def attempt(strategy, timeout):
+            with sub_cache.open_stream(url, user_agent=strategy.user_agent, timeout=timeout,
+                                       verify=strategy.verify) as body:
+                value = consume(body)
+                if not body.size:
+                    raise EmptyContent('返回内容为空')
+                return value, body.from_cache
+
+        return self._run(url, attempt, timeout)
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stat) for name, stat in self._stats.items()}
+
+    def print_stats(self, title='下载策略统计'):
+        parts = []
+        for name, stat in self.stats().items():
+            if not stat['attempts']:
+                continue
+            avg = stat['elapsed'] / stat['attempts']
+            parts.append(f"{name} {stat['success']}/{stat['attempts']} 成功 (平均 {avg:.1f}s)")
+        if parts:
+            print(f"  📊 {title}: " + ' | '.join(parts))
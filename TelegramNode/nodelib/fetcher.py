@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+并发订阅下载引擎
+- 全局并发上限 + 单域名并发上限（同一机场面板不会被几十个请求同时打爆）
+- 下载函数本身保持同步写法（反爬绕过 → 条件请求缓存 → wget → curl 的回退链由下载函数自己负责），
+  由引擎丢进线程池执行
+- 按完成先后逐个返回 (url, proxies, timing)
+- 支持流水线模式：抓取端通过 LinkQueue 边发现边投递链接，下载与抓取同时进行
+"""
+import asyncio
+import concurrent.futures
+import time
+from collections import defaultdict
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+
+class FetchTiming(NamedTuple):
+    wait: float     # 排队等待并发名额的时间（秒）
+    elapsed: float  # 下载 + 解析实际耗时（秒）
+
+
+class FetchEngine:
+    """
+    有界并发的异步下载引擎。
+    参数:
+        worker: 同步函数 worker(url) -> list，通常就是 download_and_parse
+        max_concurrency: 全局同时进行的下载数
+        per_host: 同一域名同时进行的下载数
+    """
+
+    def __init__(self, worker, max_concurrency=32, per_host=4):
+        self.worker = worker
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.per_host = max(1, int(per_host))
+
+    async def _run_one(self, url, executor, global_sem, host_sems):
+        loop = asyncio.get_running_loop()
+        host = (urlparse(url).hostname or '').lower()
+        queued_at = time.monotonic()
+        # 先拿域名名额再拿全局名额，避免占着全局名额干等同域名的请求
+        async with host_sems[host]:
+            async with global_sem:
+                started_at = time.monotonic()
+                try:
+                    proxies = await loop.run_in_executor(executor, self.worker, url)
+                except Exception as e:
+                    print(f"  ⚠️ 下载任务异常: {url[:70]} → {e}")
+                    proxies = []
+        finished_at = time.monotonic()
+        return url, proxies or [], FetchTiming(started_at - queued_at, finished_at - started_at)
+
+    async def run(self, urls, deadline=None):
+        """
+        异步生成器：所有链接同时排队，按完成顺序产出 (url, proxies, timing)。
+        传入 deadline（nodelib.deadline.Deadline）时，到点后放弃还没完成的链接。
+        """
+        links = LinkQueue()
+        for url in urls:
+            links.publish(url)
+        links.close()
+        async for result in self.run_queue(links, deadline=deadline):
+            yield result
+
+    async def run_queue(self, links, deadline=None):
+        """
+        流水线模式：一边从 LinkQueue 取链接一边下载，按完成顺序产出 (url, proxies, timing)。
+        生产端 close() 且已入队的链接全部处理完后结束；deadline 的含义同 run()。
+        """
+        global_sem = asyncio.Semaphore(self.max_concurrency)
+        host_sems = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix='fetch'
+        )
+        pending = set()
+        getter = None
+        closed = False
+        try:
+            while not closed or pending:
+                if not closed and getter is None:
+                    getter = asyncio.ensure_future(links.get())
+                waiting = pending | ({getter} if getter else set())
+                timeout = None if deadline is None or deadline.unlimited else deadline.remaining()
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"  ⏰ 下载阶段时间预算用尽，放弃未完成的 {len(pending) + links.backlog()} 个链接")
+                    break
+                for task in done:
+                    if task is getter:
+                        getter = None
+                        url = task.result()
+                        if url is None:
+                            closed = True
+                        else:
+                            pending.add(asyncio.ensure_future(self._run_one(url, executor, global_sem, host_sems)))
+                    else:
+                        pending.discard(task)
+                        yield task.result()
+        finally:
+            for task in pending | ({getter} if getter else set()):
+                task.cancel()
+            # 不等已经在跑的下载：到点后它们会在后台自己结束（单次请求有超时），
+            # 结果不再计入本次运行；写到一半的缓存临时文件由 sub_cache.save() 保留，下次运行再清理
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LinkQueue:
+    """
+    抓取 → 下载之间的去重队列。
+    - publish() 是同步的，抓取协程发现一个链接就可以立刻丢进来，重复链接只入队一次
+    - close() 表示不会再有新链接，消费端处理完已入队的链接后结束
+    - urls 按首次发现的顺序记录所有入队过的链接
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._seen = set()
+        self._closed = False
+        self._taken = 0
+        self.urls = []
+
+    def publish(self, url):
+        if self._closed or url in self._seen:
+            return False
+        self._seen.add(url)
+        self.urls.append(url)
+        self._queue.put_nowait(url)
+        return True
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put_nowait(None)
+
+    async def get(self):
+        """取下一个链接；返回 None 表示已经结束。"""
+        url = await self._queue.get()
+        if url is not None:
+            self._taken += 1
+        return url
+
+    def backlog(self):
+        """还没被取走的链接数。"""
+        return len(self.urls) - self._taken
+
+    def __len__(self):
+        return len(self.urls)
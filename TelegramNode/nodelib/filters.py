@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+节点筛选规则下推
+- 协议白名单、SS 加密方式白名单、地区白名单原来都在全部节点解析、识别、改名之后才检查，
+  要丢弃的节点照样被解码、建 dict、参与去重
+- FilterSpec 把这些规则集中起来，各环节在最早能判断的地方检查：
+    协议      nodelib.protocols.parse_line 看到协议头就判断，不再解码链接正文（如 vmess 的 Base64 + JSON）
+    SS 加密   parse_ss_node 解出加密方式后、建节点 dict 之前判断；YAML 订阅在构造节点对象之前判断
+    地区      脚本识别出地区后立即判断，不再参与改名和测速
+- 规则由脚本在导入时 install()，要早于 parallel.start() fork 出解析进程；没有安装时不筛选
+- 被筛掉的链接按“不是节点链接”处理：不计入成功 / 失败数，也不写入链接解析缓存；
+  缓存命中的节点同样要过一遍规则（缓存可能是没装规则的脚本写的）；
+  订阅级的解析结果缓存（nodelib.sub_cache）以 signature() 为键的一部分，规则变了就重新解析
+用法:
+    filters.install(FilterSpec(types={'vmess', 'ss'}, ss_ciphers={'aes-128-gcm'}))
+    spec = filters.active()
+    spec.keeps_type('vless'), spec.keeps_cipher('rc4-md5'), spec.keeps_region('香港'), spec.accepts(proxy)
+"""
+
+# 解析函数返回这个标记表示节点被筛选规则丢弃（区别于解析失败的 None）
+DROPPED = object()
+
+
+def _normalize(values, lower=True):
+    if values is None:
+        return None
+    return frozenset(str(v).strip().lower() if lower else v for v in values)
+
+
+class FilterSpec:
+    """各项为 None 表示不限制；没有任何限制的规则为假值。"""
+
+    __slots__ = ('types', 'ss_ciphers', 'regions')
+
+    def __init__(self, types=None, ss_ciphers=None, regions=None):
+        self.types = _normalize(types)                  # 保留的协议（Clash type，小写）
+        self.ss_ciphers = _normalize(ss_ciphers)        # 保留的 SS 加密方式（小写）
+        self.regions = _normalize(regions, lower=False) # 保留的地区（中文名）
+
+    def __bool__(self):
+        return self.types is not None or self.ss_ciphers is not None or self.regions is not None
+
+    def __repr__(self):
+        return f"FilterSpec(types={self.types}, ss_ciphers={self.ss_ciphers}, regions={self.regions})"
+
+    def signature(self):
+        """解析阶段生效的规则（协议、SS 加密方式）的文本签名，用作解析结果缓存键的一部分；地区在解析之后才筛。"""
+        def part(values):
+            return '*' if values is None else ','.join(sorted(values))
+        return f"types={part(self.types)};ss={part(self.ss_ciphers)}"
+
+    def keeps_type(self, node_type):
+        return self.types is None or str(node_type).strip().lower() in self.types
+
+    def keeps_cipher(self, cipher):
+        return self.ss_ciphers is None or str(cipher).strip().lower() in self.ss_ciphers
+
+    def keeps_region(self, region_name):
+        return self.regions is None or region_name in self.regions
+
+    def accepts(self, proxy):
+        """已经建好的节点（dict / Proxy）：检查协议和 SS 加密方式。"""
+        node_type = proxy.get('type')
+        if not self.keeps_type(node_type):
+            return False
+        if str(node_type).strip().lower() == 'ss':
+            return self.keeps_cipher(proxy.get('cipher', ''))
+        return True
+
+
+_active = FilterSpec()
+
+
+def install(spec):
+    global _active
+    _active = spec if spec is not None else FilterSpec()
+
+
+def active() -> FilterSpec:
+    return _active
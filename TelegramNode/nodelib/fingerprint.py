@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+节点指纹 + 去重索引（各脚本共用）
+- 原来各脚本的去重 key 各不相同：choutuan-all1 用 password 优先、Telegram 脚本用 uuid 优先、
+  All-in-one 缺密钥时退回节点名、merge_subscriptions 完全不去重只改名；都是拼 f-string 再 MD5
+- fingerprint() 按协议规范化后再哈希，同一个节点从不同来源（链接 / YAML、大小写、缺省值写法不同）得到同一指纹：
+    协议      小写，别名归一（shadowsocks → ss、hy2 → hysteria2）
+    地址      小写、去掉 IPv6 方括号和末尾的点；端口转 int
+    密钥      按协议取 uuid / password / cipher / auth 等，不再依赖字段优先级
+    传输参数  network、ws / h2 / http 路径和 Host、grpc 服务名、sni、flow、reality 公钥、混淆参数等
+              （同一 server:port 上不同路径 / sni 的是不同节点，不能合并）
+- 哈希用带密钥的 blake2b（16 字节摘要，比 MD5 快，且指纹不能从外部构造碰撞）；
+  密钥可用 NODE_FP_KEY 指定，默认固定值，保证多次运行之间指纹稳定
+- NodeIndex 是以指纹为键的字典，所有合并路径都用它：等价节点在进入测速之前就合并掉，先到的保留
+用法:
+    index = NodeIndex()
+    index.add(proxy)              # 新节点返回 True，重复 / 无法识别返回 False
+    index.extend(proxies)         # 返回新增个数
+    list(index), len(index), index.duplicates
+"""
+import hashlib
+import os
+
+DIGEST_SIZE = 16
+_KEY = os.getenv('NODE_FP_KEY', 'nodelib-node-fp-v1').encode('utf-8')[:64]
+
+_TYPE_ALIASES = {
+    'shadowsocks': 'ss',
+    'shadowsocksr': 'ssr',
+    'hy2': 'hysteria2',
+    'hy': 'hysteria',
+    'socks': 'socks5',
+    'wg': 'wireguard',
+}
+
+# 各协议参与指纹的密钥字段（按顺序拼接；值统一转成字符串）
+# 元组表示同一个密钥的几种写法，取第一个非空的：hysteria2 分享链接解析出 auth，Clash YAML 里是 password
+_SECRET_FIELDS = {
+    'ss': ('cipher', 'password'),
+    'ssr': ('cipher', 'password', 'protocol', 'protocol-param', 'obfs', 'obfs-param'),
+    'vmess': ('uuid', 'alterId', 'cipher'),
+    'vless': ('uuid', 'flow', 'encryption'),
+    'trojan': ('password',),
+    'hysteria': (('auth-str', 'auth'), 'protocol', 'obfs'),
+    'hysteria2': (('password', 'auth'), 'obfs', 'obfs-password'),
+    'tuic': ('uuid', 'password'),
+    'anytls': ('password',),
+    'snell': ('psk', 'version'),
+    'socks5': ('username', 'password'),
+    'http': ('username', 'password'),
+    'wireguard': ('private-key', 'public-key', 'ip'),
+}
+_DEFAULT_SECRET_FIELDS = ('uuid', 'password')
+# 大小写不敏感的字段
+_LOWER_FIELDS = frozenset(('uuid', 'cipher', 'flow', 'encryption', 'protocol', 'obfs'))
+# 写法不同但含义相同的缺省值
+_EMPTY_DEFAULTS = {'alterId': '0', 'encryption': 'none', 'cipher': 'auto', 'flow': ''}
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else ''
+    return str(value).strip()
+
+
+def _host(value):
+    host = _text(value).lower().rstrip('.')
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    return host
+
+
+def _port(value):
+    try:
+        return str(int(str(value).strip()))
+    except (TypeError, ValueError):
+        return _text(value)
+
+
+def _path(value):
+    path = _text(value)
+    return path if path else '/'
+
+
+def _header_host(opts):
+    headers = opts.get('headers') if isinstance(opts, dict) else None
+    if not isinstance(headers, dict):
+        return ''
+    for key, value in headers.items():
+        if str(key).lower() == 'host':
+            if isinstance(value, (list, tuple)):
+                value = value[0] if value else ''
+            return _host(value)
+    return ''
+
+
+def _opts(proxy, key):
+    value = proxy.get(key)
+    return value if isinstance(value, dict) else {}
+
+
+def _transport(proxy, node_type):
+    """传输层参数：network + 各传输的路径 / Host / 服务名，TLS 的 sni，reality 公钥，SS 插件。"""
+    network = _text(proxy.get('network')).lower() or 'tcp'
+    parts = [network]
+    if network == 'ws':
+        opts = _opts(proxy, 'ws-opts')
+        host = _header_host(opts) or _header_host({'headers': proxy.get('ws-headers')})  # 旧版 Clash 写法
+        parts += [_path(opts.get('path') or proxy.get('ws-path')), host]
+    elif network == 'grpc':
+        parts.append(_text(_opts(proxy, 'grpc-opts').get('grpc-service-name')))
+    elif network == 'h2':
+        opts = _opts(proxy, 'h2-opts')
+        hosts = opts.get('host') or []
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        parts += [_path(opts.get('path')), ','.join(sorted(_host(h) for h in hosts))]
+    elif network == 'http':
+        opts = _opts(proxy, 'http-opts')
+        paths = opts.get('path') or ['/']
+        if isinstance(paths, str):
+            paths = [paths]
+        parts += [','.join(sorted(_path(p) for p in paths)), _header_host(opts)]
+    tls = proxy.get('tls')
+    if node_type in ('vmess', 'vless'):
+        parts.append('tls' if tls else '')
+    parts.append(_host(proxy.get('sni') or proxy.get('servername')))
+    reality = _opts(proxy, 'reality-opts')
+    if reality:
+        parts += [_text(reality.get('public-key')), _text(reality.get('short-id'))]
+    if node_type == 'ss' and proxy.get('plugin'):
+        plugin_opts = _opts(proxy, 'plugin-opts')
+        parts += [_text(proxy.get('plugin')).lower(), _text(plugin_opts.get('mode')).lower(),
+                  _host(plugin_opts.get('host')), _text(plugin_opts.get('path'))]
+    return parts
+
+
+def canonical(proxy):
+    """规范化后的指纹字段列表；缺少 server / port 的节点返回 None。"""
+    server = _host(proxy.get('server'))
+    port = _port(proxy.get('port'))
+    if not server or not port:
+        return None
+    node_type = _text(proxy.get('type')).lower()
+    node_type = _TYPE_ALIASES.get(node_type, node_type)
+    parts = [node_type, server, port]
+    for field in _SECRET_FIELDS.get(node_type, _DEFAULT_SECRET_FIELDS):
+        if isinstance(field, tuple):
+            value = next((v for v in (_text(proxy.get(name)) for name in field) if v), '')
+            field = field[0]
+        else:
+            value = _text(proxy.get(field))
+        if field in _LOWER_FIELDS:
+            value = value.lower()
+        if value == _EMPTY_DEFAULTS.get(field):
+            value = ''
+        parts.append(value)
+    parts += _transport(proxy, node_type)
+    return parts
+
+
+def fingerprint(proxy):
+    """节点指纹（16 字节）；不是节点或缺少 server / port 时返回 None。"""
+    try:
+        parts = canonical(proxy)
+    except (AttributeError, TypeError):
+        return None
+    if parts is None:
+        return None
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=DIGEST_SIZE, key=_KEY).digest()
+
+
+class NodeIndex:
+    """以指纹为键的节点索引：先加入的节点保留，之后的等价节点计入 duplicates。"""
+
+    def __init__(self, proxies=None):
+        self._nodes = {}
+        self.duplicates = 0
+        self.invalid = 0
+        if proxies:
+            self.extend(proxies)
+
+    def add(self, proxy):
+        key = fingerprint(proxy)
+        if key is None:
+            self.invalid += 1
+            return False
+        if key in self._nodes:
+            self.duplicates += 1
+            return False
+        self._nodes[key] = proxy
+        return True
+
+    def extend(self, proxies):
+        return sum(1 for proxy in proxies if self.add(proxy))
+
+    def get(self, proxy, default=None):
+        key = fingerprint(proxy)
+        return self._nodes.get(key, default) if key is not None else default
+
+    def __contains__(self, proxy):
+        key = fingerprint(proxy)
+        return key is not None and key in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._nodes.values())
+
+    def nodes(self):
+        return list(self._nodes.values())
+
+
+def _self_check():
+    """同一节点的分享链接和 Clash YAML 写法指纹一致，不同凭据的节点指纹不同。"""
+    from nodelib.protocols import parse_line
+
+    def from_link(link):
+        return fingerprint(parse_line(link)[1])
+
+    cases = [
+        ('hysteria2 链接 / YAML', from_link('hysteria2://alice@h.com:443?sni=h.com#a'),
+         fingerprint({'name': 'b', 'type': 'hysteria2', 'server': 'H.com', 'port': 443, 'password': 'alice', 'sni': 'h.com'}), True),
+        ('hysteria2 不同用户', from_link('hysteria2://alice@h.com:443#a'), from_link('hysteria2://bob@h.com:443#a'), False),
+        ('hysteria auth / auth-str', fingerprint({'type': 'hysteria', 'server': 'h.com', 'port': 443, 'auth': 'x'}),
+         fingerprint({'type': 'hysteria', 'server': 'h.com', 'port': 443, 'auth-str': 'x'}), True),
+    ]
+    bad = 0
+    for title, a, b, same in cases:
+        ok = a is not None and b is not None and (a == b) == same
+        bad += not ok
+        print(f"{'✅' if ok else '❌'} {title}: {'相同' if a == b else '不同'}")
+    return bad
+
+
+if __name__ == '__main__':
+    raise SystemExit(1 if _self_check() else 0)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+订阅源健康记录（跨运行熔断 + 负缓存）
+- 按 URL 和按域名分别记录：连续失败次数、上次成功时间、失败类型、下次重试时间
+- 连续失败后按指数退避：退避期内的 URL 直接跳过；退避期满后先用短超时探测，
+  恢复后自动回到正常超时；短超时连续探测失败 SUB_HEALTH_PROBE_LIMIT 次后改回正常超时重试，
+  只是慢、短超时内下载不完的订阅源仍有机会恢复
+- 下载成功但解析不出节点（内容为空壳 / 节点全被筛选规则丢掉）不算失败，不退避，只清掉连续失败记录
+- 域名级记录只统计连接层失败（超时 / 连接失败 / 证书错误），同一面板的新链接也会改用短超时
+- 跳过的订阅源汇总到运行结果里，方便排查
+环境变量:
+    SUB_HEALTH              设为 false 可关闭
+    SUB_HEALTH_FILE         记录文件，默认 .cache/health.json
+    SUB_HEALTH_BACKOFF_MIN  首次退避时长（分钟），默认 60，之后每次翻倍
+    SUB_HEALTH_BACKOFF_MAX  最长退避（小时），默认 72
+    SUB_HEALTH_PROBE_TIMEOUT  探测超时（秒），默认 8
+    SUB_HEALTH_PROBE_LIMIT    连续几次短超时探测失败后改用正常超时，默认 2
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+HEALTH_ENABLED = os.getenv('SUB_HEALTH', 'true').strip().lower() not in ('false', '0', 'no')
+HEALTH_FILE = os.getenv('SUB_HEALTH_FILE', os.path.join('.cache', 'health.json'))
+BACKOFF_BASE = float(os.getenv('SUB_HEALTH_BACKOFF_MIN', '60')) * 60
+BACKOFF_MAX = float(os.getenv('SUB_HEALTH_BACKOFF_MAX', '72')) * 3600
+PROBE_TIMEOUT = float(os.getenv('SUB_HEALTH_PROBE_TIMEOUT', '8'))
+PROBE_LIMIT = max(0, int(os.getenv('SUB_HEALTH_PROBE_LIMIT', '2')))
+HOST_FAIL_THRESHOLD = 3          # 域名连续失败多少次后，新链接也改用短超时
+RECORD_TTL = 30 * 24 * 3600      # 超过 30 天没有动静的记录直接清理
+
+# 决策
+ACTION_FETCH = 'fetch'   # 正常下载
+ACTION_PROBE = 'probe'   # 用短超时探测
+ACTION_SKIP = 'skip'     # 退避期内，直接跳过
+
+# 只有这些失败说明整个域名有问题
+HOST_LEVEL_FAILURES = ('timeout', 'connection', 'tls')
+
+
+def _host(url):
+    try:
+        return (urlparse(url).hostname or '').lower()
+    except ValueError:
+        return ''
+
+
+def _backoff(failures):
+    return min(BACKOFF_BASE * (2 ** max(0, failures - 1)), BACKOFF_MAX)
+
+
+class HealthTracker:
+    """线程安全的订阅源健康记录，可在下载线程池里共用。"""
+
+    def __init__(self, path=HEALTH_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.urls = {}
+        self.hosts = {}
+        self.skipped = []    # 本次运行跳过的 (url, 失败类型, 连续失败次数)
+        self.probed = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.urls = data.get('urls', {}) or {}
+            self.hosts = data.get('hosts', {}) or {}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ 订阅健康记录损坏，已重建: {e}")
+
+    def save(self):
+        now = time.time()
+        with self._lock:
+            for table in (self.urls, self.hosts):
+                for key in [k for k, rec in table.items()
+                            if now - max(rec.get('last_success') or 0, rec.get('last_failure') or 0,
+                                         rec.get('last_empty') or 0) > RECORD_TTL]:
+                    del table[key]
+            data = json.dumps({'urls': self.urls, 'hosts': self.hosts}, ensure_ascii=False, indent=1)
+        dir_path = os.path.dirname(self.path) or '.'
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-health-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def check(self, url):
+        """返回 (动作, 建议超时或 None)。"""
+        now = time.time()
+        with self._lock:
+            rec = self.urls.get(url)
+            if rec and rec.get('failures', 0) > 0:
+                if now < rec.get('next_retry_at', 0):
+                    self.skipped.append((url, rec.get('failure_type'), rec['failures']))
+                    return ACTION_SKIP, None
+                # 第一次失败用的是正常超时，之后 PROBE_LIMIT 次用短超时，再往后回到正常超时
+                if rec['failures'] > PROBE_LIMIT:
+                    return ACTION_FETCH, None
+                self.probed += 1
+                return ACTION_PROBE, PROBE_TIMEOUT
+            host_rec = self.hosts.get(_host(url))
+            if host_rec and HOST_FAIL_THRESHOLD <= host_rec.get('failures', 0) < HOST_FAIL_THRESHOLD + PROBE_LIMIT:
+                self.probed += 1
+                return ACTION_PROBE, PROBE_TIMEOUT
+        return ACTION_FETCH, None
+
+    @staticmethod
+    def _fail(rec, kind, now):
+        rec['failures'] = rec.get('failures', 0) + 1
+        rec['failure_type'] = kind
+        rec['last_failure'] = now
+        rec['next_retry_at'] = now + _backoff(rec['failures'])
+
+    def record_success(self, url):
+        now = time.time()
+        with self._lock:
+            for table, key in ((self.urls, url), (self.hosts, _host(url))):
+                rec = table.setdefault(key, {})
+                rec.update({'failures': 0, 'failure_type': None, 'last_success': now, 'next_retry_at': 0})
+
+    def record_empty(self, url):
+        """下载成功但没有节点：站点是通的，清掉连续失败记录，但不算成功。"""
+        now = time.time()
+        with self._lock:
+            for table, key in ((self.urls, url), (self.hosts, _host(url))):
+                rec = table.setdefault(key, {})
+                rec.update({'failures': 0, 'failure_type': None, 'last_empty': now, 'next_retry_at': 0})
+
+    def record_failure(self, url, kind):
+        now = time.time()
+        with self._lock:
+            self._fail(self.urls.setdefault(url, {}), kind or 'other', now)
+            if kind in HOST_LEVEL_FAILURES:
+                self._fail(self.hosts.setdefault(_host(url), {}), kind, now)
+
+    def print_summary(self, limit=10):
+        if self.probed:
+            print(f"  🩺 短超时探测近期失败的订阅源 {self.probed} 个")
+        if not self.skipped:
+            return
+        print(f"  ⏭️ 退避期内跳过失效订阅源 {len(self.skipped)} 个:")
+        for url, kind, failures in self.skipped[:limit]:
+            print(f"     - [{kind}] 连续失败 {failures} 次: {url[:80]}")
+        if len(self.skipped) > limit:
+            print(f"     ... 其余 {len(self.skipped) - limit} 个省略")
+
+
+class _Disabled:
+    """SUB_HEALTH=false 时的空实现。"""
+    skipped = ()
+    probed = 0
+
+    def check(self, url):
+        return ACTION_FETCH, None
+
+    def record_success(self, url):
+        pass
+
+    def record_empty(self, url):
+        pass
+
+    def record_failure(self, url, kind):
+        pass
+
+    def save(self):
+        pass
+
+    def print_summary(self, limit=10):
+        pass
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """返回进程级共享的健康记录。"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = HealthTracker() if HEALTH_ENABLED else _Disabled()
+    return _tracker
+
+
+def save_tracker():
+    if _tracker is not None:
+        try:
+            _tracker.save()
+        except Exception as e:
+            print(f"⚠️ 保存订阅健康记录失败: {e}")
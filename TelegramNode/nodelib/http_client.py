@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+共享 HTTP 客户端（keep-alive 连接池）
+- 整个进程共用一个 requests.Session，按域名保持连接池，
+  同一机场面板的多个 token 链接只需要一次 TCP/TLS 握手
+- 连接池大小可通过环境变量 HTTP_POOL_CONNECTIONS / HTTP_POOL_MAXSIZE 调整
+- 默认带 Clash UA：大多数机场面板只对 Clash UA 返回 YAML 订阅
+"""
+import os
+import threading
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+CLASH_UA = 'Clash/1.18.0'
+BROWSER_UA = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36'
+)
+
+# 浏览器级请求头（反爬机场专用）
+BROWSER_HEADERS = {
+    'User-Agent': BROWSER_UA,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Cache-Control': 'max-age=0',
+}
+
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '32'))  # 最多缓存多少个域名的连接池
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '8'))           # 每个域名池内保留的连接数
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """新建一个带连接池的 Session（一般直接用 get_session() 即可）。"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': CLASH_UA, 'Accept': '*/*'})
+    return session
+
+
+def get_session():
+    """返回进程级共享 Session，首次调用时创建。"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def get(url, user_agent=CLASH_UA, headers=None, timeout=30, verify=True, **kwargs):
+    """
+    通过共享连接池发起 GET 请求，返回 requests.Response。
+    user_agent 为 None 时使用 Session 默认 UA；headers 中的同名字段优先。
+    """
+    req_headers = {}
+    if user_agent:
+        req_headers['User-Agent'] = user_agent
+    if headers:
+        req_headers.update(headers)
+    return get_session().get(url, headers=req_headers, timeout=timeout, verify=verify, **kwargs)
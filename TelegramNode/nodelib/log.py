@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+分级日志 + 阶段计数 + JSONL 调试输出
+- 原来热循环里逐条 print：提取到的每条链接、每个 Hysteria2 节点的混淆修正、TCP 逐个结果、
+  每个订阅的下载 / 解析细节；大批量运行时 Actions 日志输出本身就占了不少时间，日志也大到没法看
+- 逐条信息改为 DEBUG 级别，默认（INFO）不输出；热循环里先判断 log.DEBUG_ON 再拼字符串，
+  关闭时每条只多一次属性判断
+- 逐条结果改为按阶段累加计数（count），阶段结束时 summary() 输出一行汇总
+- 设置 LOG_JSONL 时，每条日志（包括 DEBUG）和阶段汇总都以 JSON 行追加到文件，方便事后用 jq 查询；
+  解析进程里的日志同样写入（计数只在当前进程累加）
+环境变量:
+    LOG_LEVEL   DEBUG / INFO / WARNING / ERROR，默认 INFO
+    LOG_JSONL   JSONL 调试日志文件路径，默认不写
+用法:
+    from nodelib import log
+    if log.DEBUG_ON:
+        log.debug(f"TCP PASS: {delay}ms | {name}", stage='tcp', delay=delay)
+    log.count('tcp', '通过')
+    log.summary('tcp', 'TCP 测速')          # 输出该阶段计数并清零
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+_LEVEL_NAMES = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'WARN': WARNING, 'ERROR': ERROR}
+_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+LEVEL = _LEVEL_NAMES.get(os.getenv('LOG_LEVEL', 'INFO').strip().upper(), INFO)
+JSONL_PATH = os.getenv('LOG_JSONL', '').strip() or None
+
+# 是否有人要 DEBUG 记录（控制台级别为 DEBUG，或者开了 JSONL）；热循环用它决定要不要拼日志
+DEBUG_ON = LEVEL <= DEBUG or JSONL_PATH is not None
+
+_lock = threading.Lock()
+_counters = {}
+_sink = None
+_sink_pid = None
+
+
+def _write_jsonl(record):
+    global _sink, _sink_pid
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        try:
+            if _sink is None or _sink_pid != os.getpid():
+                # fork 出来的解析进程重新打开，追加写入同一个文件
+                dir_path = os.path.dirname(JSONL_PATH)
+                if dir_path:
+                    os.makedirs(dir_path, exist_ok=True)
+                _sink = open(JSONL_PATH, 'a', encoding='utf-8', buffering=1)
+                _sink_pid = os.getpid()
+            _sink.write(line)
+        except OSError:
+            pass
+
+
+def log(level, msg, echo=False, **fields):
+    """
+    输出一条日志：级别达到 LOG_LEVEL（或 echo=True，兼容 ENABLE_TCP_LOG 这类单项开关）时打印，
+    开了 LOG_JSONL 时连同 fields 写入 JSONL。
+    """
+    if echo or level >= LEVEL:
+        print(msg)
+    if JSONL_PATH is not None:
+        record = {'ts': round(time.time(), 3), 'level': _NAMES.get(level, level), 'msg': msg}
+        record.update(fields)
+        _write_jsonl(record)
+
+
+def debug(msg, echo=False, **fields):
+    if echo or DEBUG_ON:
+        log(DEBUG, msg, echo, **fields)
+
+
+def info(msg, **fields):
+    log(INFO, msg, **fields)
+
+
+def warning(msg, **fields):
+    log(WARNING, msg, **fields)
+
+
+def error(msg, **fields):
+    log(ERROR, msg, **fields)
+
+
+# ---------- 阶段计数 ----------
+def count(stage, key, n=1):
+    """给某个阶段的某项计数加 n（线程安全）。"""
+    with _lock:
+        counter = _counters.get(stage)
+        if counter is None:
+            counter = _counters[stage] = Counter()
+        counter[key] += n
+
+
+def counters(stage):
+    with _lock:
+        return dict(_counters.get(stage) or {})
+
+
+def summary(stage, title=None):
+    """输出某个阶段的计数汇总（一行）并清零；没有计数时不输出。"""
+    with _lock:
+        counter = _counters.pop(stage, None)
+    if not counter:
+        return {}
+    parts = ' | '.join(f"{key} {value}" for key, value in counter.items())
+    log(INFO, f"  📊 {title or stage}: {parts}", stage=stage, counters=dict(counter))
+    return dict(counter)
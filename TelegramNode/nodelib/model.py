@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+节点记录（固定属性 + __slots__）
+- 节点原来是普通 dict，各阶段往里追加 region_info / tcp_delay / clash_delay / bandwidth / quality_score / quality_tag；
+  TCP、Clash、xcspeedtest 测速对每个通过的节点 proxy.copy() 一份，生成配置时又复制一遍
+- Proxy 把 name / type / server / port 以及地区、测速结果放在固定属性里，其余协议字段放在 fields 字典里；
+  合并去重之后只建一次，各阶段传引用、原地写结果，只在写 YAML 时用 to_clash() 转回 Clash 字典
+- 兼容 dict 的读写方式（proxy['name']、proxy.get('tcp_delay', 9999)、'uuid' in proxy、pop …），
+  原有的处理函数不用改；固定属性为 None 表示没有这个字段
+用法:
+    proxy = Proxy.from_dict(clash_dict)
+    proxy.tcp_delay = 120                  # 等价于 proxy['tcp_delay'] = 120
+    proxy.to_clash()                       # 写文件：协议字段 + 已有的地区 / 测速 / 评分结果
+    proxy.to_clash(meta=False)             # 交给 Clash 内核的配置：只有协议字段
+"""
+from collections.abc import MutableMapping
+
+# 协议核心字段，输出时排在最前
+CORE_FIELDS = ('name', 'type', 'server', 'port')
+# 各阶段写入的结果，输出时按这个顺序排在协议字段之后
+META_FIELDS = ('region_info', 'tcp_delay', 'clash_delay', 'bandwidth', 'quality_score', 'quality_tag')
+
+_SLOT_FIELDS = frozenset(CORE_FIELDS + META_FIELDS)
+
+
+class Proxy(MutableMapping):
+    __slots__ = CORE_FIELDS + META_FIELDS + ('fields',)
+
+    def __init__(self, name=None, type=None, server=None, port=None, fields=None, **meta):
+        self.name = name
+        self.type = type
+        self.server = server
+        self.port = port
+        self.fields = fields if fields is not None else {}
+        for key in META_FIELDS:
+            setattr(self, key, meta.pop(key, None))
+        if meta:
+            raise TypeError(f"未知的节点属性: {', '.join(meta)}")
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 Clash 节点字典建立记录（复制一次，之后不再复制）。"""
+        if isinstance(data, Proxy):
+            return data
+        proxy = cls()
+        fields = proxy.fields
+        for key, value in data.items():
+            if key in _SLOT_FIELDS:
+                setattr(proxy, key, value)
+            else:
+                fields[key] = value
+        return proxy
+
+    def to_clash(self, meta=True):
+        """转回 Clash 节点字典：核心字段、其余协议字段，meta=True 时再附上已有的结果字段。"""
+        data = {}
+        for key in CORE_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        data.update(self.fields)
+        if meta:
+            for key in META_FIELDS:
+                value = getattr(self, key)
+                if value is not None:
+                    data[key] = value
+        return data
+
+    def copy(self):
+        """同 dict.copy()：浅复制。"""
+        proxy = Proxy.__new__(Proxy)
+        for key in CORE_FIELDS + META_FIELDS:
+            setattr(proxy, key, getattr(self, key))
+        proxy.fields = dict(self.fields)
+        return proxy
+
+    # ---- dict 兼容接口 ----
+    def __getitem__(self, key):
+        if key in _SLOT_FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.fields[key]
+
+    def __setitem__(self, key, value):
+        if key in _SLOT_FIELDS:
+            setattr(self, key, value)
+        else:
+            self.fields[key] = value
+
+    def __delitem__(self, key):
+        if key in _SLOT_FIELDS:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        else:
+            del self.fields[key]
+
+    def __contains__(self, key):
+        if key in _SLOT_FIELDS:
+            return getattr(self, key) is not None
+        return key in self.fields
+
+    def get(self, key, default=None):
+        if key in _SLOT_FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.fields.get(key, default)
+
+    def __iter__(self):
+        return iter(self.to_clash())
+
+    def __len__(self):
+        return (sum(getattr(self, key) is not None for key in CORE_FIELDS + META_FIELDS)
+                + len(self.fields))
+
+    def __repr__(self):
+        return f"Proxy({self.to_clash()!r})"
+
+
+def to_clash_list(proxies, meta=True):
+    """写 YAML 前把节点列表转成 Clash 字典列表；普通 dict 原样保留。"""
+    return [p.to_clash(meta) if isinstance(p, Proxy) else p for p in proxies]
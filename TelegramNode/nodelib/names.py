@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+节点名分配（线性时间去重名）
+- 合并脚本原来用 `while name in seen: counter += 1` 解决重名，每个重名节点都从 1 开始重新试；
+  上千个节点同名（比如同一个面板的“免费节点”）时退化成平方级
+- NameAllocator 给每个基础名记住下一个可用序号，之后从那里继续，每个候选名最多试一次；
+  结果与原来逐个试的写法完全一致（已占用的名字只增不减，跳过的序号以后也不会空出来）
+- 后缀格式可配置，保持各脚本原有风格：
+    merge_subscriptions     X, X-1, X-2 ...       NameAllocator()
+    choutuan-all1           X, X (2), X (3) ...   NameAllocator('{base} ({n})', start=2)
+    normalize_proxy_names   X-1, X-2 ...          allocator.number(base)（总是带序号）
+用法:
+    names = NameAllocator()
+    names.allocate('免费节点')      # '免费节点'
+    names.allocate('免费节点')      # '免费节点-1'
+    names.reserve('已有名字')       # 标记为已占用
+"""
+
+
+class NameAllocator:
+
+    def __init__(self, fmt='{base}-{n}', start=1):
+        self.fmt = fmt
+        self.start = start
+        self._used = set()
+        self._next = {}     # 基础名 -> 下一个要尝试的序号
+
+    def __contains__(self, name):
+        return name in self._used
+
+    def __len__(self):
+        return len(self._used)
+
+    def reserve(self, name):
+        """把 name 标记为已占用；原来没被占用时返回 True。"""
+        if name in self._used:
+            return False
+        self._used.add(name)
+        return True
+
+    def number(self, base):
+        """总是带序号：base 的下一个未被占用的 fmt 名字。"""
+        n = self._next.get(base, self.start)
+        name = self.fmt.format(base=base, n=n)
+        while name in self._used:
+            n += 1
+            name = self.fmt.format(base=base, n=n)
+        self._next[base] = n + 1
+        self._used.add(name)
+        return name
+
+    def allocate(self, base):
+        """base 没被占用时原样使用，否则加序号后缀。"""
+        if self.reserve(base):
+            return base
+        return self.number(base)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+订阅解析的多进程分发
+- 明文 / Base64 订阅的逐行解析（vmess 的 Base64 + JSON、链接切分等）是纯 Python 计算，
+  原来都在下载线程里执行，受 GIL 限制整个解析阶段只用得上一个核
+- 超过 CHUNK_LINES 行的内容按块交给进程池解析，各块结果按原顺序合并，与单线程解析的结果完全一致；
+  小订阅仍在当前线程解析，不付进程间通信的开销
+- 进程池要在启动下载线程之前用 start() 以 fork 方式建好（线程运行后再 fork 不安全；
+  spawn / forkserver 会在每个子进程里重新导入脚本），没有调用 start() 时全部在当前线程解析；
+  进程池不可用或某块解析出错时同样退回当前线程解析
+环境变量:
+    PARSE_WORKERS       解析进程数，默认 min(4, CPU 核数)；0 或 1 表示不使用进程池
+    PARSE_CHUNK_LINES   每块行数，默认 2000
+用法:
+    parallel.start()                       # main() 开头、开线程之前
+    parser = ChunkedParser(protocols.parse_line)
+    for line in lines: parser.add(line)
+    parser.close()
+    parser.proxies, parser.success, parser.failure
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from nodelib import filters, parse_cache, protocols
+
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+CHUNK_LINES = max(1, int(os.getenv('PARSE_CHUNK_LINES', '2000')))
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_broken = False
+
+
+def parse_chunk(lines, line_parser=protocols.parse_line):
+    """
+    逐行解析一块已去掉首尾空白的非空行，返回与 lines 一一对应的 (协议, 节点) 列表。
+    在子进程中执行，line_parser 必须是模块级函数（可被 pickle）。
+    """
+    return [line_parser(line) for line in lines]
+
+
+def _noop():
+    return None
+
+
+def start():
+    """预先 fork 出解析进程；不支持 fork 的平台或 PARSE_WORKERS <= 1 时不启用。"""
+    global _pool
+    if PARSE_WORKERS <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return False
+    with _pool_lock:
+        if _pool is not None:
+            return True
+        try:
+            pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('fork'))
+            # fork 方式下第一次提交任务时一次性创建全部子进程
+            pool.submit(_noop).result()
+        except Exception as e:
+            print(f"  ⚠️ 解析进程池启动失败，改为单线程解析: {e}")
+            return False
+        _pool = pool
+    print(f"  ⚙️ 大订阅解析启用 {PARSE_WORKERS} 个进程（每块 {CHUNK_LINES} 行）")
+    return True
+
+
+def _get_pool():
+    return None if _pool_broken else _pool
+
+
+def _disable(reason):
+    global _pool_broken
+    if not _pool_broken:
+        _pool_broken = True
+        print(f"  ⚠️ 解析进程池不可用，改为单线程解析: {reason}")
+
+
+def submit(lines, line_parser=protocols.parse_line):
+    """把一块行交给进程池，返回 Future；进程池不可用时返回 None。"""
+    pool = _get_pool()
+    if pool is None:
+        return None
+    try:
+        return pool.submit(parse_chunk, lines, line_parser)
+    except Exception as e:
+        _disable(e)
+        return None
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+class ChunkedParser:
+    """
+    逐行接收、按块解析的节点收集器，结果顺序与逐行解析一致。
+    凑满一块就提交给进程池，提交后不等待，继续接收后面的行；close() 时按提交顺序合并。
+    传入 cache（nodelib.parse_cache.ParseCache）时先查缓存，只把未命中的行交给解析函数，
+    解析结果在当前进程写回缓存；命中的节点按当前的筛选规则（nodelib.filters）再检查一次。
+    """
+
+    def __init__(self, line_parser=protocols.parse_line, chunk_lines=None, cache=None):
+        self.line_parser = line_parser
+        self.chunk_lines = chunk_lines or CHUNK_LINES
+        self.cache = cache
+        self.proxies = []
+        self.success = defaultdict(int)
+        self.failure = defaultdict(int)
+        self._batch = []
+        self._pending = deque()     # (Future, 未命中的行, 缓存查询结果)，按提交顺序
+
+    def add(self, line):
+        self._batch.append(line)
+        if len(self._batch) >= self.chunk_lines:
+            looked, misses = self._lookup()
+            future = submit(misses, self.line_parser) if misses else None
+            if future is None:
+                self._drain()
+                self._finish(parse_chunk(misses, self.line_parser), looked)
+            else:
+                self._pending.append((future, misses, looked))
+
+    def _lookup(self):
+        """取出当前块并查缓存，返回 (缓存查询结果, 需要解析的行)。"""
+        batch, self._batch = self._batch, []
+        if self.cache is None:
+            return None, batch
+        looked = [self.cache.lookup(line) for line in batch]
+        misses = [line for line, (_, value) in zip(batch, looked) if value is parse_cache.MISS]
+        return looked, misses
+
+    def _finish(self, results, looked):
+        """把一块的解析结果与缓存命中按原顺序合并。"""
+        if looked is not None:
+            spec = filters.active()
+            parsed = iter(results)
+            results = []
+            for key, value in looked:
+                if value is parse_cache.MISS:
+                    value = next(parsed)
+                    self.cache.store(key, *value)
+                elif spec and value[1] and not spec.accepts(value[1]):
+                    value = (None, None)
+                results.append(value)
+        for proto, proxy in results:
+            if proto is None:
+                continue
+            if proxy:
+                self.proxies.append(proxy)
+                self.success[proto] += 1
+            else:
+                self.failure[proto] += 1
+
+    def _drain(self):
+        while self._pending:
+            future, misses, looked = self._pending.popleft()
+            try:
+                results = future.result()
+            except Exception as e:
+                # 子进程崩溃 / line_parser 无法 pickle 等：这一块在当前线程重新解析
+                _disable(e)
+                results = parse_chunk(misses, self.line_parser)
+            self._finish(results, looked)
+
+    def close(self):
+        # 最后不足一块的行在当前线程解析，与进程池里的块同时进行
+        looked, misses = self._lookup()
+        tail = parse_chunk(misses, self.line_parser)
+        self._drain()
+        self._finish(tail, looked)
+        return self
+
+    def reset(self):
+        """丢弃已经收到的内容和结果（例如 Base64 判断失误需要从头按明文解析）。"""
+        for future, _, _ in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._batch = []
+        self.proxies = []
+        self.success.clear()
+        self.failure.clear()
+
+
+def parse_lines(lines, line_parser=protocols.parse_line, cache=None):
+    """同 protocols.parse_lines，行数多时分块交给进程池；传入 cache 时先查解析缓存。"""
+    parser = ChunkedParser(line_parser, cache=cache)
+    for line in lines:
+        line = line.strip()
+        if line:
+            parser.add(line)
+    parser.close()
+    return parser.proxies, parser.success, parser.failure
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+分享链接解析结果缓存（跨运行，LRU 淘汰）
+- 历史节点、频道里反复转发的订阅，每次运行解析的链接大部分都解析过；
+  这里以原始链接行的哈希为键，保存上次解析出的 Clash 节点，命中时跳过 Base64 / JSON / 链接切分
+- 解析失败的链接也记下来（负缓存），坏链接不必每次重新解码
+- 值以 JSON 文本保存，命中时重新生成 dict：下游改名、修正字段不会污染缓存
+- 解析代码（nodelib.protocols / nodelib.uri）有改动时整个缓存自动作废
+- 条目数超过上限时淘汰最久未命中的；文件放在 .cache/ 下，配合 actions/cache 跨运行保留
+环境变量:
+    PARSE_CACHE         设为 false 可关闭
+    PARSE_CACHE_FILE    缓存文件，默认 .cache/parsed_links.json
+    PARSE_CACHE_MAX     最多保留的链接数，默认 50000
+用法:
+    cache = parse_cache.get_cache()        # 关闭时为 None
+    key, value = cache.lookup(line)        # 未命中时 value 为 MISS
+    cache.store(key, proto, proxy)
+    parse_cache.save_cache()
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_ENABLED = os.getenv('PARSE_CACHE', 'true').strip().lower() not in ('false', '0', 'no')
+CACHE_FILE = os.getenv('PARSE_CACHE_FILE', os.path.join('.cache', 'parsed_links.json'))
+CACHE_MAX_ENTRIES = int(os.getenv('PARSE_CACHE_MAX', '50000'))
+
+# 未命中
+MISS = object()
+
+
+def _code_version():
+    """解析代码的指纹：解析规则一改，旧结果就不能再用。"""
+    digest = hashlib.blake2b(digest_size=8)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ('protocols.py', 'uri.py'):
+        try:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(name.encode())
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """线程安全；条目按最近使用顺序保存在 OrderedDict 里（最久未用的在前）。"""
+
+    def __init__(self, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.version = _code_version()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # 键 -> (协议, 节点 JSON 文本或 None)
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ 链接解析缓存损坏，已重建: {e}")
+            return
+        if not isinstance(data, dict) or data.get('version') != self.version:
+            return
+        for item in data.get('entries') or []:
+            try:
+                key, proto, text = item
+            except (TypeError, ValueError):
+                continue
+            self._entries[key] = (proto, text)
+
+    @staticmethod
+    def key(line):
+        return hashlib.blake2b(line.encode('utf-8', errors='surrogatepass'), digest_size=16).hexdigest()
+
+    def lookup(self, line):
+        """返回 (键, (协议, 节点))；未命中时第二项为 MISS。命中解析失败的链接时节点为 None。"""
+        key = self.key(line)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return key, MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+        proto, text = entry
+        return key, (proto, json.loads(text) if text is not None else None)
+
+    def store(self, key, proto, proxy):
+        """记录一条链接的解析结果；不是节点链接（proto 为 None）的行不记录。"""
+        if proto is None:
+            return
+        text = json.dumps(proxy, ensure_ascii=False, separators=(',', ':')) if proxy else None
+        with self._lock:
+            self._entries[key] = (proto, text)
+            self._entries.move_to_end(key)
+
+    def save(self):
+        with self._lock:
+            evicted = max(0, len(self._entries) - self.max_entries)
+            for _ in range(evicted):
+                self._entries.popitem(last=False)
+            entries = [[key, proto, text] for key, (proto, text) in self._entries.items()]
+            hits, misses = self.hits, self.misses
+        data = json.dumps({'version': self.version, 'entries': entries}, ensure_ascii=False, separators=(',', ':'))
+        dir_path = os.path.dirname(self.path) or '.'
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-parsed-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        if hits or misses:
+            print(f"  🗃️ 链接解析缓存: 命中 {hits} / 新解析 {misses}，保存 {len(entries)} 条"
+                  + (f"（淘汰 {evicted} 条最久未用）" if evicted else ""))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ParseCache | None:
+    """返回进程级共享缓存；PARSE_CACHE=false 时返回 None。"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ParseCache()
+    return _cache
+
+
+def save_cache():
+    if _cache is not None:
+        try:
+            _cache.save()
+        except Exception as e:
+            print(f"⚠️ 保存链接解析缓存失败: {e}")
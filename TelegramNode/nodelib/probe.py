@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+端点级 TCP 探测去重
+- 很多节点只有 uuid / password / 路径 / 名字不同，实际指向同一个 server:port；
+  TCP 测速原来每个节点各连一次，同一个端点被重复连接几十上百次
+- 这里按“解析后的端点”去重：域名先解析成 IPv4（每个域名只解析一次），同一个 IP:端口 只探测一次，
+  结果分发给该端点上的所有节点；不同域名解析到同一个 IP 的也合并
+- 并发探测同一端点时，后到的线程等待第一个线程的结果，不会重复连接
+- PROBE_SAMPLES > 1 时每个端点连续连接多次，取成功样本的中位数作为延迟（减少单次抖动），
+  全部失败才算失败；默认 1 次，与原来逐节点连一次的结果一致
+环境变量:
+    PROBE_SAMPLES   每个端点的探测次数，默认 1
+用法:
+    prober = EndpointProber(timeout=5)
+    groups = group_by_endpoint(proxies)          # {(host, port): [节点, ...]}，无法探测的节点在 None 键下
+    delay = prober.probe(host, port)             # 毫秒，失败为 None
+    prober.describe()                            # "节点 1200 → 地址 300 → 端点 260"
+"""
+import ipaddress
+import os
+import socket
+import statistics
+import threading
+import time
+
+PROBE_SAMPLES = max(1, int(os.getenv('PROBE_SAMPLES', '1')))
+
+
+def endpoint_key(proxy):
+    """节点的 (小写主机名, 端口)；缺少 server / port 或端口非法时返回 None。"""
+    server = proxy.get('server')
+    port = proxy.get('port')
+    if not server or not port:
+        return None
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return None
+    host = str(server).strip().lower().rstrip('.')
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    return (host, port) if host and 0 < port < 65536 else None
+
+
+def group_by_endpoint(proxies):
+    """按 (主机名, 端口) 分组，保持节点原有顺序；无法探测的节点放在 None 键下。"""
+    groups = {}
+    for proxy in proxies:
+        groups.setdefault(endpoint_key(proxy), []).append(proxy)
+    return groups
+
+
+def connect_ms(ip, port, timeout):
+    """对 IPv4 地址做一次 TCP 连接，返回耗时（毫秒），失败返回 None。"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            start = time.time()
+            sock.connect((ip, port))
+            return int((time.time() - start) * 1000)
+    except (OSError, ValueError, OverflowError):
+        return None
+
+
+class _Pending:
+    __slots__ = ('event', 'value')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class EndpointProber:
+    """线程安全；域名解析结果和端点探测结果都只算一次，之后直接复用。"""
+
+    def __init__(self, timeout=5, samples=PROBE_SAMPLES):
+        self.timeout = timeout
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._hosts = {}       # 主机名 -> _Pending(IPv4 或 None)
+        self._endpoints = {}   # (IPv4, 端口) -> _Pending(延迟或 None)
+        self.requests = 0      # probe() 调用次数
+        self.connects = 0      # 实际发起的 TCP 连接数
+
+    def _once(self, table, key, compute):
+        """table[key] 只计算一次；并发的调用等待第一个调用的结果。"""
+        with self._lock:
+            pending = table.get(key)
+            owner = pending is None
+            if owner:
+                pending = table[key] = _Pending()
+        if owner:
+            try:
+                pending.value = compute()
+            finally:
+                pending.event.set()
+        else:
+            pending.event.wait()
+        return pending.value
+
+    def resolve(self, host):
+        """主机名解析成 IPv4（与 AF_INET socket 直接 connect 主机名时取的地址一致），失败返回 None。"""
+        try:
+            return str(ipaddress.IPv4Address(host))
+        except ValueError:
+            pass
+
+        def lookup():
+            try:
+                return socket.gethostbyname(host)
+            except (OSError, UnicodeError):
+                return None
+        return self._once(self._hosts, host, lookup)
+
+    def _measure(self, ip, port, timeout):
+        delays = []
+        for _ in range(self.samples):
+            with self._lock:
+                self.connects += 1
+            delay = connect_ms(ip, port, timeout)
+            if delay is not None:
+                delays.append(delay)
+        if not delays:
+            return None
+        return int(statistics.median(delays))
+
+    def probe(self, host, port, timeout=None):
+        """探测 host:port（host 为节点的 server），返回延迟（毫秒），失败返回 None。"""
+        with self._lock:
+            self.requests += 1
+        ip = self.resolve(host)
+        if ip is None:
+            return None
+        timeout = self.timeout if timeout is None else timeout
+        return self._once(self._endpoints, (ip, port), lambda: self._measure(ip, port, timeout))
+
+    @property
+    def hosts(self):
+        return len(self._hosts)
+
+    @property
+    def endpoints(self):
+        return len(self._endpoints)
+
+    def describe(self, nodes=None):
+        parts = [f"节点 {nodes}"] if nodes is not None else []
+        parts += [f"地址 {self.requests}", f"端点 {self.endpoints}"]
+        return ' → '.join(parts) + f"（实际连接 {self.connects} 次）"
@@ -0,0 +1,535 @@
+# -*- coding: utf-8 -*-
+"""
+节点分享链接编解码（vmess / vless / ssr / ss / trojan / hysteria / hysteria2）
+- 原来两个脚本各有一份解析函数，已经出现分歧（Hysteria 缺 up/down、SS 不认 SIP002 等），
+  现在统一放在这里，修正一次所有脚本同时生效
+- 按协议头查表分发（DECODERS），不再逐个 startswith 判断
+- 带查询参数的链接用 nodelib.uri 一次切分，不再 urlparse + parse_qs
+- 每个协议都有对应的编码函数（Clash 节点 dict → 分享链接），可以输出 URI 列表订阅
+- 按 nodelib.filters 安装的规则，不保留的协议看到协议头就跳过，不保留的 SS 加密方式不建节点
+用法:
+    proto, proxy = parse_line(line)                # 不是节点链接时 proto 为 None
+    proxies, success, failure = parse_lines(lines)
+    uri = to_uri(proxy)                            # 不支持的协议 / 字段返回 None
+"""
+import base64
+import binascii
+import json
+import re
+from collections import defaultdict
+from urllib.parse import quote, unquote, urlencode
+
+from nodelib import filters, log
+from nodelib.uri import split as split_uri
+
+# 协议头只在行首很短的范围内查找（最长的 "hysteria2://" 为 12 个字符）
+_SCHEME_SCAN = 16
+_B64URL_RE = re.compile(r'^[A-Za-z0-9_\-+/]+=*$')
+
+
+def _b64decode_text(data, urlsafe=False):
+    """
+    补齐填充后解码成字符串（与原解析函数的宽松解码一致）。
+    ASCII 的 str 直接交给 binascii，不像 base64.b64decode 那样先整段编码成 bytes 再解码。
+    """
+    if urlsafe:
+        data = data.replace('-', '+').replace('_', '/')
+    raw = binascii.a2b_base64(data + '=' * (-len(data) % 4))
+    return raw.decode('utf-8', errors='ignore')
+
+
+def _b64encode_text(text, urlsafe=False):
+    """编码成不带填充的 Base64（分享链接的通用写法）。"""
+    raw = text.encode('utf-8')
+    encoded = base64.urlsafe_b64encode(raw) if urlsafe else base64.b64encode(raw)
+    return encoded.decode('ascii').rstrip('=')
+
+
+def _ssr_text(value):
+    """SSR 参数按规范是 URL 安全的 Base64；不是合法 Base64 / UTF-8 时按原样 URL 解码。"""
+    if value and _B64URL_RE.match(value):
+        try:
+            return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            pass
+    return unquote(value)
+
+
+def _host(server):
+    """IPv6 地址在链接里要加方括号。"""
+    server = str(server)
+    return f"[{server}]" if ':' in server and not server.startswith('[') else server
+
+
+def _query(params):
+    """去掉空值后拼成查询串；列表值展开成重复的键。"""
+    params = {k: v for k, v in params.items() if v not in (None, '', [], False)}
+    return urlencode(params, doseq=True, quote_via=quote)
+
+
+def _link(scheme, userinfo, server, port, params, name):
+    uri = f"{scheme}://"
+    if userinfo:
+        uri += quote(str(userinfo), safe='') + '@'
+    uri += f"{_host(server)}:{int(port)}"
+    query = _query(params)
+    if query:
+        uri += '/?' + query if scheme in ('hysteria', 'hysteria2') else '?' + query
+    if name:
+        uri += '#' + quote(str(name), safe='')
+    return uri
+
+
+def _flag(value):
+    """Clash 配置里的布尔值可能写成字符串。"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _ws_opts(proxy):
+    """取出 ws 的 path / Host：解析出来的节点放在顶层，Clash 配置里放在 ws-opts。"""
+    opts = proxy.get('ws-opts') or {}
+    headers = opts.get('headers') or {}
+    path = opts.get('path') or proxy.get('path') or ''
+    host = headers.get('Host') or headers.get('host') or proxy.get('host') or ''
+    return path, host
+
+
+# ==================== 解码：分享链接 → Clash 节点 ====================
+def parse_vmess_node(line):
+    try:
+        content_b64 = line[8:]
+        decoded = _b64decode_text(content_b64)
+        info = json.loads(decoded)
+        node = {
+            'name': info.get('ps', 'vmess_node'),
+            'type': 'vmess',
+            'server': info.get('add') or info.get('host'),
+            'port': int(info.get('port', 0)),
+            'uuid': info.get('id') or info.get('uuid'),
+            'alterId': int(info.get('aid', info.get('alterId', 0))) if str(info.get('aid', '')).isdigit() else 0,
+            'cipher': info.get('scy', 'auto'),
+            'network': info.get('net', 'tcp'),
+            'tls': True if info.get('tls', '').lower() == 'tls' else False,
+            'skip-cert-verify': info.get('allowInsecure', False),
+            'ws-opts': {},
+        }
+        if node['network'] == 'ws':
+            ws_opts = {
+                'path': info.get('path', ''),
+                'headers': {'Host': info.get('host', '')} if info.get('host') else {},
+            }
+            node['ws-opts'] = ws_opts
+        return node
+    except Exception:
+        return None
+
+
+def parse_vless_node(line):
+    try:
+        parsed = split_uri(line.strip())
+        if parsed.scheme != 'vless':
+            return None
+        params = parsed.params
+        node = {
+            'name': unquote(parsed.fragment) if parsed.fragment else f"vless_{parsed.hostname}",
+            'type': 'vless',
+            'server': parsed.hostname,
+            'port': int(parsed.port or 0),
+            'uuid': parsed.username,
+            'encryption': 'none',
+            'flow': params.get('flow', ''),
+            'tls': (parsed.query.lower().find('tls') != -1) or ('tls' in params),
+            'skip-cert-verify': params.get('allowInsecure', 'false').lower() == 'true',
+            'network': params.get('type', 'tcp'),
+            'host': params.get('host', ''),
+            'path': params.get('path', ''),
+            'sni': params.get('sni', ''),
+        }
+        if node['network'] == 'ws':
+            node['ws-opts'] = {'path': node['path'], 'headers': {'Host': node['host']} if node['host'] else {}}
+        return node
+    except Exception:
+        return None
+
+
+def parse_ssr_node(line):
+    try:
+        ssr_decoded = _b64decode_text(line[6:], urlsafe=True)
+        parts = ssr_decoded.split('/?')
+        main = parts[0]
+        params_str = parts[1] if len(parts) > 1 else ''
+        server, port, protocol, method, obfs, password_b64 = main.split(':', 5)
+        password = _b64decode_text(password_b64, urlsafe=True)
+        params = {}
+        for param in params_str.split('&'):
+            if '=' in param:
+                k, v = param.split('=', 1)
+                params[k] = v
+        remark = _ssr_text(params.get('remarks', ''))
+        node = {
+            'name': remark or f"ssr_{server}",
+            'type': 'ssr',
+            'server': server,
+            'port': int(port),
+            'cipher': method,
+            'protocol': protocol,
+            'obfs': obfs,
+            'password': password,
+            'udp': params.get('udp', 'false').lower() == 'true'
+        }
+        if params.get('obfsparam'):
+            node['obfs-param'] = _ssr_text(params['obfsparam'])
+        if params.get('protoparam'):
+            node['protocol-param'] = _ssr_text(params['protoparam'])
+        return node
+    except Exception:
+        return None
+
+
+def parse_ss_node(line):
+    """
+    SS 链接，两种写法:
+        SIP002      ss://Base64(method:password)@server:port#name（userinfo 也可能是明文 method:password）
+        全 Base64   ss://Base64(method:password@server:port)#name
+    """
+    try:
+        line = line.strip()
+        if not line.startswith('ss://'):
+            return None
+
+        remark = ""
+        if '#' in line:
+            line, remark = line.split('#', 1)
+            remark = unquote(remark)
+
+        content = line[5:]
+        method, password, server, port = "", "", "", 0
+
+        if '@' not in content:
+            # 全 Base64 格式，解码后按 SIP002 的明文形式处理
+            content = _b64decode_text(content.split('?')[0], urlsafe=True)
+            if '@' not in content:
+                return None
+
+        prefix, addr = content.rsplit('@', 1)
+        if ':' not in prefix:
+            try:
+                prefix = _b64decode_text(prefix.replace('-', '+').replace('_', '/'))
+            except Exception:
+                return None
+        else:
+            prefix = unquote(prefix)
+
+        if ':' in prefix:
+            method, password = prefix.split(':', 1)
+        if not filters.active().keeps_cipher(method):
+            return filters.DROPPED
+
+        if ':' in addr:
+            server, port_part = addr.rsplit(':', 1)
+            port = port_part.split('?')[0].split('/')[0].replace(',', '.')  # 预处理端口脏数据
+        else:
+            return None
+        server = server.strip('[]')
+
+        return {
+            'name': remark or f"ss_{server}",
+            'type': 'ss',
+            'server': server.replace(',', '.'),  # 再次确保 IP 干净
+            'port': int(re.sub(r'\D', '', str(port))),  # 强制只留数字
+            'cipher': method.strip(),
+            'password': password.strip(),
+            'udp': True
+        }
+    except Exception:
+        return None
+
+
+def parse_trojan_node(line):
+    try:
+        parsed = split_uri(line)
+        if parsed.scheme != 'trojan':
+            return None
+        password = unquote(parsed.username or '')
+        server = parsed.hostname or ''
+        port = parsed.port or 0
+        params = parsed.params
+        node = {
+            'name': unquote(parsed.fragment) if parsed.fragment else f"trojan_{server}",
+            'type': 'trojan',
+            'server': server,
+            'port': port,
+            'password': password,
+            'sni': params.get('sni', ''),
+            'skip-cert-verify': params.get('allowInsecure', 'false').lower() == 'true',
+            'udp': True,
+            'alpn': parsed.values('alpn'),
+            'tls': True,
+        }
+        return node
+    except Exception:
+        return None
+
+
+def parse_hysteria_node(line):
+    """
+    Hysteria (v1)
+    - Clash 核心要求 up/down 字段必须存在，链接里没有时给默认值
+    - insecure 参数按 1 / true 转换成 skip-cert-verify
+    """
+    try:
+        parsed = split_uri(line)
+        if parsed.scheme != 'hysteria':
+            return None
+        params = parsed.params
+        up_speed_str = params.get('up', params.get('upmbps', '10'))
+        down_speed_str = params.get('down', params.get('downmbps', '50'))
+
+        up_speed = int(''.join(filter(str.isdigit, up_speed_str)) or 10)
+        down_speed = int(''.join(filter(str.isdigit, down_speed_str)) or 50)
+        node = {
+            'name': unquote(parsed.fragment) or f"hysteria_{parsed.hostname}",
+            'type': 'hysteria',
+            'server': parsed.hostname,
+            'port': int(parsed.port or 0),
+            'up': up_speed,
+            'down': down_speed,
+            'protocol': params.get('protocol', 'udp'),
+            'skip-cert-verify': params.get('insecure', '0').lower() in ('1', 'true'),
+            'sni': params.get('sni', params.get('peer', '')),
+            'obfs': params.get('obfs', ''),
+            'fast-open': True,  # 推荐开启
+            'auth': params.get('auth', ''),
+        }
+        return node
+    except Exception as e:
+        if log.DEBUG_ON:
+            log.debug(f"【错误】解析 Hysteria 节点时失败: {e} -> {line[:80]}...", stage='parse', proto='hysteria')
+        return None
+
+
+def parse_hysteria2_node(line):
+    """
+    Hysteria2
+    只有 obfs 和 obfs-password 都不为空时才添加混淆字段，
+    否则节点以“无混淆”模式连接，避免 Clash 报 'missing obfs password' 无法启动
+    """
+    try:
+        parsed = split_uri(line)
+        if parsed.scheme not in ('hysteria2', 'hy2'):
+            return None
+        params = parsed.params
+        insecure_val = params.get('insecure', '0').lower()
+
+        obfs = params.get('obfs', '').strip()
+        obfs_pw = params.get('obfs-password', '').strip()
+
+        node = {
+            'name': unquote(parsed.fragment) if parsed.fragment else f"hysteria2_{parsed.hostname}",
+            'type': 'hysteria2',
+            'server': parsed.hostname,
+            'port': int(parsed.port or 0),
+            'auth': unquote(parsed.username or ''),
+            'sni': params.get('sni', ''),
+            'skip-cert-verify': insecure_val in ('1', 'true', 'yes'),
+            'fast-open': True,
+        }
+
+        if obfs and obfs_pw:
+            node['obfs'] = obfs
+            node['obfs-password'] = obfs_pw
+        elif obfs and log.DEBUG_ON:
+            log.debug(f"⚠️ 节点 {node['name']} 混淆参数不完整 (只有obfs无密码)，已自动移除混淆配置以兼容测试。",
+                      stage='parse', proto='hysteria2')
+
+        return node
+    except Exception:
+        return None
+
+
+# 协议头 → (协议名, 解码函数)
+DECODERS = {
+    'vmess': ('vmess', parse_vmess_node),
+    'vless': ('vless', parse_vless_node),
+    'ssr': ('ssr', parse_ssr_node),
+    'ss': ('ss', parse_ss_node),
+    'trojan': ('trojan', parse_trojan_node),
+    'hysteria': ('hysteria', parse_hysteria_node),
+    'hysteria2': ('hysteria2', parse_hysteria2_node),
+    'hy2': ('hysteria2', parse_hysteria2_node),
+}
+
+
+def parse_line(line):
+    """
+    解析单行明文链接，返回 (协议, 节点)；不是支持的节点链接、或被筛选规则（nodelib.filters）丢弃时
+    返回 (None, None)，解析失败时节点为 None
+    """
+    end = line.find('://', 0, _SCHEME_SCAN)
+    if end <= 0:
+        return None, None
+    entry = DECODERS.get(line[:end])
+    if entry is None:
+        return None, None
+    proto, decoder = entry
+    if not filters.active().keeps_type(proto):
+        return None, None
+    proxy = decoder(line)
+    if proxy is filters.DROPPED:
+        return None, None
+    return proto, proxy
+
+
+def parse_lines(lines):
+    """
+    逐行解析，返回 (节点列表, 各协议成功数, 各协议失败数)。
+    空行、标题、注释等不是节点链接的行直接跳过，不计入失败数。
+    """
+    proxies = []
+    success = defaultdict(int)
+    failure = defaultdict(int)
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        proto, proxy = parse_line(line)
+        if proto is None:
+            continue
+        if proxy:
+            proxies.append(proxy)
+            success[proto] += 1
+        else:
+            failure[proto] += 1
+    return proxies, success, failure
+
+
+# ==================== 编码：Clash 节点 → 分享链接 ====================
+def encode_vmess_node(proxy):
+    path, host = _ws_opts(proxy)
+    info = {
+        'v': '2',
+        'ps': proxy.get('name', ''),
+        'add': proxy['server'],
+        'port': str(int(proxy['port'])),
+        'id': proxy['uuid'],
+        'aid': str(int(proxy.get('alterId') or 0)),
+        'scy': proxy.get('cipher') or 'auto',
+        'net': proxy.get('network') or 'tcp',
+        'type': 'none',
+        'host': host,
+        'path': path,
+        'tls': 'tls' if _flag(proxy.get('tls')) else '',
+        'sni': proxy.get('servername') or proxy.get('sni') or '',
+    }
+    if _flag(proxy.get('skip-cert-verify')):
+        info['allowInsecure'] = True
+    return 'vmess://' + _b64encode_text(json.dumps(info, ensure_ascii=False, separators=(',', ':')))
+
+
+def encode_vless_node(proxy):
+    path, host = _ws_opts(proxy)
+    params = {
+        'encryption': 'none',
+        'flow': proxy.get('flow'),
+        'security': 'tls' if _flag(proxy.get('tls')) else None,
+        'sni': proxy.get('servername') or proxy.get('sni'),
+        'allowInsecure': 'true' if _flag(proxy.get('skip-cert-verify')) else None,
+        'type': proxy.get('network') or 'tcp',
+        'host': host,
+        'path': path,
+    }
+    return _link('vless', proxy['uuid'], proxy['server'], proxy['port'], params, proxy.get('name'))
+
+
+def encode_ssr_node(proxy):
+    main = ':'.join([
+        str(proxy['server']), str(int(proxy['port'])), proxy.get('protocol') or 'origin',
+        proxy['cipher'], proxy.get('obfs') or 'plain', _b64encode_text(str(proxy['password']), urlsafe=True),
+    ])
+    params = [('remarks', proxy.get('name') or '')]
+    params += [('obfsparam', proxy.get('obfs-param') or ''), ('protoparam', proxy.get('protocol-param') or '')]
+    query = '&'.join(f"{k}={_b64encode_text(str(v), urlsafe=True)}" for k, v in params if v)
+    if _flag(proxy.get('udp')):
+        query += ('&' if query else '') + 'udp=true'
+    return 'ssr://' + _b64encode_text(main + ('/?' + query if query else ''), urlsafe=True)
+
+
+def encode_ss_node(proxy):
+    if proxy.get('plugin'):
+        return None  # SIP003 插件参数在各客户端写法不一，不输出
+    userinfo = _b64encode_text(f"{proxy['cipher']}:{proxy['password']}", urlsafe=True)
+    uri = f"ss://{userinfo}@{_host(proxy['server'])}:{int(proxy['port'])}"
+    if proxy.get('name'):
+        uri += '#' + quote(str(proxy['name']), safe='')
+    return uri
+
+
+def encode_trojan_node(proxy):
+    alpn = proxy.get('alpn') or []
+    params = {
+        'sni': proxy.get('sni') or proxy.get('servername'),
+        'allowInsecure': 'true' if _flag(proxy.get('skip-cert-verify')) else None,
+        'alpn': [alpn] if isinstance(alpn, str) else list(alpn),
+    }
+    return _link('trojan', proxy['password'], proxy['server'], proxy['port'], params, proxy.get('name'))
+
+
+def encode_hysteria_node(proxy):
+    def speed(value, default):
+        return ''.join(filter(str.isdigit, str(value or ''))) or default
+
+    params = {
+        'protocol': proxy.get('protocol') or 'udp',
+        'auth': proxy.get('auth') or proxy.get('auth-str') or proxy.get('auth_str'),
+        'upmbps': speed(proxy.get('up'), '10'),
+        'downmbps': speed(proxy.get('down'), '50'),
+        'insecure': '1' if _flag(proxy.get('skip-cert-verify') or proxy.get('insecure')) else None,
+        'sni': proxy.get('sni'),
+        'obfs': proxy.get('obfs'),
+    }
+    return _link('hysteria', None, proxy['server'], proxy['port'], params, proxy.get('name'))
+
+
+def encode_hysteria2_node(proxy):
+    params = {
+        'sni': proxy.get('sni'),
+        'insecure': '1' if _flag(proxy.get('skip-cert-verify')) else None,
+    }
+    if proxy.get('obfs') and proxy.get('obfs-password'):
+        params['obfs'] = proxy['obfs']
+        params['obfs-password'] = proxy['obfs-password']
+    auth = proxy.get('auth') or proxy.get('password')
+    return _link('hysteria2', auth, proxy['server'], proxy['port'], params, proxy.get('name'))
+
+
+ENCODERS = {
+    'vmess': encode_vmess_node,
+    'vless': encode_vless_node,
+    'ssr': encode_ssr_node,
+    'ss': encode_ss_node,
+    'trojan': encode_trojan_node,
+    'hysteria': encode_hysteria_node,
+    'hysteria2': encode_hysteria2_node,
+}
+
+
+def to_uri(proxy):
+    """Clash 节点 → 分享链接；协议不支持或缺少必需字段时返回 None。"""
+    encoder = ENCODERS.get(proxy.get('type'))
+    if encoder is None:
+        return None
+    try:
+        return encoder(proxy)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def to_uri_list(proxies, encode_base64=False):
+    """生成 URI 列表订阅（每行一个链接）；encode_base64=True 时整体 Base64 编码（v2rayN 等客户端的格式）。"""
+    lines = [uri for uri in map(to_uri, proxies) if uri]
+    text = '\n'.join(lines) + ('\n' if lines else '')
+    if encode_base64:
+        return base64.b64encode(text.encode('utf-8')).decode('ascii')
+    return text
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+订阅内容格式嗅探
+- 只看开头一小段（SNIFF_BYTES），一次扫描同时判断格式和编码，在解析之前就选好解析器：
+    clash_yaml  Clash 配置（proxies: / port: 等顶层键，或 "- name:" 列表）
+    uri_list    明文 vmess:// ss:// ... 链接列表（允许前面有标题、注释行）
+    base64      整体 Base64 编码的链接列表
+    html        HTML 页面（面板错误页 / 验证页），不必再解析
+    json        JSON（Clash 兼容的 JSON 配置，交给 YAML 解析器）
+    unknown     判断不了，按原来的 YAML → 明文 → Base64 顺序逐个尝试
+- 编码：BOM → UTF-8 → GB18030，替代 requests 的 apparent_encoding（逐字节统计，大订阅很慢）
+用法:
+    result = sniff(prefix_bytes, final=False)   # 数据不够判断时返回 None
+    result.kind, result.encoding, result.bom
+"""
+import codecs
+import re
+from typing import NamedTuple
+
+SNIFF_BYTES = 4096
+
+KIND_CLASH_YAML = 'clash_yaml'
+KIND_URI_LIST = 'uri_list'
+KIND_BASE64 = 'base64'
+KIND_HTML = 'html'
+KIND_JSON = 'json'
+KIND_UNKNOWN = 'unknown'
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+_SCHEME_RE = re.compile(rb'^[A-Za-z][A-Za-z0-9+.-]*://')
+_B64_LINE_RE = re.compile(rb'^[A-Za-z0-9+/=]+$')
+_YAML_KEY_RE = re.compile(
+    rb'^(proxies|proxy-groups|proxy-providers|rules|rule-providers|port|mixed-port|socks-port|'
+    rb'redir-port|allow-lan|mode|log-level|external-controller|dns|tun|profile)\s*:'
+)
+_YAML_ITEM_RE = re.compile(rb'^-\s*\{?\s*name\s*:')
+
+
+class Sniffed(NamedTuple):
+    kind: str
+    encoding: str   # 解码时使用的编码
+    bom: int        # 开头 BOM 的字节数，逐行 / Base64 解析前需要跳过
+
+
+def detect_encoding(prefix: bytes):
+    """返回 (编码, BOM 字节数)。非 UTF-8 的内容按 GB18030 解码（国内面板常见）。"""
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding, len(bom)
+    try:
+        # 前缀可能截断在多字节字符中间，用增量解码器容忍结尾不完整
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    try:
+        codecs.getincrementaldecoder('gb18030')().decode(prefix, final=False)
+        return 'gb18030', 0
+    except UnicodeDecodeError:
+        return 'utf-8', 0
+
+
+def _classify_line(line: bytes):
+    """根据单行内容判断格式，判断不了返回 None（例如标题行）。"""
+    if line.startswith(b'<'):
+        return KIND_HTML
+    if line.startswith((b'{', b'[')):
+        return KIND_JSON
+    if _SCHEME_RE.match(line):
+        return KIND_URI_LIST
+    if _YAML_KEY_RE.match(line) or _YAML_ITEM_RE.match(line):
+        return KIND_CLASH_YAML
+    if _B64_LINE_RE.match(line):
+        return KIND_BASE64
+    return None
+
+
+def sniff(prefix: bytes, final=False):
+    """
+    判断订阅格式。prefix 是内容开头（不超过 SNIFF_BYTES 也没关系，只看这么多）；
+    final=True 表示内容已经全部在 prefix 里。数据还不够判断时返回 None。
+    """
+    encoding, bom = detect_encoding(prefix[:SNIFF_BYTES])
+    if encoding == 'utf-16':
+        # UTF-16 不能按字节切行，先解码开头再判断，内容整体缓冲后解析
+        head = prefix[:SNIFF_BYTES].decode(encoding, errors='ignore').encode('utf-8')
+        return Sniffed(_classify(head, True) or KIND_UNKNOWN, encoding, bom)
+    head = prefix[bom:SNIFF_BYTES + bom]
+    complete = final or len(prefix) >= SNIFF_BYTES + bom
+    kind = _classify(head, complete)
+    if kind is None:
+        return Sniffed(KIND_UNKNOWN, encoding, bom) if complete else None
+    return Sniffed(kind, encoding, bom)
+
+
+def _classify(head: bytes, complete):
+    """逐行扫描，跳过空行、注释和标题行；最后一行不完整时（且还有后续数据）不参与判断。"""
+    lines = head.split(b'\n')
+    if not complete:
+        lines.pop()
+    for index, raw in enumerate(lines):
+        line = raw.strip()
+        if not line or line.startswith(b'#'):
+            continue
+        kind = _classify_line(line)
+        # 第一行像 Base64 但其实是标题（例如纯字母的机场名），要看后面有没有明文链接
+        if kind == KIND_BASE64 and index + 1 < len(lines) and _has_uri(lines[index + 1:]):
+            return KIND_URI_LIST
+        if kind is not None:
+            return kind
+    return None
+
+
+def _has_uri(lines):
+    return any(_SCHEME_RE.match(line.strip()) for line in lines)
+
+
+def sniff_text(text: str):
+    """已经是字符串的内容（例如反爬绕过拿到的）也用同一套规则判断格式。"""
+    return sniff(text[:SNIFF_BYTES].encode('utf-8', errors='ignore'), final=True)
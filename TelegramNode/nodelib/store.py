@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+节点库（SQLite，跨运行保存）
+- 历史节点原来只存在 flclashyaml/TCP.yaml 里：启动时整份 YAML 解析出来才拿到节点列表和
+  last_message_ids，一次运行又把 TCP.yaml / clash.yaml 整份重写好几遍
+- 这里用内嵌 SQLite 保存，以 nodelib.fingerprint 的节点指纹为主键：
+    nodes  原始节点配置（JSON）、来源订阅、首次 / 最近出现时间、
+           最近一次 TCP / Clash 延迟、带宽、质量分、地区、最近存活时间
+    state  运行状态（last_message_ids、更新时间等），值为 JSON
+  地区、存活时间、延迟都建了索引，可以直接查询“24 小时内存活、地区为 HK、按延迟排序”
+- YAML 只是导出的一种视图：export() 按查询条件取出 Clash 节点字典交给 YAML 写出；
+  启动时 load() 只取需要进入本次测速的节点，不再解析整份历史 YAML
+- 库文件放在 .cache/ 下，配合 actions/cache 跨运行保留；缓存丢失（库为空）时脚本回退到读 TCP.yaml
+- 单进程使用，连接在线程间共享，写操作加锁；一次运行内的写入在 save() 时一次提交
+- 不用 WAL：只有一个写入者的批处理用不上，而且 actions/cache 只保存库文件本身时 -wal / -shm 会丢；
+  save_store() 提交后关闭连接，运行结束时 .cache/ 里只有一个完整的 nodes.db
+环境变量:
+    NODE_STORE           设为 false 可关闭
+    NODE_STORE_FILE      库文件，默认 .cache/nodes.db
+    NODE_STORE_TTL_DAYS  超过多少天既没出现也没存活的节点在保存时清理，默认 14
+用法:
+    node_store = store.get_store()                        # 关闭时为 None
+    node_store.upsert(proxies, source=url)                # 合并新节点（已有的只更新配置和最近出现时间）
+    node_store.record_results(tcp_passed)                 # 写入测速结果，标记为存活
+    node_store.load(alive_within=24 * 3600, region='HK', order_by='tcp_delay', limit=100)
+    node_store.set_state('last_message_ids', {...}); node_store.get_state('last_message_ids', {})
+    store.save_store()
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from nodelib.fingerprint import fingerprint
+from nodelib.model import META_FIELDS, Proxy
+
+STORE_ENABLED = os.getenv('NODE_STORE', 'true').strip().lower() not in ('false', '0', 'no')
+STORE_FILE = os.getenv('NODE_STORE_FILE', os.path.join('.cache', 'nodes.db'))
+STORE_TTL = float(os.getenv('NODE_STORE_TTL_DAYS', '14')) * 86400
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    fp            BLOB PRIMARY KEY,
+    type          TEXT,
+    server        TEXT,
+    port          INTEGER,
+    config        TEXT NOT NULL,
+    source        TEXT,
+    first_seen    REAL NOT NULL,
+    last_seen     REAL NOT NULL,
+    last_alive    REAL,
+    tcp_delay     INTEGER,
+    clash_delay   INTEGER,
+    bandwidth     TEXT,
+    quality_score REAL,
+    region        TEXT,
+    region_code   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_nodes_alive ON nodes (last_alive);
+CREATE INDEX IF NOT EXISTS idx_nodes_region ON nodes (region_code, last_alive);
+CREATE INDEX IF NOT EXISTS idx_nodes_tcp ON nodes (tcp_delay);
+CREATE TABLE IF NOT EXISTS state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# load() 允许的排序字段（延迟类为空时排在最后）
+_ORDER_BY = {
+    'tcp_delay': 'tcp_delay IS NULL, tcp_delay',
+    'clash_delay': 'clash_delay IS NULL, clash_delay',
+    'quality_score': 'quality_score IS NULL, quality_score DESC',
+    'last_alive': 'last_alive IS NULL, last_alive DESC',
+    'last_seen': 'last_seen DESC',
+}
+
+
+def _config_json(proxy):
+    """节点的协议配置（不含地区 / 测速结果），紧凑 JSON。"""
+    if isinstance(proxy, Proxy):
+        data = proxy.to_clash(meta=False)
+    else:
+        data = {k: v for k, v in proxy.items() if k not in META_FIELDS}
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _port(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _region(proxy):
+    info = proxy.get('region_info')
+    if isinstance(info, dict):
+        return info.get('name'), info.get('code')
+    return None, None
+
+
+class NodeStore:
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=DELETE')   # 以前的版本用过 WAL：这里会把残留的 -wal 合并回库文件
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._init_schema()
+        self.added = 0
+        self.updated = 0
+
+    def _init_schema(self):
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            # 表结构不兼容：节点库只是缓存，直接重建（脚本会回退到 YAML）
+            self._db.executescript('DROP TABLE IF EXISTS nodes; DROP TABLE IF EXISTS state;')
+        self._db.executescript(_SCHEMA)
+        self._db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
+
+    # ----- 写入 -----
+    def upsert(self, proxies, source=None, now=None):
+        """合并节点：新指纹插入，已有的更新配置、来源和最近出现时间（首次出现时间和测速结果保留）。"""
+        now = now or time.time()
+        keyed = []
+        for proxy in proxies:
+            fp = fingerprint(proxy)
+            if fp is not None:
+                keyed.append((fp, proxy))
+        return self._upsert_rows(keyed, source, now)
+
+    def _upsert_rows(self, keyed, source, now):
+        rows = [(fp, str(proxy.get('type', '')), str(proxy.get('server', '')), _port(proxy.get('port')),
+                 _config_json(proxy), source, now, now) for fp, proxy in keyed]
+        if not rows:
+            return 0
+        with self._lock:
+            before = self._db.total_changes
+            existing = self._db.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
+            self._db.executemany(
+                """INSERT INTO nodes (fp, type, server, port, config, source, first_seen, last_seen)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(fp) DO UPDATE SET
+                       config = excluded.config,
+                       source = COALESCE(excluded.source, nodes.source),
+                       last_seen = excluded.last_seen""", rows)
+            added = self._db.execute('SELECT COUNT(*) FROM nodes').fetchone()[0] - existing
+            self.added += added
+            self.updated += self._db.total_changes - before - added
+        return added
+
+    def record_results(self, proxies, now=None):
+        """写入测速 / 评分结果并标记存活；节点不在库里时先插入。"""
+        now = now or time.time()
+        keyed, rows = [], []
+        for proxy in proxies:
+            fp = fingerprint(proxy)
+            if fp is None:
+                continue
+            keyed.append((fp, proxy))
+            region, region_code = _region(proxy)
+            bandwidth = proxy.get('bandwidth')
+            rows.append((proxy.get('tcp_delay'), proxy.get('clash_delay'),
+                         str(bandwidth) if bandwidth is not None else None, proxy.get('quality_score'),
+                         region, region_code, now, fp))
+        if not rows:
+            return 0
+        self._upsert_rows(keyed, None, now)
+        with self._lock:
+            self._db.executemany(
+                """UPDATE nodes SET
+                       tcp_delay = COALESCE(?, tcp_delay),
+                       clash_delay = COALESCE(?, clash_delay),
+                       bandwidth = COALESCE(?, bandwidth),
+                       quality_score = COALESCE(?, quality_score),
+                       region = COALESCE(?, region),
+                       region_code = COALESCE(?, region_code),
+                       last_alive = ?
+                   WHERE fp = ?""", rows)
+        return len(rows)
+
+    # ----- 查询 -----
+    def load(self, alive_within=None, seen_within=None, region=None, types=None,
+             order_by='last_alive', limit=None, now=None):
+        """
+        按条件取出节点，返回 Proxy（协议配置 + 库里保存的测速结果）。
+            alive_within / seen_within  最近多少秒内存活 / 出现过
+            region                      地区代码（如 'HK'）或地区名
+            types                       协议集合
+        """
+        now = now or time.time()
+        where, args = [], []
+        if alive_within is not None:
+            where.append('last_alive >= ?')
+            args.append(now - alive_within)
+        if seen_within is not None:
+            where.append('last_seen >= ?')
+            args.append(now - seen_within)
+        if region:
+            where.append('(region_code = ? OR region = ?)')
+            args += [region, region]
+        if types:
+            types = list(types)
+            where.append(f"type IN ({','.join('?' * len(types))})")
+            args += types
+        sql = 'SELECT * FROM nodes'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY ' + _ORDER_BY.get(order_by, _ORDER_BY['last_alive'])
+        if limit:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [self._to_proxy(row) for row in rows]
+
+    @staticmethod
+    def _to_proxy(row):
+        proxy = Proxy.from_dict(json.loads(row['config']))
+        for key in ('tcp_delay', 'clash_delay', 'bandwidth', 'quality_score'):
+            if row[key] is not None:
+                setattr(proxy, key, row[key])
+        if row['region'] is not None:
+            proxy.region_info = {'name': row['region'], 'code': row['region_code']}
+        return proxy
+
+    def export(self, meta=True, **query):
+        """YAML 视图：按 load() 的条件导出 Clash 节点字典列表。"""
+        return [proxy.to_clash(meta) for proxy in self.load(**query)]
+
+    # ----- 运行状态 -----
+    def get_state(self, key, default=None):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return default
+
+    def set_state(self, key, value):
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._db.execute('INSERT INTO state (key, value) VALUES (?, ?) '
+                             'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, data))
+
+    # ----- 保存 -----
+    def prune(self, ttl=STORE_TTL, now=None):
+        """清理超过 ttl 秒既没出现也没存活的节点。"""
+        cutoff = (now or time.time()) - ttl
+        with self._lock:
+            cursor = self._db.execute('DELETE FROM nodes WHERE last_seen < ? AND (last_alive IS NULL OR last_alive < ?)',
+                                      (cutoff, cutoff))
+            return cursor.rowcount
+
+    def save(self):
+        pruned = self.prune()
+        with self._lock:
+            self._db.commit()
+            total = self._db.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
+        print(f"  🗄️ 节点库: 新增 {self.added} / 更新 {self.updated}，共 {total} 个节点"
+              + (f"（清理 {pruned} 个过期节点）" if pruned else ""))
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+_store = None
+_store_failed = False
+_store_lock = threading.Lock()
+
+
+def get_store() -> NodeStore | None:
+    """返回进程级共享节点库；NODE_STORE=false 或打不开时返回 None。"""
+    global _store, _store_failed
+    if not STORE_ENABLED or _store_failed:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None and not _store_failed:
+                try:
+                    _store = NodeStore()
+                except sqlite3.Error as e:
+                    _store_failed = True
+                    print(f"⚠️ 打开节点库失败，改用 YAML: {e}")
+    return _store
+
+
+def save_store():
+    """提交并关闭节点库；之后再调用 get_store() 会重新打开。"""
+    global _store
+    with _store_lock:
+        node_store, _store = _store, None
+    if node_store is not None:
+        try:
+            node_store.save()
+        except Exception as e:
+            print(f"⚠️ 保存节点库失败: {e}")
+        finally:
+            try:
+                node_store.close()
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+订阅内容流式处理
+- 按块读取响应并限制单个订阅的最大字节数（SUB_MAX_MB，默认 20MB），超限直接放弃
+- LineSplitter: 增量按行切分，跨块的半行留到下一块
+- Base64Decoder: 增量 Base64 解码，规则与原 is_base64 + b64decode(validate=True) 一致
+- decode_base64 / iter_lines: 已经收完的内容按字节一次完成 Base64 校验和解码、按行切分，
+  只有切出来的单行才解码成 str（不再整段 join / 编码 / 解码来回转换）
+- SubscriptionSink: 用 nodelib.sniff 根据开头内容判断订阅格式和编码
+    lines   明文 vmess:// ss:// ... 链接，边收边解析
+    base64  整体 Base64 编码的链接列表，边收边解码、边解析
+    buffer  YAML / JSON 等需要完整内容才能解析的格式，收完后按嗅探结果交给对应解析器
+    HTML 错误页不缓冲内容，调用方可以直接停止读取
+  明文 / Base64 订阅按行凑成块解析，大订阅的块交给 nodelib.parallel 的进程池，峰值内存不随订阅大小增长
+"""
+import binascii
+import os
+import re
+from collections import defaultdict
+
+from nodelib import parallel, sniff
+
+MAX_SUBSCRIPTION_BYTES = int(float(os.getenv('SUB_MAX_MB', '20')) * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+RECOVER_TAIL_BYTES = 64 * 1024  # Base64 判断失误时可回退的最长行
+
+MODE_LINES = 'lines'
+MODE_BASE64 = 'base64'
+MODE_BUFFER = 'buffer'
+
+_B64_HEAD_RE = re.compile(rb'^[A-Za-z0-9+/=]+$')
+_WS_BYTES = b' \t\r\n\x0b\x0c'
+
+
+class BodyTooLarge(Exception):
+    """订阅内容超过 MAX_SUBSCRIPTION_BYTES。"""
+
+
+class InvalidBase64(ValueError):
+    pass
+
+
+def iter_limited(chunks, max_bytes=MAX_SUBSCRIPTION_BYTES):
+    """给任意字节块迭代器加上总大小上限。"""
+    total = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise BodyTooLarge(f"订阅内容超过 {max_bytes // (1024 * 1024)}MB 上限")
+        yield chunk
+
+
+def decode_lines(raw, encoding='utf-8'):
+    """把一行字节解码成去掉首尾空白的非空行（行内的 \\r 等其它换行符也会切开）。"""
+    for line in raw.decode(encoding, errors='ignore').splitlines():
+        line = line.strip()
+        if line:
+            yield line
+
+
+def iter_lines(data, encoding='utf-8'):
+    """按 \\n 切分完整的字节内容，逐行解码，结果与整段解码后 splitlines() 再 strip() 相同。"""
+    for raw in bytes(data).split(b'\n'):
+        yield from decode_lines(raw, encoding)
+
+
+def decode_base64(data):
+    """
+    一次完成原 is_base64 的判定和解码（规则同 Base64Decoder）：忽略空白，只允许 [A-Za-z0-9+/=]、
+    总长度是 4 的倍数、'=' 只能出现在末尾。data 可以是 str / bytes / memoryview；不是合法 Base64 时返回 None。
+    """
+    if isinstance(data, str):
+        if not data.isascii():
+            data = ''.join(data.split())    # 全角空格等非 ASCII 空白
+            if not data.isascii():
+                return None
+        data = data.encode('ascii')
+    data = bytes(data).translate(None, _WS_BYTES)
+    if not data or len(data) % 4 or not _B64_HEAD_RE.match(data):
+        return None
+    try:
+        return binascii.a2b_base64(data, strict_mode=True)
+    except binascii.Error:
+        return None
+
+
+class LineSplitter:
+    """增量按 \\n 切行，返回 bytes 行（不含换行符）。"""
+
+    def __init__(self):
+        self._pending = b''
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk if self._pending else chunk
+        lines = data.split(b'\n')
+        self._pending = lines.pop()
+        return lines
+
+    def flush(self):
+        rest, self._pending = self._pending, b''
+        return [rest] if rest else []
+
+
+class Base64Decoder:
+    """
+    增量 Base64 解码（标准字母表，忽略空白）。
+    与原来的 is_base64 判定一致：只允许 [A-Za-z0-9+/=]、总长度是 4 的倍数、'=' 只能出现在末尾。
+    """
+
+    def __init__(self):
+        self._pending = b''
+        self._finished = False   # 已经遇到填充符，后面不能再有数据
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = chunk.translate(None, _WS_BYTES)
+        if not data:
+            return b''
+        if self._finished:
+            raise InvalidBase64('填充符之后仍有数据')
+        data = self._pending + data
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        if not usable:
+            return b''
+        block = memoryview(data)[:usable]   # 不再复制一份整块
+        if not _B64_HEAD_RE.match(block):
+            raise InvalidBase64('包含非 Base64 字符')
+        if data.find(b'=', 0, usable) >= 0:
+            self._finished = True
+        try:
+            return binascii.a2b_base64(block, strict_mode=True)
+        except binascii.Error as e:
+            raise InvalidBase64(str(e))
+
+    def close(self):
+        if self._pending:
+            raise InvalidBase64('长度不是 4 的倍数')
+
+
+class SubscriptionSink:
+    """
+    边下载边解析的订阅接收器。
+    参数:
+        line_parser: line_parser(line: str) -> (proto, proxy)，proxy 为 None 表示解析失败，
+                     proto 为 None 表示不是节点链接（标题、注释等），不计入失败数；
+                     需要是模块级函数，大订阅才能分块交给进程池解析
+        cache: 可选的 nodelib.parse_cache.ParseCache，已经解析过的链接直接取上次的结果
+    feed() 逐块喂入原始字节；close() 后读取:
+        mode      处理方式（lines / base64 / buffer）
+        kind      嗅探出的格式（nodelib.sniff.KIND_*），encoding 为检测出的编码
+        proxies   lines / base64 模式解析出的节点
+        success / failure  各协议成功、失败计数
+        text      buffer 模式下的完整内容（其余模式为 None）
+    """
+
+    def __init__(self, line_parser, cache=None):
+        self.line_parser = line_parser
+        self._parser = parallel.ChunkedParser(line_parser, cache=cache)
+        self.mode = None
+        self.kind = None
+        self.encoding = 'utf-8'
+        self.proxies = []
+        self.success = defaultdict(int)
+        self.failure = defaultdict(int)
+        self.text = None
+        self.size = 0
+        self._head = b''
+        self._buffer = []
+        self._splitter = LineSplitter()
+        self._decoder = None
+        self._decoded_splitter = None
+        self._raw_tail = b''          # base64 模式下当前原始行（用于回退）
+        self._tail_overflow = False
+
+    @property
+    def rejected(self):
+        """内容是 HTML 页面（面板错误页 / 验证页），后面的数据不必再读。"""
+        return self.kind == sniff.KIND_HTML
+
+    # ----- 逐行解析 -----
+    def _parse_line(self, raw: bytes):
+        for line in decode_lines(raw, self.encoding):
+            self._parser.add(line)
+
+    def _feed_lines(self, chunk):
+        for raw in self._splitter.feed(chunk):
+            self._parse_line(raw)
+
+    def _feed_base64(self, chunk):
+        try:
+            decoded = self._decoder.feed(chunk)
+        except InvalidBase64:
+            self._fallback_to_lines(chunk)
+            return
+        # 记住当前未结束的原始行：判断失误（其实是带标题的明文列表）时从这一行开始回退
+        last_nl = chunk.rfind(b'\n')
+        if last_nl >= 0:
+            self._raw_tail, self._tail_overflow = chunk[last_nl + 1:], False
+        elif not self._tail_overflow:
+            self._raw_tail += chunk
+            if len(self._raw_tail) > RECOVER_TAIL_BYTES:
+                self._raw_tail, self._tail_overflow = b'', True
+        for raw in self._decoded_splitter.feed(decoded):
+            self._parse_line(raw)
+
+    def _reset_results(self):
+        self._parser.reset()
+
+    def _fallback_to_lines(self, chunk):
+        """Base64 解码失败：改按明文逐行解析，从出错所在行重新开始。"""
+        self._reset_results()
+        self._decoder = self._decoded_splitter = None
+        if self._tail_overflow:
+            # 出错的行太长无法回退，与原逻辑一样视为无法解析
+            self.mode = MODE_BUFFER
+            self._buffer = None
+            return
+        self.mode = MODE_LINES
+        self.kind = sniff.KIND_URI_LIST
+        data, self._raw_tail = self._raw_tail + chunk, b''
+        self._feed_lines(data)
+
+    def _dispatch(self, chunk):
+        if self.mode == MODE_LINES:
+            self._feed_lines(chunk)
+        elif self.mode == MODE_BASE64:
+            self._feed_base64(chunk)
+        elif self._buffer is not None:
+            self._buffer.append(chunk)
+
+    def _start(self, sniffed):
+        self.kind, self.encoding = sniffed.kind, sniffed.encoding
+        head, self._head = self._head, b''
+        if sniffed.encoding == 'utf-16':
+            # 不能按字节切行，整体缓冲后解码
+            self.mode = MODE_BUFFER
+        elif sniffed.kind == sniff.KIND_URI_LIST:
+            self.mode = MODE_LINES
+            head = head[sniffed.bom:]
+        elif sniffed.kind == sniff.KIND_BASE64:
+            self.mode = MODE_BASE64
+            self._decoder = Base64Decoder()
+            self._decoded_splitter = LineSplitter()
+            head = head[sniffed.bom:]
+        else:
+            self.mode = MODE_BUFFER
+            if sniffed.kind == sniff.KIND_HTML:
+                self._buffer = None
+        self._dispatch(head)
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.mode is None:
+            self._head += chunk
+            sniffed = sniff.sniff(self._head)
+            if sniffed:
+                self._start(sniffed)
+            return
+        self._dispatch(chunk)
+
+    def close(self):
+        if self.mode is None:
+            self._start(sniff.sniff(self._head, final=True))
+        if self.mode == MODE_LINES:
+            for raw in self._splitter.flush():
+                self._parse_line(raw)
+        elif self.mode == MODE_BASE64:
+            try:
+                self._decoder.close()
+                for raw in self._decoded_splitter.flush():
+                    self._parse_line(raw)
+            except InvalidBase64:
+                self._reset_results()
+        elif self._buffer is not None:
+            self.text = b''.join(self._buffer).decode(self.encoding, errors='ignore')
+            self._buffer = None
+        self._parser.close()
+        self.proxies = self._parser.proxies
+        self.success, self.failure = self._parser.success, self._parser.failure
+        return self
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+订阅内容本地缓存（条件请求 + LRU 淘汰）
+- 以 URL 为键保存 ETag / Last-Modified / 内容哈希，下次请求自动带上
+  If-None-Match / If-Modified-Since，服务器返回 304 时直接使用缓存内容
+- 内容哈希不变时可直接复用上次解析出的节点列表，跳过整个解析流程；
+  解析代码（nodelib.parse_cache 的代码指纹）或解析时的筛选规则（nodelib.filters）变了就不再复用，不能原样经 JSON 往返的节点列表不缓存
+- 总大小超过上限时按最近使用时间淘汰（LRU）；目录配合 actions/cache 可跨运行保留
+- open_stream() 按块读取：边下载边写入缓存临时文件，完整读完才替换旧内容
+环境变量:
+    SUB_CACHE_DIR     缓存目录，默认 .cache/subscriptions
+    SUB_CACHE_MAX_MB  缓存总大小上限（MB），默认 200
+    SUB_CACHE         设为 false 可关闭缓存
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from nodelib import filters, http_client, parse_cache
+from nodelib.stream import CHUNK_SIZE, MAX_SUBSCRIPTION_BYTES, BodyTooLarge, iter_limited
+
+CACHE_ENABLED = os.getenv('SUB_CACHE', 'true').strip().lower() not in ('false', '0', 'no')
+CACHE_DIR = os.getenv('SUB_CACHE_DIR', os.path.join('.cache', 'subscriptions'))
+CACHE_MAX_BYTES = int(float(os.getenv('SUB_CACHE_MAX_MB', '200')) * 1024 * 1024)
+
+INDEX_FILE = 'index.json'
+
+
+def body_digest(body) -> str:
+    """订阅内容的 sha256（str 按 utf-8 编码后计算）。"""
+    if isinstance(body, str):
+        body = body.encode('utf-8', errors='ignore')
+    return hashlib.sha256(body).hexdigest()
+
+
+def _atomic_write(path, data: bytes):
+    dir_path = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SubscriptionCache:
+    """
+    线程安全的订阅缓存。索引保存在 index.json，内容与节点列表按 URL 哈希分文件保存:
+        <key>.body        原始订阅内容
+        <key>.nodes.json  上次解析出的节点列表（与 nodes_sha 对应的内容）
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self.version = parse_cache._code_version()
+        self.started = time.time()     # 早于这个时间的 .tmp- 文件是以前的运行中断留下的
+        os.makedirs(self.root, exist_ok=True)
+        self._index = self._load_index()
+
+    # ----- 索引 -----
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"⚠️ 订阅缓存索引损坏，已重建: {e}")
+            return {}
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, url, suffix):
+        return os.path.join(self.root, self._key(url) + suffix)
+
+    def _touch(self, entry):
+        entry['last_used'] = time.time()
+
+    # ----- 条件请求 -----
+    def conditional_headers(self, url) -> dict:
+        with self._lock:
+            entry = self._index.get(url)
+            if not entry or not os.path.exists(self._path(url, '.body')):
+                return {}
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    # ----- 内容 -----
+    def get_body(self, url) -> bytes | None:
+        with self._lock:
+            entry = self._index.get(url)
+            if not entry:
+                return None
+            try:
+                with open(self._path(url, '.body'), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                self._index.pop(url, None)
+                return None
+            self._touch(entry)
+            return body
+
+    def put(self, url, body: bytes, etag=None, last_modified=None) -> str:
+        digest = body_digest(body)
+        with self._lock:
+            entry = self._index.get(url) or {}
+            if entry.get('sha') != digest or not os.path.exists(self._path(url, '.body')):
+                _atomic_write(self._path(url, '.body'), body)
+            entry.update({
+                'etag': etag,
+                'last_modified': last_modified,
+                'sha': digest,
+                'size': len(body),
+            })
+            self._touch(entry)
+            self._index[url] = entry
+        return digest
+
+    def cached_body(self, url):
+        """返回 (内容文件路径, sha256, 大小)，没有缓存时返回 None。"""
+        with self._lock:
+            entry = self._index.get(url)
+            path = self._path(url, '.body')
+            if not entry or not entry.get('sha') or not os.path.exists(path):
+                return None
+            self._touch(entry)
+            return path, entry['sha'], entry.get('size', 0)
+
+    def open_body_writer(self):
+        """新建缓存临时文件，返回 (文件对象, 路径)；由 commit_body 落盘或调用方删除。"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        return os.fdopen(fd, 'wb'), tmp_path
+
+    def commit_body(self, url, tmp_path, digest, size, etag=None, last_modified=None):
+        with self._lock:
+            os.replace(tmp_path, self._path(url, '.body'))
+            entry = self._index.get(url) or {}
+            entry.update({
+                'etag': etag,
+                'last_modified': last_modified,
+                'sha': digest,
+                'size': size,
+            })
+            self._touch(entry)
+            self._index[url] = entry
+
+    # ----- 解析结果 -----
+    def _nodes_version(self):
+        # 节点列表是按当时的筛选规则解析出来的，被规则丢掉的节点不在里面
+        return f"{self.version}|{filters.active().signature()}"
+
+    def get_nodes(self, url, digest) -> list | None:
+        """内容哈希、解析代码和筛选规则都与上次解析时一致时，返回上次解析出的节点列表。"""
+        with self._lock:
+            entry = self._index.get(url)
+            if not entry or entry.get('nodes_sha') != digest or entry.get('nodes_version') != self._nodes_version():
+                return None
+            try:
+                with open(self._path(url, '.nodes.json'), 'r', encoding='utf-8') as f:
+                    nodes = json.load(f)
+            except (OSError, ValueError):
+                entry.pop('nodes_sha', None)
+                return None
+            self._touch(entry)
+            return nodes if isinstance(nodes, list) else None
+
+    def put_nodes(self, url, digest, nodes):
+        """
+        保存解析结果；YAML 里的日期、非字符串键（如 on: yes 解析出的 True）等经 JSON 往返会变样，
+        这样的节点列表不缓存，下次照常解析，保证命中与不命中时结果一致。
+        """
+        try:
+            text = json.dumps(nodes, ensure_ascii=False)
+            if json.loads(text) != nodes:
+                return False
+        except (TypeError, ValueError):
+            return False
+        data = text.encode('utf-8')
+        with self._lock:
+            entry = self._index.setdefault(url, {})
+            _atomic_write(self._path(url, '.nodes.json'), data)
+            entry['nodes_sha'] = digest
+            entry['nodes_version'] = self._nodes_version()
+            entry['nodes_size'] = len(data)
+            self._touch(entry)
+        return True
+
+    # ----- 持久化与淘汰 -----
+    def _evict(self):
+        total = sum(e.get('size', 0) + e.get('nodes_size', 0) for e in self._index.values())
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        for url, entry in sorted(self._index.items(), key=lambda kv: kv[1].get('last_used', 0)):
+            if total <= self.max_bytes:
+                break
+            total -= entry.get('size', 0) + entry.get('nodes_size', 0)
+            del self._index[url]
+            evicted += 1
+        return evicted
+
+    def save(self):
+        """
+        淘汰超限条目、清理孤儿文件并写回索引。
+        本次运行创建的 .tmp- 文件不删：下载阶段超时放弃后，还在进行的下载仍在往里写，之后要 commit_body。
+        """
+        with self._lock:
+            evicted = self._evict()
+            keep = {INDEX_FILE}
+            for url in self._index:
+                key = self._key(url)
+                keep.update({key + '.body', key + '.nodes.json'})
+            for name in os.listdir(self.root):
+                if name in keep:
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    if name.startswith('.tmp-') and os.path.getmtime(path) >= self.started:
+                        continue
+                    os.remove(path)
+                except OSError:
+                    pass
+            data = json.dumps(self._index, ensure_ascii=False, indent=1).encode('utf-8')
+            _atomic_write(os.path.join(self.root, INDEX_FILE), data)
+        if evicted:
+            print(f"🗃️ 订阅缓存超过上限，已淘汰 {evicted} 个最久未使用的条目")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> SubscriptionCache | None:
+    """返回进程级共享缓存；SUB_CACHE=false 或目录不可写时返回 None。"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = SubscriptionCache()
+                except OSError as e:
+                    print(f"⚠️ 订阅缓存不可用: {e}")
+                    return None
+    return _cache
+
+
+def save_cache():
+    if _cache is not None:
+        try:
+            _cache.save()
+        except Exception as e:
+            print(f"⚠️ 保存订阅缓存失败: {e}")
+
+
+def cached_get(url, user_agent=http_client.CLASH_UA, timeout=30, verify=True, headers=None):
+    """
+    带条件请求的下载。
+    返回 (body_bytes, from_cache)；下载失败抛出异常（与 requests 一致）。
+    """
+    cache = get_cache()
+    if cache is None:
+        r = http_client.get(url, user_agent=user_agent, headers=headers, timeout=timeout, verify=verify)
+        r.raise_for_status()
+        return r.content, False
+
+    req_headers = dict(headers or {})
+    req_headers.update(cache.conditional_headers(url))
+    r = http_client.get(url, user_agent=user_agent, headers=req_headers, timeout=timeout, verify=verify)
+    if r.status_code == 304:
+        body = cache.get_body(url)
+        if body is not None:
+            return body, True
+        # 索引有记录但内容文件丢失：去掉条件头重新完整下载
+        r = http_client.get(url, user_agent=user_agent, headers=headers, timeout=timeout, verify=verify)
+    r.raise_for_status()
+    body = r.content
+    cache.put(url, body, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+    return body, False
+
+
+class BodyStream:
+    """
+    订阅内容的逐块读取器，配合 with 使用:
+    - 304 命中缓存时从本地文件读取，digest / size 立即可用
+    - 200 时边读边计算哈希、边写入缓存临时文件，完整读完才替换旧缓存；
+      中途出错或超出大小上限时丢弃临时文件
+    """
+
+    def __init__(self, url, response=None, cache=None, cached=None, max_bytes=MAX_SUBSCRIPTION_BYTES):
+        self.url = url
+        self.response = response
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.from_cache = cached is not None
+        self.digest = None
+        self.size = 0
+        self._cached_path = None
+        self._complete = False
+        self._writer = None
+        self._tmp_path = None
+        if cached is not None:
+            self._cached_path, self.digest, self.size = cached
+
+    def __iter__(self):
+        if self.from_cache:
+            with open(self._cached_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    yield chunk
+            self._complete = True
+            return
+        hasher = hashlib.sha256()
+        if self.cache is not None:
+            self._writer, self._tmp_path = self.cache.open_body_writer()
+        for chunk in iter_limited(self.response.iter_content(CHUNK_SIZE), self.max_bytes):
+            hasher.update(chunk)
+            self.size += len(chunk)
+            if self._writer is not None:
+                self._writer.write(chunk)
+            yield chunk
+        self.digest = hasher.hexdigest()
+        self._complete = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.response is not None:
+            self.response.close()
+        if self._writer is not None:
+            self._writer.close()
+            if self._complete and exc_type is None and self.size:
+                self.cache.commit_body(
+                    self.url, self._tmp_path, self.digest, self.size,
+                    self.response.headers.get('ETag'), self.response.headers.get('Last-Modified'),
+                )
+            else:
+                try:
+                    os.remove(self._tmp_path)
+                except OSError:
+                    pass
+        return False
+
+
+def open_stream(url, user_agent=http_client.CLASH_UA, timeout=30, verify=True, headers=None,
+                max_bytes=MAX_SUBSCRIPTION_BYTES):
+    """
+    带条件请求的流式下载，返回 BodyStream；HTTP 错误、超出大小上限时抛出异常。
+    """
+    cache = get_cache()
+    req_headers = dict(headers or {})
+    if cache is not None:
+        req_headers.update(cache.conditional_headers(url))
+    r = http_client.get(url, user_agent=user_agent, headers=req_headers, timeout=timeout, verify=verify, stream=True)
+    if r.status_code == 304 and cache is not None:
+        r.close()
+        cached = cache.cached_body(url)
+        if cached is not None:
+            return BodyStream(url, cached=cached, max_bytes=max_bytes)
+        # 索引有记录但内容文件丢失：去掉条件头重新完整下载
+        r = http_client.get(url, user_agent=user_agent, headers=headers, timeout=timeout, verify=verify, stream=True)
+    try:
+        r.raise_for_status()
+        length = r.headers.get('Content-Length')
+        if max_bytes and length and length.isdigit() and int(length) > max_bytes:
+            raise BodyTooLarge(f"订阅内容 {int(length) // (1024 * 1024)}MB 超过上限")
+    except Exception:
+        r.close()
+        raise
+    return BodyStream(url, response=r, cache=cache, max_bytes=max_bytes)
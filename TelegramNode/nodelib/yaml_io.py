@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+YAML 读写（优先使用 libyaml C 实现，没有时退回纯 Python 的 PyYAML）
+- safe_load: CSafeLoader，比 SafeLoader 快 5 倍左右；C 解析器拒绝的内容再用纯 Python 解析一次，
+  保证能解析的内容和原来完全一样
+- dump / safe_dump: 参数与 yaml.dump / yaml.safe_dump 相同，输出与纯 Python 版逐字节一致
+  libyaml 会把 emoji 等 BMP 以外的字符（节点名里的国旗）转义成 "\\U0001F1ED"，而纯 Python 版
+  allow_unicode=True 时原样输出。这里先把这些字符临时替换成私用区字符再交给 C 输出，写出前换回，
+  两种实现对私用区字符的处理相同，所以结果一致；遇到替换不了的情况直接走纯 Python 版
+- 字符串含不可打印字符（\\t、\\ufeff 等）或换行时，两种实现选的引号风格 / 转义写法不同（纯 Python 版
+  写双引号时还会把 BMP 以外的字符转义成 "\\U...."）；指定 default_style 时两者的类型标签写法也不同。
+  映射键能否写成简单键，纯 Python 版按字符数（含 !!str 标签）判断、libyaml 按 UTF-8 字节数判断，长键也可能不同。
+  这些情况都走纯 Python 版，节点配置里很少出现，不影响常见情况的速度
+"""
+import re
+
+import yaml
+
+try:
+    from yaml import CDumper as _CDumper
+    from yaml import CSafeDumper as _CSafeDumper
+    from yaml import CSafeLoader as _CSafeLoader
+    LIBYAML = True
+except ImportError:
+    _CDumper = _CSafeDumper = _CSafeLoader = None
+    LIBYAML = False
+
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+_PRIVATE_RE = re.compile('[\uE000-\uF8FF]')
+# PyYAML 认为不可打印的字符以及换行：含这些字符的字符串 libyaml 与纯 Python 版写法不同
+_QUOTED_RE = re.compile('[^\x20-\x7E\xA0-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFE]|[\uFEFF\u2028\u2029]')
+# 不超过这个 UTF-8 字节数的字符串键，两种实现都写成简单键（纯 Python 版：字符数 + 5 < 128，libyaml：字节数 <= 128）
+_SIMPLE_KEY_BYTES = 100
+_PRIVATE_BASE = 0xE000
+_PRIVATE_SIZE = 0xF8FF - 0xE000 + 1
+
+
+class _Unsupported(Exception):
+    """数据里有无法安全替换的内容，改用纯 Python 输出。"""
+
+
+def safe_load(stream):
+    """同 yaml.safe_load，stream 可以是字符串、字节或文件对象。"""
+    if not LIBYAML:
+        return yaml.safe_load(stream)
+    if hasattr(stream, 'read'):
+        stream = stream.read()
+    try:
+        return yaml.load(stream, Loader=_CSafeLoader)
+    except yaml.YAMLError:
+        # libyaml 对少数写法比纯 Python 版严格，失败时再按原来的方式解析一次
+        return yaml.safe_load(stream)
+
+
+def _shield(data, table, memo):
+    """复制 dict / list 结构，把字符串里的 BMP 以外字符替换成私用区字符；共享的对象仍然共享（保留锚点）。"""
+    if isinstance(data, str):
+        if _PRIVATE_RE.search(data):
+            raise _Unsupported('内容本身包含私用区字符')
+        if _QUOTED_RE.search(data):
+            raise _Unsupported('含不可打印字符或换行')
+        if not _ASTRAL_RE.search(data):
+            return data
+
+        def placeholder(match):
+            char = match.group()
+            if char not in table:
+                if len(table) >= _PRIVATE_SIZE:
+                    raise _Unsupported('特殊字符太多')
+                table[char] = chr(_PRIVATE_BASE + len(table))
+            return table[char]
+
+        return _ASTRAL_RE.sub(placeholder, data)
+    kind = type(data)
+    if kind is dict:
+        if id(data) in memo:
+            return memo[id(data)]
+        copied = memo[id(data)] = {}
+        for key, value in data.items():
+            if isinstance(key, str) and len(key) * 4 > _SIMPLE_KEY_BYTES and len(key.encode('utf-8')) > _SIMPLE_KEY_BYTES:
+                raise _Unsupported('映射键太长')
+            copied[_shield(key, table, memo)] = _shield(value, table, memo)
+        return copied
+    if kind is list:
+        if id(data) in memo:
+            return memo[id(data)]
+        copied = memo[id(data)] = []
+        copied.extend(_shield(item, table, memo) for item in data)
+        return copied
+    if kind in (int, float, bool) or data is None:
+        return data
+    raise _Unsupported(kind.__name__)
+
+
+def _dump(data, stream, python_dumper, c_dumper, kwargs):
+    # 只在输出 Unicode 文本时使用 C 实现；转义输出 / 指定编码 / 指定 default_style 时两者格式不同
+    if c_dumper is None or not kwargs.get('allow_unicode') or kwargs.get('encoding') or kwargs.get('default_style'):
+        return yaml.dump(data, stream, Dumper=python_dumper, **kwargs)
+    table = {}
+    try:
+        shielded = _shield(data, table, {})
+    except (_Unsupported, RecursionError):
+        return yaml.dump(data, stream, Dumper=python_dumper, **kwargs)
+    text = yaml.dump(shielded, Dumper=c_dumper, **kwargs)
+    if table:
+        restore = {placeholder: char for char, placeholder in table.items()}
+        text = _PRIVATE_RE.sub(lambda m: restore.get(m.group(), m.group()), text)
+    if stream is None:
+        return text
+    stream.write(text)
+    return None
+
+
+def dump(data, stream=None, **kwargs):
+    """同 yaml.dump。"""
+    return _dump(data, stream, yaml.Dumper, _CDumper, kwargs)
+
+
+def safe_dump(data, stream=None, **kwargs):
+    """同 yaml.safe_dump。"""
+    return _dump(data, stream, yaml.SafeDumper, _CSafeDumper, kwargs)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Clash 订阅的流式 proxies 提取
+- yaml.safe_load 会把整份配置（几千条 rules、proxy-groups）都构造成 Python 对象，而我们只要 proxies
+- 这里直接遍历 YAML 事件流（有 libyaml 时用 C 解析器），只把顶层 proxies 列表里的条目逐个构造出来，
+  其余部分只走事件不建对象；内存只与单个节点有关
+- 结果与 safe_load 后取 proxies 一致：标量类型按 SafeLoader 规则解析，支持锚点 / 别名和 << 合并
+- 传入 spec（nodelib.filters.FilterSpec）时，在构造节点对象之前按 type / cipher 标量丢弃不保留的节点
+用法:
+    for proxy in iter_proxies(text): ...      # 逐个产出
+    proxies = load_proxies(text)              # 列表；没有 proxies 列表时返回 None
+    proxies = load_proxies(text, spec=filters.active())
+"""
+import yaml
+from yaml.composer import ComposerError
+from yaml.events import (
+    AliasEvent, DocumentStartEvent, MappingEndEvent, MappingStartEvent, ScalarEvent,
+    SequenceEndEvent, SequenceStartEvent, StreamEndEvent,
+)
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    _Loader = yaml.SafeLoader
+
+PROXIES_KEY = 'proxies'
+
+# 后出现的重复 proxies 键不是列表时产出这个标记（safe_load 的结果里也就没有可用的 proxies）
+_RESTART = object()
+
+
+class _Walker:
+    """在事件流上按需组装节点，其余事件直接跳过。"""
+
+    def __init__(self, stream, loader=_Loader):
+        self.loader = loader(stream)
+        self.next = self.loader.get_event
+        self.resolver = yaml.resolver.Resolver()
+        self.constructor = yaml.constructor.SafeConstructor()
+        self.anchors = {}
+
+    # ----- 组装单个节点（与 yaml.composer.Composer 的逻辑一致） -----
+    def compose(self, event):
+        if isinstance(event, AliasEvent):
+            if event.anchor not in self.anchors:
+                raise ComposerError(None, None, f"found undefined alias {event.anchor!r}", event.start_mark)
+            return self.anchors[event.anchor]
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.resolver.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.resolver.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            self._remember(event, node)
+            child = self.next()
+            while not isinstance(child, SequenceEndEvent):
+                node.value.append(self.compose(child))
+                child = self.next()
+            node.end_mark = child.end_mark
+            return node
+        elif isinstance(event, MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.resolver.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            self._remember(event, node)
+            child = self.next()
+            while not isinstance(child, MappingEndEvent):
+                key = self.compose(child)
+                node.value.append((key, self.compose(self.next())))
+                child = self.next()
+            node.end_mark = child.end_mark
+            return node
+        else:
+            raise ComposerError(None, None, f"unexpected event {event}", event.start_mark)
+        self._remember(event, node)
+        return node
+
+    def _remember(self, event, node):
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+
+    def skip(self, event):
+        """跳过一个节点；带锚点的子树要组装起来，后面的 proxies 可能会引用。"""
+        depth = 0
+        while True:
+            kind = type(event)
+            if kind is SequenceEndEvent or kind is MappingEndEvent:
+                depth -= 1
+            elif kind is not AliasEvent and event.anchor is not None:
+                self.compose(event)
+            elif kind is SequenceStartEvent or kind is MappingStartEvent:
+                depth += 1
+            if depth == 0:
+                return
+            event = self.next()
+
+    def construct(self, node):
+        return self.constructor.construct_document(node)
+
+    def items(self, event, spec):
+        """从列表的第一个子事件开始，逐个组装、筛选、构造条目，直到列表结束。"""
+        while not isinstance(event, SequenceEndEvent):
+            node = self.compose(event)
+            if not spec or _keeps(node, spec):
+                yield self.construct(node)
+            event = self.next()
+
+    # ----- 顶层遍历 -----
+    def walk(self, allow_list=True, spec=None):
+        """
+        产出 proxies 条目；每找到一个 proxies 列表先产出 True，便于区分“空列表”和“没有”。
+        顶层有重复的 proxies 键时 safe_load 以最后一个为准，这里依次产出，由 load_proxies 处理。
+        顶层的列表 / 映射键（safe_load 会报错）连同它的值一起跳过，不影响后面的 proxies。
+        """
+        event = self.next()             # StreamStartEvent
+        event = self.next()
+        if isinstance(event, StreamEndEvent):
+            return
+        root = self.next()              # DocumentStartEvent 之后的根节点
+        if isinstance(root, SequenceStartEvent) and allow_list:
+            yield True
+            yield from self.items(self.next(), spec)
+        elif isinstance(root, MappingStartEvent):
+            found = False
+            key = self.next()
+            while not isinstance(key, MappingEndEvent):
+                if not isinstance(key, (ScalarEvent, AliasEvent)):
+                    # 复杂键（? [a, b]）占多个事件，先整个跳过再读值；safe_load 会报 unhashable key，这里只当作无关的键
+                    self.skip(key)
+                    self.skip(self.next())
+                    key = self.next()
+                    continue
+                value = self.next()
+                if isinstance(key, ScalarEvent) and key.value == PROXIES_KEY and isinstance(value, SequenceStartEvent):
+                    found = True
+                    yield True
+                    if value.anchor is not None:
+                        for proxy in self.construct(self.compose(value)):
+                            if not spec or not isinstance(proxy, dict) or spec.accepts(proxy):
+                                yield proxy
+                    else:
+                        yield from self.items(self.next(), spec)
+                else:
+                    if isinstance(key, ScalarEvent) and key.value == PROXIES_KEY and found:
+                        yield _RESTART
+                        found = False
+                    self.skip(key)
+                    self.skip(value)
+                key = self.next()
+        else:
+            self.skip(root)
+        self.next()                     # DocumentEndEvent
+        event = self.next()
+        if isinstance(event, DocumentStartEvent):
+            raise ComposerError("expected a single document in the stream", None,
+                                "but found another document", event.start_mark)
+
+
+def _keeps(node, spec):
+    """
+    构造之前看节点的 type / cipher 标量是否保留；有合并键（<<）等看不清的写法一律保留，
+    交给后面的 is_valid_proxy 等校验。重复的键与 safe_load 一样以最后一个为准。
+    """
+    if not isinstance(node, MappingNode):
+        return True
+    fields = {}
+    for key, value in node.value:
+        if not isinstance(key, ScalarNode):
+            continue
+        if key.value == '<<':
+            return True
+        if key.value in ('type', 'cipher'):
+            fields[key.value] = value.value if isinstance(value, ScalarNode) else None
+    node_type = fields.get('type')
+    if node_type is None:
+        return True
+    if not spec.keeps_type(node_type):
+        return False
+    if node_type.strip().lower() == 'ss' and 'cipher' in fields:
+        cipher = fields['cipher']
+        return cipher is None or spec.keeps_cipher(cipher)
+    return True
+
+
+def _walk(stream, allow_list, spec=None):
+    """
+    依次产出 walk() 的结果。libyaml 对少数写法比纯 Python 版严格，
+    C 解析器报错时用纯 Python 解析器从头再走一遍，跳过已经产出过的部分。
+    """
+    if hasattr(stream, 'read'):
+        stream = stream.read()
+    produced = 0
+    loaders = [_Loader] if _Loader is yaml.SafeLoader else [_Loader, yaml.SafeLoader]
+    for index, loader in enumerate(loaders):
+        walker = _Walker(stream, loader)
+        try:
+            for position, item in enumerate(walker.walk(allow_list, spec)):
+                if position >= produced:
+                    produced += 1
+                    yield item
+            return
+        except yaml.YAMLError:
+            if index == len(loaders) - 1:
+                raise
+        finally:
+            walker.loader.dispose()
+
+
+def iter_proxies(stream, allow_list=True, spec=None):
+    """
+    逐个产出顶层 proxies 列表里的节点（原样的 dict；除 spec 的筛选外不做校验）。
+    allow_list=True 时，整个文档就是一个列表也按节点列表处理（与 parse_proxies_from_content 一致）。
+    YAML 格式错误时抛出 yaml.YAMLError（可能已经产出了一部分节点）。
+    """
+    for item in _walk(stream, allow_list, spec):
+        if item is not True and item is not _RESTART:
+            yield item
+
+
+def load_proxies(stream, allow_list=True, spec=None):
+    """读取完整文档后返回 proxies 列表；文档里没有 proxies 列表时返回 None。"""
+    proxies = None
+    for item in _walk(stream, allow_list, spec):
+        if item is True:
+            proxies = []
+        elif item is _RESTART:
+            proxies = None
+        else:
+            proxies.append(item)
+    return proxies
@@ -8,16 +8,18 @@
 - 智能清洗节点名，对未匹配节点保留并使用清洗后名称
 """
 
-import requests
-import yaml
 from datetime import datetime
 import sys
 import os
-import hashlib
 import re
 from collections import defaultdict
 import pycountry
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TelegramNode'))
+from nodelib import http_client, yaml_io, yaml_stream
+from nodelib.fingerprint import NodeIndex
+from nodelib.names import NameAllocator
+
 # ========== 基础配置 ==========
 SUBSCRIPTION_URLS = [
     "https://substore.panell.top/share/file/%E4%B8%91%E5%9B%A21?token=ChouLink1",
@@ -168,34 +170,23 @@ COUNTRY_RULES = build_country_rules()
 
 def download_subscription(url):
     try:
-        headers = {'User-Agent': 'Clash/1.11.4 (Windows; x64)'}
         print(f"  下载: {url[:60]}...")
-        response = requests.get(url, timeout=30, headers=headers)
+        response = http_client.get(url, user_agent='Clash/1.11.4 (Windows; x64)', timeout=30)
         response.raise_for_status()
-        data = yaml.safe_load(response.text)
-        if isinstance(data, dict) and 'proxies' in data: return data
+        proxies = yaml_stream.load_proxies(response.text, allow_list=False)  # 只构造 proxies 部分
+        if proxies is not None: return {'proxies': proxies}
     except Exception as e: print(f"  ✗ 下载或解析失败: {e}")
     return None
 
-def get_proxy_key(proxy):
-    try:
-        server = proxy.get('server', '')
-        port = proxy.get('port', 0)
-        password = proxy.get('password', '') or proxy.get('uuid', '')
-        return hashlib.md5(f"{server}:{port}|{password}".encode('utf-8')).hexdigest()
-    except Exception: return None
-
 def merge_and_deduplicate_proxies(subscriptions):
-    unique_proxies = {}
+    unique_proxies = NodeIndex()  # 按协议规范化的节点指纹去重（nodelib.fingerprint）
     for sub in subscriptions:
         proxies_in_sub = sub.get('proxies', [])
         if not isinstance(proxies_in_sub, list): continue
         for proxy in proxies_in_sub:
             if not isinstance(proxy, dict) or 'name' not in proxy: continue
-            proxy_key = get_proxy_key(proxy)
-            if proxy_key and proxy_key not in unique_proxies:
-                unique_proxies[proxy_key] = proxy
-    return list(unique_proxies.values())
+            unique_proxies.add(proxy)
+    return unique_proxies.nodes()
 
 def process_and_rename_proxies(proxies):
     print(f"\n[3/4] 开始排序和重命名节点...")
@@ -238,16 +229,9 @@ def process_and_rename_proxies(proxies):
         del proxy['_display_name'], proxy['_region_sort_index']
 
     final_proxies = []
-    seen_names = set()
+    names = NameAllocator('{base} ({n})', start=2)
     for proxy in proxies:
-        base_name = proxy['name']
-        final_name = base_name
-        counter = 2
-        while final_name in seen_names:
-            final_name = f"{base_name} ({counter})"
-            counter += 1
-        proxy['name'] = final_name
-        seen_names.add(final_name)
+        proxy['name'] = names.allocate(proxy['name'])
         final_proxies.append(proxy)
         
     print(f"  ✓ 已完成最终命名和冲突检查。总计: {len(final_proxies)} 个。")
@@ -298,7 +282,7 @@ def main():
     if not config: sys.exit("\n❌ 错误: 无法生成配置文件。")
     
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, allow_unicode=True, sort_keys=False, indent=2, default_flow_style=False)
+        yaml_io.dump(config, f, allow_unicode=True, sort_keys=False, indent=2, default_flow_style=False)
     
     print(f"  ✓ 配置文件已成功保存至: {OUTPUT_FILE}")
     print("\n✅ 任务完成！")
@@ -4,7 +4,14 @@
 import os
 import sys
 import subprocess
-import yaml
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TelegramNode'))
+from nodelib import yaml_io
+from nodelib.deadline import Deadline
+
+TIMED_OUT = -2
 
 def filter_delay_greater_than_zero(yaml_path):
     if not os.path.isfile(yaml_path):
@@ -12,7 +19,7 @@ def filter_delay_greater_than_zero(yaml_path):
         return False
 
     with open(yaml_path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+        data = yaml_io.safe_load(f)
 
     if not data or 'proxies' not in data:
         print("yaml 文件格式异常或无 proxies 字段")
@@ -35,23 +42,38 @@ def filter_delay_greater_than_zero(yaml_path):
         return False
 
     with open(yaml_path, 'w', encoding='utf-8') as f:
-        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False)
+        yaml_io.safe_dump(data, f, allow_unicode=True, sort_keys=False)
 
     print(f"过滤完成，延迟大于0ms的节点数: {len(filtered_proxies)}，结果保存至 {yaml_path}")
     return True
 
 def run_clash_speedtest_with_realtime_log(cmd, timeout=600):
+    """
+    实时打印测速日志。超时由定时器强制结束进程：
+    逐行读取 stdout 会一直阻塞到进程退出，proc.wait(timeout) 根本等不到生效。
+    超时返回 TIMED_OUT。
+    """
     try:
         with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True) as proc:
-            for line in proc.stdout:
-                print(line.rstrip())
-
-            proc.wait(timeout=timeout)
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(timeout, kill)
+            timer.daemon = True
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    print(line.rstrip())
+                proc.wait()
+            finally:
+                timer.cancel()
+            if timed_out.is_set():
+                print(f"测速进程超过 {timeout:.0f} 秒，已强制结束")
+                return TIMED_OUT
             return proc.returncode
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        print("测速进程超时退出")
-        return -1
     except Exception as e:
         print(f"测速异常: {e}")
         return -1
@@ -79,10 +101,15 @@ def main():
         "-concurrent", "8",
     ]
 
-    print(f"执行命令: {' '.join(cmd)}")
-    return_code = run_clash_speedtest_with_realtime_log(cmd, timeout=600)
+    # 默认最多 600 秒；设置了 RUN_DEADLINE_MINUTES 时不超过剩余时间预算
+    timeout = Deadline.from_env().timeout(600)
+    print(f"执行命令: {' '.join(cmd)} (超时 {timeout:.0f}s)")
+    started = time.time()
+    return_code = run_clash_speedtest_with_realtime_log(cmd, timeout=timeout)
 
-    if return_code != 0:
+    if return_code == TIMED_OUT and os.path.isfile(output_path) and os.path.getmtime(output_path) >= started:
+        print("测速超时，使用已写出的部分结果继续过滤")
+    elif return_code != 0:
         print(f"测速失败，返回码: {return_code}")
         sys.exit(1)
 
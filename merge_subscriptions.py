@@ -5,11 +5,15 @@ Clash 订阅合并脚本 - GitHub Actions 版本
 自动下载订阅，合并节点，生成配置文件
 """
 
-import requests
-import yaml
+import os
 from datetime import datetime
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TelegramNode'))
+from nodelib import http_client, yaml_io, yaml_stream
+from nodelib.fingerprint import NodeIndex
+from nodelib.names import NameAllocator
+
 # ========== 订阅配置 ==========
 SUBSCRIPTION_URLS = [
     "https://substore.panell.top/share/file/%E4%B8%91%E5%9B%A21?token=ChouLink1",
@@ -24,33 +28,29 @@ def download_subscription(url):
     """下载订阅"""
     try:
         print(f"  下载: {url[:50]}...")
-        response = requests.get(url, timeout=30)
+        response = http_client.get(url, timeout=30)
         response.raise_for_status()
-        return yaml.safe_load(response.text)
+        # 只取 proxies，订阅里的规则、策略组等不构造对象
+        proxies = yaml_stream.load_proxies(response.text, allow_list=False)
+        return {'proxies': proxies} if proxies is not None else None
     except Exception as e:
         print(f"  ✗ 失败: {e}")
         return None
 
 def merge_proxies(subscriptions):
-    """合并节点并去重"""
+    """合并节点并去重（按 nodelib.fingerprint 的节点指纹，同一节点只保留先出现的一个）"""
     all_proxies = []
-    seen_names = set()
+    names = NameAllocator()  # 重名时依次加 -1、-2 ...
+    index = NodeIndex()
     
     for sub in subscriptions:
         if not sub or 'proxies' not in sub:
             continue
             
         for proxy in sub['proxies']:
-            original_name = proxy['name']
-            name = original_name
-            counter = 1
-            
-            while name in seen_names:
-                name = f"{original_name}-{counter}"
-                counter += 1
-            
-            proxy['name'] = name
-            seen_names.add(name)
+            if not isinstance(proxy, dict) or 'name' not in proxy or not index.add(proxy):
+                continue
+            proxy['name'] = names.allocate(proxy['name'])
             all_proxies.append(proxy)
     
     return all_proxies
@@ -167,7 +167,7 @@ def main():
     config = generate_config(proxies)
     
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, allow_unicode=True, sort_keys=False)
+        yaml_io.dump(config, f, allow_unicode=True, sort_keys=False)
     
     print(f"  ✓ 已保存: {OUTPUT_FILE}")
     print("\n" + "=" * 60)